@@ -0,0 +1,132 @@
+"""
+Light color updates across several backends.
+
+    python -m benchmarks.backendsBench [--updates N] [--pironman-delay SECONDS] [--device-delay SECONDS]
+
+A Pironman 5 dashboard stand-in (an HTTP server answering after
+--pironman-delay seconds) and the MQTT broker stand-in are driven with the
+same sequence of artwork colors, every color sent twice in a row as happens
+when a track repeats its artwork:
+
+    sequential   ControlLights then the old Pironman5 code (two fresh
+                 connections per color, no timeout), one after the other
+    LightGroup   ControlLights and the pooled Pironman5 in parallel
+
+Reports the per-update latency, the HTTP requests and TCP connections the
+dashboard saw and how many repeated colors were skipped.
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import threading
+import time
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.fakeBroker import FakeBroker
+from utils.controlLights import ControlLights
+from utils.lightBackends import LightGroup
+from utils.pironman5 import Pironman5
+
+class FakePironman:
+    """Answers the dashboard's set-rgb-* endpoints after delay seconds, counting requests and connections"""
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.requests = []
+        self.connections = set()
+        bench = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out as separate writes, without this they wait on a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                bench.requests.append(self.path)
+                bench.connections.add(self.client_address)
+                time.sleep(bench.delay)
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/api/v1.0/"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def reset(self):
+        self.requests.clear()
+        self.connections.clear()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+def legacy_pironman(url, rgb):
+    """The original Pironman5.set_rgb_color: two posts, each on a new connection, no timeout"""
+    headers = {"Content-Type": "application/json"}
+    color = '#%02x%02x%02x' % tuple(rgb)
+    requests.post(f"{url}/set-rgb-enable", json={"enable": True}, headers=headers)
+    requests.post(f"{url}/set-rgb-color", json={"color": color}, headers=headers)
+
+def colors(n):
+    out = []
+    for i in range(n):
+        rgb = (40 + i * 37 % 200, 200 - i * 23 % 150, 60 + i * 11 % 180)
+        out += [rgb, rgb]
+    return out
+
+def report(name, ms, requests_seen, connections, skipped):
+    ms = sorted(ms)
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    print(f"{name:>12}: p50 {statistics.median(ms):7.1f} ms  p99 {p99:7.1f} ms  total {sum(ms):7.0f} ms, "
+          f"dashboard saw {requests_seen} requests on {connections} connections, {skipped} repeats skipped")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20, help="distinct colors, each sent twice")
+    parser.add_argument("--pironman-delay", type=float, default=0.05)
+    parser.add_argument("--device-delay", type=float, default=0.02, help="simulated zigbee report delay")
+    args = parser.parse_args()
+
+    pironman = FakePironman(args.pironman_delay)
+    sequence = colors(args.updates)
+    with FakeBroker(device_delay=args.device_delay) as broker, contextlib.redirect_stdout(io.StringIO()):
+        config = {"mqttUsername": "bench", "mqttPassword": "bench", "mqttURL": broker.host, "mqttPort": broker.port}
+        zigbee = ControlLights(rgb=(0, 0, 0), mqttConfig=config)
+        assert zigbee.connect(), "could not connect to broker stand-in"
+
+        sequential = []
+        for rgb in sequence:
+            start = time.perf_counter()
+            zigbee.set_color(rgb)
+            legacy_pironman(pironman.url.rstrip("/"), rgb)
+            sequential.append((time.perf_counter() - start) * 1000)
+        legacy_requests, legacy_connections = len(pironman.requests), len(pironman.connections)
+
+        pironman.reset()
+        group = LightGroup([zigbee, Pironman5(url=pironman.url, timeout=2.0)])
+        parallel = []
+        for rgb in sequence:
+            start = time.perf_counter()
+            group.set_color(rgb)
+            parallel.append((time.perf_counter() - start) * 1000)
+        stats = {backend.name: backend.stats() for backend in group.backends}
+        group.close()
+    pironman_stats = stats["pironman"]
+
+    print(f"{len(sequence)} color updates ({args.updates} colors, each twice), dashboard answers in "
+          f"{args.pironman_delay * 1000:.0f} ms:")
+    report("sequential", sequential, legacy_requests, legacy_connections, 0)
+    report("LightGroup", parallel, len(pironman.requests), len(pironman.connections),
+           pironman_stats["skipped_unchanged"])
+    print(f"pironman backend: {pironman_stats}")
+    pironman.close()
+
+if __name__ == "__main__":
+    main()
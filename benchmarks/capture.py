@@ -0,0 +1,57 @@
+"""
+Helpers for building and loading shairport-sync metadata captures.
+
+A capture is the raw byte stream shairport-sync writes to its metadata pipe,
+e.g. recorded with `cat /tmp/shairport-sync-metadata > session.xml`.
+"""
+import base64
+import io
+import numpy as np
+from PIL import Image
+
+def encode_item(typ, code, payload=b"", wrap=None):
+    """Encode one item the way shairport-sync writes it to the pipe"""
+    header = f"<item><type>{typ.encode().hex()}</type><code>{code.encode().hex()}</code><length>{len(payload)}</length>"
+    if not payload:
+        return f"{header}</item>\n".encode()
+    b64 = base64.b64encode(payload)
+    if wrap:
+        b64 = b"\n".join(b64[i:i + wrap] for i in range(0, len(b64), wrap))
+    return f'{header}\n<data encoding="base64">\n'.encode() + b64 + b"</data></item>\n"
+
+def make_cover(size=600, fmt="JPEG", seed=0):
+    """Synthetic album cover: a few color blocks plus noise so it compresses like real art"""
+    rng = np.random.default_rng(seed)
+    palette = rng.integers(0, 256, size=(5, 3))
+    blocks = rng.integers(0, len(palette), size=(8, 8))
+    img = palette[blocks].repeat(-(-size // 8), axis=0).repeat(-(-size // 8), axis=1)[:size, :size]
+    img = np.clip(img + rng.normal(0, 12, img.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(img).save(buf, format=fmt)
+    return buf.getvalue()
+
+def track_items(album, cover, progress_updates=3, wrap=None):
+    """Items for one track: metadata, artwork, playback start and progress"""
+    items = [
+        encode_item("ssnc", "mdst", b"1"),
+        encode_item("core", "asal", album.encode()),
+        encode_item("core", "asar", b"Artist"),
+        encode_item("core", "minm", f"{album} track".encode()),
+        encode_item("ssnc", "mden", b"1"),
+        encode_item("ssnc", "PICT", cover, wrap=wrap),
+        encode_item("ssnc", "pbeg"),
+    ]
+    items += [encode_item("ssnc", "prgr", b"1/2/3")] * progress_updates
+    return items
+
+def synthetic_capture(tracks=20, cover_size=600, fmt="JPEG", wrap=None):
+    """A whole session of distinct tracks ending with a stream reset"""
+    out = []
+    for i in range(tracks):
+        out += track_items(f"Album {i}", make_cover(cover_size, fmt, seed=i), wrap=wrap)
+    out.append(encode_item("ssnc", "pend"))
+    return b"".join(out)
+
+def load_capture(path):
+    with open(path, "rb") as f:
+        return f.read()
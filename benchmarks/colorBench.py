@@ -0,0 +1,106 @@
+"""
+Check utils.colorTransform against the PIL ImageEnhance chain it replaced.
+
+    python -m benchmarks.colorBench [COVER_DIR] [--tolerance N] [--repeat N]
+
+Every image in COVER_DIR (or synthetic covers when omitted) is loaded at
+each matrix resolution and enhanced both ways: the original
+Color(1.5) -> Brightness(0.4) -> Contrast(1.5) chain and the lookup-table
+transform, with every combination of enhance_image's three steps turned on
+or off. Reports the largest per-channel difference, the share of channels
+that differ and the time per image for the full chain, and exits non-zero
+if any combination differs by more than --tolerance (default 0, the
+transform is exact). A few LED gamma curves are timed too.
+"""
+import argparse
+import io
+import itertools
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image, ImageEnhance
+from utils.colorTransform import get_transform
+from benchmarks.capture import make_cover
+
+SIZES = [(32, 32), (64, 64), (128, 32)]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# (increaseSaturation, reduceBrightness, increaseContrast) as enhance_image takes them
+STEPS = list(itertools.product((True, False), repeat=3))
+
+def pil_enhance(img, saturation=True, brightness=True, contrast=True):
+    """The original enhance_image chain, up to three full PIL passes"""
+    if saturation:
+        img = ImageEnhance.Color(img).enhance(1.5)
+    if brightness:
+        img = ImageEnhance.Brightness(img).enhance(0.4)
+    if contrast:
+        img = ImageEnhance.Contrast(img).enhance(1.5)
+    return np.array(img)
+
+def step_transform(saturation, brightness, contrast):
+    """The transform enhance_image builds for these steps"""
+    return get_transform(saturation=1.5 if saturation else 1.0, brightness=0.4 if brightness else 1.0,
+                         contrast=1.5 if contrast else 1.0)
+
+def corpus(path, count=20):
+    if path:
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield name, Image.open(os.path.join(path, name)).convert("RGB")
+    else:
+        for i in range(count):
+            yield f"synthetic-{i:02d}", Image.open(io.BytesIO(make_cover(600, seed=i))).convert("RGB")
+
+def per_image_us(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cover_dir", nargs="?")
+    parser.add_argument("--tolerance", type=int, default=0, help="max per-channel difference allowed")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    images = list(corpus(args.cover_dir))
+    transform = get_transform()
+    failed = False
+    print(f"{'size':>8}{'images':>8}{'max diff':>10}{'differ %':>10}{'PIL us':>10}{'LUT us':>10}")
+    for width, height in SIZES:
+        worst, differ, pil_us, lut_us = 0, [], 0.0, 0.0
+        for name, img in images:
+            small = img.resize((width, height), Image.LANCZOS)
+            np_small = np.array(small)
+            for steps in STEPS:
+                diff = np.abs(pil_enhance(small, *steps).astype(np.int16) - step_transform(*steps).apply(np_small))
+                worst = max(worst, int(diff.max()))
+                if all(steps):
+                    differ.append((diff > 0).mean())
+                if diff.max() > args.tolerance:
+                    print(f"{name} at {width}x{height}, steps {steps}: max difference {diff.max()}")
+                    failed = True
+            pil_us += per_image_us(lambda: pil_enhance(small), args.repeat)
+            lut_us += per_image_us(lambda: transform.apply(np_small), args.repeat)
+        n = len(images)
+        print(f"{width}x{height:<4}{n:>8}{worst:>10}{np.mean(differ) * 100:>10.2f}{pil_us / n:>10.1f}{lut_us / n:>10.1f}")
+
+    np_img = np.array(images[0][1].resize((32, 32), Image.LANCZOS))
+    for gamma in (1.0, 1.8, 2.2):
+        start = time.perf_counter()
+        t = get_transform(gamma=gamma)
+        build_ms = (time.perf_counter() - start) * 1000
+        out = t.apply(np_img)
+        print(f"gamma {gamma}: tables built in {build_ms:.2f} ms, {per_image_us(lambda: t.apply(np_img), args.repeat):.1f} us"
+              f" per 32x32 image, mean level {out.mean():.1f}")
+
+    if failed:
+        sys.exit(1)
+    print(f"lookup-table transform within {args.tolerance} of the PIL chain everywhere, "
+          f"for all {len(STEPS)} step combinations")
+
+if __name__ == "__main__":
+    main()
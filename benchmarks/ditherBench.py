@@ -0,0 +1,72 @@
+"""
+Compare the dither modes in utils.ditherEngine at the matrix resolutions.
+
+    python -m benchmarks.ditherBench [--repeat N]
+
+The original per-pixel Floyd–Steinberg loop is kept here as a reference so the
+benchmark can confirm the engine still produces byte-identical output.
+"""
+import argparse
+import time
+import numpy as np
+from utils import ditherEngine
+
+SIZES = [(32, 32), (64, 64), (128, 128)]
+
+def reference_floyd_steinberg(img_np, color_depth_bits=5):
+    """Original per-pixel implementation from ImageProcessor"""
+    height, width, _ = img_np.shape
+    out = img_np.astype(np.float32)
+
+    max_val = 2**color_depth_bits - 1
+
+    def quantize(val):
+        return round(val * max_val / 255) * (255 / max_val)
+
+    for y in range(height):
+        for x in range(width):
+            old_pixel = out[y, x].copy()
+            new_pixel = np.array([quantize(c) for c in old_pixel])
+            out[y, x] = new_pixel
+            quant_error = old_pixel - new_pixel
+
+            if x + 1 < width:
+                out[y, x + 1] += quant_error * 7 / 16
+            if y + 1 < height:
+                if x > 0:
+                    out[y + 1, x - 1] += quant_error * 3 / 16
+                out[y + 1, x] += quant_error * 5 / 16
+                if x + 1 < width:
+                    out[y + 1, x + 1] += quant_error * 1 / 16
+
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+def time_call(fn, img, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(img)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-reference", action="store_true", help="don't time the original per-pixel loop")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>9} {'mode':>16} {'best ms':>10}")
+    for width, height in SIZES:
+        img = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        if not args.skip_reference:
+            ref = reference_floyd_steinberg(img)
+            assert np.array_equal(ref, ditherEngine.floyd_steinberg(img)), "floyd-steinberg output differs from reference"
+            ms = time_call(reference_floyd_steinberg, img, 1)
+            print(f"{width:>4}x{height:<4} {'reference':>16} {ms:>10.2f}")
+        for mode in ditherEngine.DITHER_MODES:
+            ms = time_call(lambda i: ditherEngine.dither(i, mode), img, args.repeat)
+            print(f"{width:>4}x{height:<4} {mode:>16} {ms:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+In-process MQTT 3.1.1 broker stand-in for benchmarks.
+
+Supports what ControlLights needs: CONNECT, SUBSCRIBE with + and #
+wildcards, QoS 0/1 PUBLISH, PINGREQ and DISCONNECT. With
+emulate_zigbee2mqtt it also answers zigbee2mqtt/<device>/set and /get
+the way Zigbee2MQTT does, by publishing the device state on
+zigbee2mqtt/<device>.
+"""
+import json
+import socket
+import struct
+import threading
+import time
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+def topic_matches(pattern, topic):
+    p_parts = pattern.split("/")
+    t_parts = topic.split("/")
+    for i, p in enumerate(p_parts):
+        if p == "#":
+            return True
+        if i >= len(t_parts) or (p != "+" and p != t_parts[i]):
+            return False
+    return len(p_parts) == len(t_parts)
+
+def _encode_length(n):
+    out = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+def _packet(ptype, body, flags=0):
+    return bytes([(ptype << 4) | flags]) + _encode_length(len(body)) + body
+
+def _string(s):
+    data = s.encode()
+    return struct.pack("!H", len(data)) + data
+
+class _Connection:
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def send(self, data):
+        with self.lock:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                pass
+
+    def _recv_exact(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("client closed")
+            buf += chunk
+        return bytes(buf)
+
+    def _read_packet(self):
+        header = self._recv_exact(1)[0]
+        length, shift = 0, 0
+        while True:
+            byte = self._recv_exact(1)[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header >> 4, header & 0x0F, self._recv_exact(length) if length else b""
+
+    def serve(self):
+        try:
+            while True:
+                ptype, flags, body = self._read_packet()
+                if ptype == CONNECT:
+                    self.send(_packet(CONNACK, b"\x00\x00"))
+                elif ptype == SUBSCRIBE:
+                    packet_id = body[:2]
+                    pos, granted = 2, bytearray()
+                    while pos < len(body):
+                        (n,) = struct.unpack("!H", body[pos:pos + 2])
+                        self.subscriptions.add(body[pos + 2:pos + 2 + n].decode())
+                        granted.append(min(body[pos + 2 + n], 1))
+                        pos += 3 + n
+                    self.send(_packet(SUBACK, packet_id + bytes(granted)))
+                elif ptype == UNSUBSCRIBE:
+                    self.send(_packet(UNSUBACK, body[:2]))
+                elif ptype == PUBLISH:
+                    qos = (flags >> 1) & 0x03
+                    (n,) = struct.unpack("!H", body[:2])
+                    topic = body[2:2 + n].decode()
+                    pos = 2 + n
+                    if qos:
+                        self.send(_packet(PUBACK, body[pos:pos + 2]))
+                        pos += 2
+                    self.broker.route(topic, body[pos:])
+                elif ptype == PINGREQ:
+                    self.send(_packet(PINGRESP, b""))
+                elif ptype == DISCONNECT:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.broker._drop(self)
+            self.sock.close()
+
+class FakeBroker:
+    def __init__(self, host="127.0.0.1", port=0, emulate_zigbee2mqtt=True, device_delay=0.0):
+        self.emulate_zigbee2mqtt = emulate_zigbee2mqtt
+        self.device_delay = device_delay    # simulated mesh latency before a state report
+        self.device_state = {}              # device -> state dict, like zigbee2mqtt keeps
+        self.published = []                 # (monotonic time, topic, payload) of every client publish
+        self._connections = []
+        self._lock = threading.Lock()
+        self._server = socket.create_server((host, port))
+        self.host, self.port = self._server.getsockname()[:2]
+        self._thread = threading.Thread(target=self._accept, name="fake-broker", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.close()
+        with self._lock:
+            conns = list(self._connections)
+        for conn in conns:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            conn = _Connection(self, sock)
+            with self._lock:
+                self._connections.append(conn)
+            threading.Thread(target=conn.serve, daemon=True).start()
+
+    def _drop(self, conn):
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+
+    def publish(self, topic, payload):
+        """Deliver a message to every matching subscriber"""
+        packet = _packet(PUBLISH, _string(topic) + payload)
+        with self._lock:
+            conns = list(self._connections)
+        for conn in conns:
+            if any(topic_matches(p, topic) for p in conn.subscriptions):
+                conn.send(packet)
+
+    def route(self, topic, payload):
+        with self._lock:
+            self.published.append((time.monotonic(), topic, payload))
+        self.publish(topic, payload)
+        if self.emulate_zigbee2mqtt:
+            self._zigbee2mqtt(topic, payload)
+
+    def _zigbee2mqtt(self, topic, payload):
+        parts = topic.split("/")
+        if len(parts) != 3 or parts[0] != "zigbee2mqtt" or parts[2] not in ("set", "get"):
+            return
+        device = parts[1]
+        state = self.device_state.setdefault(device, {"state": "OFF", "brightness": 128, "color_temp": 300})
+        if parts[2] == "set":
+            try:
+                state.update(json.loads(payload))
+            except ValueError:
+                return
+        report = json.dumps(state).encode()
+        if self.device_delay:
+            threading.Timer(self.device_delay, self.publish, (f"zigbee2mqtt/{device}", report)).start()
+        else:
+            self.publish(f"zigbee2mqtt/{device}", report)
@@ -0,0 +1,99 @@
+"""
+Artwork fan-out to several matrix displays.
+
+    python -m benchmarks.fanoutBench [--covers N] [--gap-ms MS]
+
+Runs shairport-metadata.py's setup() with five --display targets:
+
+    desk      matrix32 on a local FrameReceiver
+    shelf     matrix32 too, shares desk's render
+    wall      matrix64 delta frames
+    slow      matrix32 on a receiver that reads 1 KB every 20 ms
+    offline   matrix32 on a closed port
+
+and submits covers straight to the pipeline. Each profile must be rendered
+once per cover however many displays use it, and the slow and offline
+panels must not delay the others. Reports per-target delivery counts,
+PICT-to-display latency and the transports' failure/reconnect counters.
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import socket
+import statistics
+import time
+from collections import Counter
+from benchmarks.capture import make_cover
+from benchmarks.fakeBroker import FakeBroker
+from benchmarks.profileBench import FrameReceiver
+from benchmarks.replayBench import load_main
+from utils.outputProfiles import PROFILES
+
+def closed_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--covers", type=int, default=8)
+    parser.add_argument("--gap-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    receivers = {
+        "desk": FrameReceiver(PROFILES["matrix32"]),
+        "shelf": FrameReceiver(PROFILES["matrix32"]),
+        "wall": FrameReceiver(PROFILES["matrix64"]),
+        "slow": FrameReceiver(PROFILES["matrix32"], read_delay=0.02),
+    }
+    specs = [f"{name}=127.0.0.1:{r.port}/{r.profile.name}" for name, r in receivers.items()]
+    specs.append(f"offline=127.0.0.1:{closed_port()}/matrix32")
+
+    covers = [make_cover(600, seed=i) for i in range(args.covers)]
+    renders = Counter()
+    created = []
+    with FakeBroker() as broker, contextlib.redirect_stdout(io.StringIO()):
+        main = load_main()
+        original_render = main.render_artwork
+
+        def counted_render(data, profile=None):
+            renders[profile.name] += 1
+            return original_render(data, profile)
+        main.render_artwork = counted_render
+
+        argv = ["--mqtt-host", broker.host, "--mqtt-port", str(broker.port)]
+        for spec in specs:
+            argv += ["--display", spec]
+        main.setup(main.parse_args(argv))
+        main.render_pool.start()
+        zone = main.zones[0]
+        zone.pipeline.start()
+        for cover in covers:
+            created.append(time.monotonic())
+            zone.pipeline.submit({"hash": hashlib.md5(cover).hexdigest(), "name": "bench.jpg",
+                                  "data": cover, "created": created[-1]})
+            time.sleep(args.gap_ms / 1000)
+        time.sleep(1.0)
+        stats = zone.matrix.stats()
+        for zone in main.zones:
+            zone.close()
+        main.render_pool.close()
+    for r in receivers.values():
+        r.close()
+
+    print(f"renders per profile for {args.covers} covers: {dict(renders)}")
+    print(f"{'target':<9}{'profile':<10}{'frames':>7}{'p50 ms':>9}{'max ms':>9}{'failures':>9}{'reconnects':>11}")
+    for target in zone.matrix.targets:
+        r = receivers.get(target.name)
+        latencies = [(t - c) * 1000 for t, c in zip(r.times, created)] if r else []
+        s = stats[target.name]
+        p50 = f"{statistics.median(latencies):9.1f}" if latencies else f"{'-':>9}"
+        worst = f"{max(latencies):9.1f}" if latencies else f"{'-':>9}"
+        print(f"{target.name:<9}{target.profile.name:<10}{len(r.frames) if r else 0:>7}{p50}{worst}"
+              f"{s['send_failures']:>9}{s['reconnects']:>11}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+ControlLights against the in-process broker stand-in.
+
+    python -m benchmarks.lightsBench [--iterations N] [--device-delay SECONDS] [--skips N] [--skip-gap SECONDS]
+
+Times publish_commands() and snapshot_states() on the persistent session
+against a connect-per-call client like the one ControlLights used before,
+and checks that the curr_state mirror tracks what the devices report.
+
+It then replays a burst of rapid track skips, a stream reset right before
+the next track and a repeated color, once with plain publishes and once
+through LightScheduler. It compares the /set commands that reach the mesh,
+the peak per-device rate and whether every bulb ends on the last color.
+
+Last, with slow state reports, it checks that a color sent again right
+after another one (red, blue, red) isn't skipped because the mirror still
+shows the first red, and that bulbs which were off are off again after
+track, stop, track, stop: the second snapshot is taken while the first
+restore is still on its way and must not record the artwork color, and
+that a color whose publish failed is sent again when it is asked for once
+more. Exits non-zero if any check fails.
+"""
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import sys
+import time
+import paho.mqtt.client as mqtt
+from collections import defaultdict
+from utils.controlLights import ControlLights
+from utils.lightScheduler import LightScheduler
+from benchmarks.fakeBroker import FakeBroker
+
+def legacy_publish(config, payload):
+    """connect / loop_start / publish / disconnect, as every call used to do"""
+    c = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    c.username_pw_set(config["mqttUsername"], config["mqttPassword"])
+    c.connect(config["mqttURL"], config["mqttPort"], 60)
+    c.loop_start()
+    infos = [c.publish(t, json.dumps(payload)) for t in config["topics"]]
+    for info in infos:
+        info.wait_for_publish()
+    c.loop_stop()
+    c.disconnect()
+
+def timings(fn, iterations):
+    out = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - start) * 1000)
+    return out
+
+def report(name, ms):
+    ms = sorted(ms)
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    print(f"{name:>28}: p50 {statistics.median(ms):7.2f} ms  p99 {p99:7.2f} ms  max {ms[-1]:7.2f} ms")
+
+def burst(lights, skips, gap):
+    """Rapid skips, a reset straight into the next track, then the same color again"""
+    lights.snapshot_states()
+    for i in range(skips):
+        lights.rgb = (40 + i * 9 % 200, 200 - i * 7 % 150, 90)
+        lights.publish_commands()
+        time.sleep(gap)
+    lights.restore_states()
+    lights.rgb = (12, 34, 200)
+    lights.publish_commands()
+    time.sleep(0.5)
+    lights.publish_commands()
+
+def peak_rate(sets, window=1.0):
+    """Most /set commands any single device got within one window"""
+    per_device = defaultdict(list)
+    for t, topic, _ in sets:
+        per_device[topic].append(t)
+    peak = 0
+    for times in per_device.values():
+        start = 0
+        for end, t in enumerate(times):
+            while t - times[start] > window:
+                start += 1
+            peak = max(peak, end - start + 1)
+    return peak
+
+def run_burst(config, broker, scheduled, skips, gap):
+    lights = ControlLights(rgb=(0, 0, 0), mqttConfig=config)
+    lights.enable_rgb = True
+    if scheduled:
+        lights.scheduler = LightScheduler(lights, lights.publish_all).start()
+    assert lights.connect(), "could not connect to broker stand-in"
+    mark = len(broker.published)
+    with contextlib.redirect_stdout(io.StringIO()):
+        burst(lights, skips, gap)
+        deadline = time.monotonic() + 5
+        while scheduled and lights.scheduler.stats()["queue_depth"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.3)
+    sets = [p for p in broker.published[mark:] if p[1].endswith("/set")]
+    last_color = {"r": 12, "g": 34, "b": 200}
+    settled = all(broker.device_state.get(dev, {}).get("color") == last_color for dev in lights.devices)
+    stats = lights.scheduler.stats() if scheduled else None
+    lights.close()
+    return len(sets), peak_rate(sets), settled, stats
+
+def run_aba(device_delay, gap=0.02):
+    """Red until the mirror has it, then blue and red again within a report delay; True if the bulbs end red"""
+    red, blue = (255, 0, 0), (0, 0, 255)
+    with FakeBroker(device_delay=device_delay) as broker:
+        config = {"mqttUsername": "bench", "mqttPassword": "bench", "mqttURL": broker.host, "mqttPort": broker.port}
+        lights = ControlLights(rgb=(0, 0, 0), mqttConfig=config)
+        lights.scheduler = LightScheduler(lights, lights.publish_all).start()
+        assert lights.connect(), "could not connect to broker stand-in"
+        with contextlib.redirect_stdout(io.StringIO()):
+            lights.snapshot_states()
+            lights.set_color(red)
+            time.sleep(device_delay + 1.0)
+            for rgb in (blue, red):
+                lights.set_color(rgb)
+                time.sleep(gap)
+            time.sleep(device_delay + 1.5)
+        ok = all(broker.device_state.get(dev, {}).get("color") == {"r": 255, "g": 0, "b": 0} for dev in lights.devices)
+        stats = lights.scheduler.stats()
+        lights.close()
+    return ok, stats
+
+def run_round_trip(device_delay, gap=0.05):
+    """Snapshot, artwork color, restore, twice in a row like track/stop/track/stop; True if the bulbs end off"""
+    with FakeBroker(device_delay=device_delay) as broker:
+        config = {"mqttUsername": "bench", "mqttPassword": "bench", "mqttURL": broker.host, "mqttPort": broker.port}
+        lights = ControlLights(rgb=(0, 0, 0), mqttConfig=config)
+        lights.scheduler = LightScheduler(lights, lights.publish_all).start()
+        assert lights.connect(), "could not connect to broker stand-in"
+        with contextlib.redirect_stdout(io.StringIO()):
+            for rgb in ((255, 0, 0), (0, 255, 0)):
+                lights.snapshot()
+                lights.set_color(rgb)
+                time.sleep(device_delay + 1.0)
+                lights.restore()
+                time.sleep(gap)
+            time.sleep(device_delay + 2.5)
+        ok = all(str(broker.device_state.get(dev, {}).get("state")).upper() == "OFF" for dev in lights.devices)
+        lights.close()
+    return ok
+
+def run_failed_publish(device_delay):
+    """Red while the first publish fails, then red again; True if the bulbs end red"""
+    with FakeBroker(device_delay=device_delay) as broker:
+        config = {"mqttUsername": "bench", "mqttPassword": "bench", "mqttURL": broker.host, "mqttPort": broker.port}
+        lights = ControlLights(rgb=(0, 0, 0), mqttConfig=config)
+        outcomes = [False]
+
+        def publish(batch):
+            # the first batch is lost like on a dropped session
+            return outcomes.pop() if outcomes else lights.publish_all(batch)
+        lights.scheduler = LightScheduler(lights, publish).start()
+        assert lights.connect(), "could not connect to broker stand-in"
+        with contextlib.redirect_stdout(io.StringIO()):
+            lights.snapshot_states()
+            for _ in range(2):
+                lights.set_color((255, 0, 0))
+                time.sleep(0.3)
+            time.sleep(device_delay + 1.0)
+        ok = all(broker.device_state.get(dev, {}).get("color") == {"r": 255, "g": 0, "b": 0} for dev in lights.devices)
+        lights.close()
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--device-delay", type=float, default=0.05, help="simulated zigbee report delay")
+    parser.add_argument("--skips", type=int, default=20)
+    parser.add_argument("--skip-gap", type=float, default=0.03, help="seconds between skipped tracks")
+    args = parser.parse_args()
+
+    with FakeBroker(device_delay=args.device_delay) as broker:
+        config = {
+            "mqttUsername": "bench",
+            "mqttPassword": "bench",
+            "mqttURL": broker.host,
+            "mqttPort": broker.port,
+        }
+        lights = ControlLights(rgb=(10, 20, 30), mqttConfig=config)
+        lights.enable_rgb = True
+        assert lights.connect(), "could not connect to broker stand-in"
+
+        quiet = contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            start = time.perf_counter()
+            lights.snapshot_states()
+            cold = (time.perf_counter() - start) * 1000
+            warm = timings(lights.snapshot_states, args.iterations)
+            persistent = timings(lights.publish_commands, args.iterations)
+            legacy = timings(lambda: legacy_publish(lights.mqttConfig, lights.format_rgb_phillips_hue(lights.rgb)), args.iterations)
+
+        print(f"{'snapshot_states (cold)':>28}: {cold:7.2f} ms")
+        report("snapshot_states (warm)", warm)
+        report("publish_commands", persistent)
+        report("connect-per-call publish", legacy)
+        print(f"session stats: {lights.stats()}")
+
+        # let the last state reports arrive, then compare the mirror
+        time.sleep(args.device_delay + 0.2)
+        mismatched = [dev for dev in lights.devices if lights.curr_state.get(dev) != broker.device_state.get(dev)]
+        lights.close()
+
+    if mismatched:
+        print(f"curr_state out of sync for: {mismatched}")
+        sys.exit(1)
+    print("curr_state mirror matches device state")
+
+    print(f"\nburst of {args.skips} skips {args.skip_gap * 1000:.0f} ms apart, reset, next track, repeated color:")
+    for scheduled in (False, True):
+        with FakeBroker(device_delay=args.device_delay) as broker:
+            config = {"mqttUsername": "bench", "mqttPassword": "bench", "mqttURL": broker.host, "mqttPort": broker.port}
+            sent, peak, settled, stats = run_burst(config, broker, scheduled, args.skips, args.skip_gap)
+        name = "LightScheduler" if scheduled else "direct publish"
+        print(f"{name:>28}: {sent:4d} /set commands, peak {peak} per device per second, last color on every bulb: {settled}")
+        if stats:
+            print(f"{'':>28}  {stats}")
+
+    aba_delay = max(args.device_delay, 0.3)
+    ok, stats = run_aba(aba_delay)
+    print(f"\nred, blue, red within {aba_delay * 1000:.0f} ms state reports: bulbs end red: {ok}")
+    print(f"{'':>28}  {stats}")
+    round_trip = run_round_trip(aba_delay)
+    print(f"track, stop, track, stop with bulbs off: bulbs end off: {round_trip}")
+    resent = run_failed_publish(aba_delay)
+    print(f"red lost to a failed publish, then red again: bulbs end red: {resent}")
+    if not ok or not round_trip or not resent:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Memory used to read large artwork off the metadata pipe.
+
+    python -m benchmarks.memoryBench [--sizes 600,1200,1800] [--format PNG] [--max-artwork-bytes N]
+
+For every cover size a capture with one PICT item is written to disk and
+read back in pipe-sized chunks, each mode in a fresh process:
+
+    readline    the original readline()/encode()/b64decode loop
+    buffered    MetadataParser buffering the base64 text before decoding it
+    streaming   MetadataParser decoding into ArtworkStream (md5 and header
+                read as the payload arrives)
+
+Each worker hashes the payload like the main script does, then renders it.
+Reports the tracemalloc peak while reading and the process's peak RSS above
+its baseline after reading and after rendering.
+"""
+import argparse
+import contextlib
+import gc
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks.capture import encode_item, make_cover
+
+MODES = ["readline", "buffered", "streaming"]
+
+def peak_rss_mb():
+    """Peak RSS since the last reset_peak_rss(), the whole process's peak where that can't be reset"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+def reset_peak_rss():
+    """Start VmHWM over from the current RSS (Linux), so the imports' peak doesn't hide what follows"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def read_artwork(mode, path, max_payload):
+    """(image bytes, md5) of the capture's PICT read the way mode does"""
+    if mode == "readline":
+        from benchmarks.parserBench import legacy_items
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            for typ, code, data in legacy_items(f):
+                if code == "PICT":
+                    return data, hashlib.md5(data).hexdigest()
+        return b"", None
+
+    from utils.metadataParser import read_pipe
+    from utils.artworkStream import Artwork, stream_artwork
+    stream = stream_artwork if mode == "streaming" else None
+    for typ, code, data in read_pipe(path, stream=stream, max_payload=max_payload):
+        if code != "PICT":
+            continue
+        if isinstance(data, Artwork):
+            return data.data, data.md5
+        return data, hashlib.md5(data).hexdigest() if data else None
+    return b"", None
+
+def worker(mode, path, max_payload):
+    # what the main script has loaded by the first PICT
+    import numpy
+    from utils import imageProcessor
+    from PIL import Image
+    # the plugin registry, loaded by whichever Image.open comes first
+    Image.init()
+    from benchmarks.replayBench import load_main
+    main = load_main()
+    gc.collect()
+    reset_peak_rss()
+    baseline = current_rss_mb()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    data, md5 = read_artwork(mode, path, max_payload)
+    read_ms = (time.perf_counter() - start) * 1000
+    traced = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    after_read = peak_rss_mb()
+
+    if data:
+        main.render_artwork(data)
+    return {"bytes": len(data), "md5": md5, "traced_mb": traced, "read_ms": read_ms,
+            "rss_read_mb": after_read - baseline, "rss_render_mb": peak_rss_mb() - baseline}
+
+def run(mode, path, max_payload):
+    cmd = [sys.executable, "-m", "benchmarks.memoryBench", "--worker", mode, path]
+    if max_payload is not None:
+        cmd += ["--max-artwork-bytes", str(max_payload)]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="600,1200,1800", help="cover sizes in pixels, comma separated")
+    parser.add_argument("--format", default="PNG", choices=["PNG", "JPEG"])
+    parser.add_argument("--max-artwork-bytes", type=int)
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "CAPTURE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        # the render's prints stay out of the JSON line
+        mode, path = args.worker
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = worker(mode, path, args.max_artwork_bytes)
+        print(json.dumps(result))
+        return
+
+    print(f"{'cover':>10}{'MB':>7}  {'mode':<10}{'traced MB':>10}{'RSS read':>10}{'RSS render':>11}{'read ms':>9}")
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(",")):
+            cover = make_cover(size, args.format, seed=size)
+            path = os.path.join(tmp, f"cover{size}.xml")
+            with open(path, "wb") as f:
+                f.write(encode_item("core", "asal", b"Album") + encode_item("ssnc", "PICT", cover))
+            expected = hashlib.md5(cover).hexdigest()
+            for mode in MODES:
+                # the original loop has no size cap
+                r = run(mode, path, None if mode == "readline" else args.max_artwork_bytes)
+                note = ""
+                if r["md5"] is None:
+                    note = "  dropped, over the cap"
+                elif r["md5"] != expected:
+                    note = "  WRONG PAYLOAD"
+                    failed = True
+                print(f"{size:>8}px{len(cover) / 2**20:>7.2f}  {mode:<10}{r['traced_mb']:>10.1f}"
+                      f"{r['rss_read_mb']:>10.1f}{r['rss_render_mb']:>11.1f}{r['read_ms']:>9.1f}{note}")
+    print("RSS columns are MB above the worker's baseline after imports")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Check utils.paletteExtractor against the scikit-learn KMeans path it replaced.
+
+    python -m benchmarks.paletteBench [COVER_DIR]
+
+Every image in COVER_DIR (or a synthetic corpus when omitted) is loaded at
+32x32 like the main loop does, and the NumPy palette and the light color
+chosen from it are compared with the original sklearn palette (50x50 cv2
+upscale + KMeans(random_state=0)). Exits non-zero if any cover's palette,
+counts or light color differ. sklearn runs on one OpenMP thread: with more
+it adds up the cluster sums per thread, which can move a center across an
+integer. sklearn and cv2 are only needed to run this comparison, not at
+runtime.
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+import sys
+import numpy as np
+from PIL import Image
+from utils.imageProcessor import ImageProcessor
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+def synthetic_corpus(count=40, seed=0):
+    """Blocky covers with a few flat colors plus noise, roughly like album art"""
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        n_colors = rng.integers(2, 6)
+        palette = rng.integers(0, 256, size=(n_colors, 3))
+        blocks = rng.integers(0, n_colors, size=(4, 4))
+        img = palette[blocks].repeat(8, axis=0).repeat(8, axis=1)
+        img = np.clip(img + rng.normal(0, 6, img.shape), 0, 255).astype(np.uint8)
+        yield f"synthetic-{i:02d}", Image.fromarray(img)
+
+def directory_corpus(path):
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            yield name, Image.open(os.path.join(path, name))
+
+def sklearn_palette(np_img, k=4):
+    """The original dominant_color palette: cv2 upscale to 50x50 then KMeans"""
+    import cv2
+    from sklearn.cluster import KMeans
+    from threadpoolctl import threadpool_limits
+    resized = cv2.resize(np_img, (50, 50), interpolation=cv2.INTER_AREA)
+    with threadpool_limits(1, user_api="openmp"):
+        kmeans = KMeans(n_clusters=k, random_state=0).fit(resized.reshape((-1, 3)))
+    colors = kmeans.cluster_centers_.astype(int)
+    counts = np.bincount(kmeans.labels_)
+    sorted_idx = np.argsort(counts)[::-1]
+    return colors[sorted_idx], counts[sorted_idx]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cover_dir", nargs="?")
+    args = parser.parse_args()
+
+    corpus = directory_corpus(args.cover_dir) if args.cover_dir else synthetic_corpus()
+    same = total = 0
+    new_time = old_time = 0.0
+    for name, img in corpus:
+        ip = ImageProcessor()
+        ip.img = img.resize((32, 32), Image.LANCZOS).convert('RGB')
+        ip.np_image = np.array(ip.img)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            new_colors, new_counts = ip.palette()
+            new_time += time.perf_counter() - start
+            new_choice = ip.choose_light_color(new_colors)
+
+            start = time.perf_counter()
+            old_colors, old_counts = sklearn_palette(ip.np_image)
+            old_time += time.perf_counter() - start
+            old_choice = ip.choose_light_color(old_colors)
+
+        match = (new_choice == old_choice and np.array_equal(new_colors, old_colors)
+                 and np.array_equal(new_counts, old_counts))
+        same += match
+        total += 1
+        print(f"{name:>24} sklearn={tuple(old_choice)} numpy={tuple(new_choice)}{'' if match else '  MISMATCH'}")
+        if not match:
+            print(f"{'':>24} sklearn palette {old_colors.tolist()} {old_counts.tolist()}")
+            print(f"{'':>24} numpy palette   {new_colors.tolist()} {new_counts.tolist()}")
+
+    print(f"\n{same}/{total} covers with the same palette and light color")
+    print(f"numpy palette: {new_time / total * 1000:.2f} ms/image, sklearn: {old_time / total * 1000:.2f} ms/image")
+    if same < total:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Throughput of utils.metadataParser against the original readline/regex loop.
+
+    python -m benchmarks.parserBench [CAPTURE] [--chunk-size N] [--repeat N]
+
+CAPTURE is a recorded metadata pipe stream; a synthetic session is used when
+it is omitted. The original loop only handles single-line base64 payloads,
+so the synthetic capture is written without line wrapping.
+
+Both read the capture from the same in-memory stream, the way each read the
+pipe: the parser takes --chunk-size byte reads like os.read, the original
+loop readline()s a UTF-8 text wrapper like open(path) gave it. Neither
+pays for a pipe, so the numbers are the parsing alone.
+"""
+import argparse
+import base64
+import io
+import re
+import time
+from utils.metadataParser import MetadataParser
+from benchmarks.capture import synthetic_capture, load_capture
+
+REGEX_LINE_ITEM = r"<item><type>(([A-Fa-f0-9]{2}){4})</type><code>(([A-Fa-f0-9]{2}){4})</code><length>(\d*)</length>"
+
+def legacy_items(text_stream):
+    """The original start_item/start_data/read_data loop"""
+    while True:
+        line = text_stream.readline()
+        if not line:
+            break
+        if not line.startswith("<item>"):
+            continue
+        matches = re.findall(REGEX_LINE_ITEM, line)
+        typ = bytes.fromhex(matches[0][0]).decode('utf-8', errors='ignore')
+        code = bytes.fromhex(matches[0][2]).decode('utf-8', errors='ignore')
+        length = int(matches[0][4])
+        data = ""
+        if length > 0:
+            if not text_stream.readline().startswith("<data"):
+                continue
+            b64size = 4 * ((length + 2) // 3)
+            data = base64.b64decode(text_stream.readline()[:b64size].encode())
+        yield typ, code, data
+
+def parser_items(capture, chunk_size):
+    """Feed the capture through a read loop like read_items, in chunk_size reads"""
+    source = io.BytesIO(capture)
+    parser = MetadataParser()
+    items = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return items
+        for _ in parser.feed(chunk):
+            items += 1
+
+def legacy_source(capture):
+    """The capture as the text stream open(path) gave the original loop"""
+    return io.TextIOWrapper(io.BytesIO(capture), encoding="utf-8", errors="ignore")
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", nargs="?")
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--wrap", type=int, help="wrap synthetic base64 at N columns (parser only)")
+    args = parser.parse_args()
+
+    capture = load_capture(args.capture) if args.capture else synthetic_capture(wrap=args.wrap)
+    mb = len(capture) / 1e6
+
+    secs, items = best_of(lambda: parser_items(capture, args.chunk_size), args.repeat)
+    print(f"MetadataParser: {items} items, {mb:.2f} MB in {secs * 1000:.1f} ms ({mb / secs:.1f} MB/s)")
+
+    if args.wrap:
+        return
+    secs, items = best_of(lambda: sum(1 for _ in legacy_items(legacy_source(capture))), args.repeat)
+    print(f"readline/regex: {items} items, {mb:.2f} MB in {secs * 1000:.1f} ms ({mb / secs:.1f} MB/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+PICT-to-wire latency of utils.pipeline during rapid track skips.
+
+    python -m benchmarks.pipelineBench [--skips N] [--interval-ms MS] [--budget-ms MS]
+
+Submits a new cover every --interval-ms through ArtworkPipeline with the
+real ImageProcessor render path and a local TCP sink standing in for the
+matrix. Superseded covers should be dropped, and the last cover must reach
+the wire within the latency budget.
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import socket
+import sys
+import threading
+import time
+from utils.imageProcessor import ImageProcessor
+from utils.matrixTransport import MatrixTransport
+from utils.pipeline import ArtworkPipeline
+from utils.outputProfiles import PROFILES, DEFAULT_PROFILE
+from benchmarks.capture import make_cover
+
+def start_sink():
+    """Fake matrix: accepts connections and counts frame bytes"""
+    server = socket.create_server(("127.0.0.1", 0))
+    received = [0]
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                while True:
+                    data = conn.recv(65536)
+                    if not data:
+                        break
+                    received[0] += len(data)
+    threading.Thread(target=serve, daemon=True).start()
+    return server, received
+
+def make_render():
+    def render(job):
+        ip = ImageProcessor(imgData=job["data"])
+        rgb = ip.dominant_color()
+        return PROFILES[DEFAULT_PROFILE].pixels(ip.enhance_image()), rgb
+    return render
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skips", type=int, default=20)
+    parser.add_argument("--interval-ms", type=float, default=10)
+    parser.add_argument("--budget-ms", type=float, default=500)
+    args = parser.parse_args()
+
+    covers = [make_cover(600, seed=i) for i in range(args.skips)]
+    server, received = start_sink()
+    matrix = MatrixTransport(*server.getsockname()[:2])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline = ArtworkPipeline(make_render(), matrix, latency_budget_ms=args.budget_ms).start()
+        for cover in covers:
+            pipeline.submit({"hash": hashlib.md5(cover).hexdigest(), "data": cover, "created": time.monotonic()})
+            time.sleep(args.interval_ms / 1000)
+        # wait for the newest cover to be rendered and written
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if not len(pipeline.render_queue) and not matrix.stats()["pending"] and pipeline.latencies_ms:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+        pipeline.close()
+        matrix.close()
+    server.close()
+
+    stats = pipeline.stats()
+    last = pipeline.latencies_ms[-1] if pipeline.latencies_ms else None
+    print(f"submitted {stats['submitted']}, rendered {stats['rendered']}, superseded {stats['superseded']}, "
+          f"frames on wire {matrix.frames_sent} ({received[0]} bytes)")
+    print(f"PICT->wire latency p50 {stats['latency_p50_ms']:.1f} ms, p99 {stats['latency_p99_ms']:.1f} ms, "
+          f"last cover {last:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if last is None or last > args.budget_ms:
+        print("over budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Bytes on the wire and pack/encode time for each output profile.
+
+    python -m benchmarks.profileBench [--profile NAME ...] [--covers N]
+
+For every profile in utils.outputProfiles the same covers are rendered at
+the profile's resolution and depth, then sent through a real MatrixTransport
+to a FrameReceiver that decodes the stream with the reference FrameDecoder.
+Every received frame must match what was sent. Two sequences are reported:
+
+    covers     a new cover each frame (track changes)
+    partial    the same cover with a 2-row band redrawn each frame
+
+The transport is dropped once mid-sequence so delta profiles have to resend
+a whole frame after the reconnect.
+"""
+import argparse
+import contextlib
+import io
+import socket
+import statistics
+import threading
+import time
+import numpy as np
+from utils.imageProcessor import ImageProcessor
+from utils.matrixTransport import MatrixTransport
+from utils.outputProfiles import PROFILES, FrameDecoder, FrameEncoder
+from benchmarks.capture import make_cover
+
+class FrameReceiver:
+    """
+    Fake display: decodes the stream per connection and records the frames
+    and when they arrived. read_delay simulates a panel on slow Wi-Fi by
+    pausing between small reads.
+    """
+    def __init__(self, profile, read_delay=0.0):
+        self.profile = profile
+        self.read_delay = read_delay
+        self.frames = []
+        self.times = []      # monotonic arrival time of each frame
+        self.errors = []
+        self._decoder = FrameDecoder(profile)
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.host, self.port = self._server.getsockname()[:2]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            while True:
+                if self.read_delay:
+                    time.sleep(self.read_delay)
+                data = conn.recv(1024 if self.read_delay else 65536)
+                if not data:
+                    return
+                try:
+                    for frame in self._decoder.feed(data):
+                        self.frames.append(frame)
+                        self.times.append(time.monotonic())
+                except ValueError as e:
+                    self.errors.append(str(e))
+                    return
+
+    def close(self):
+        self._server.close()
+
+def render(profile, cover):
+    ip = ImageProcessor(imgData=cover, width=profile.width, height=profile.height)
+    np_img = ip.enhance_image(colorDepthBits=profile.depth_bits)
+    return np_img
+
+def sequences(profile, covers):
+    with contextlib.redirect_stdout(io.StringIO()):
+        images = [render(profile, c) for c in covers]
+    partial = []
+    img = images[0].copy()
+    for i in range(len(covers)):
+        row = (2 * i) % (profile.height - 1)
+        img = img.copy()
+        img[row:row + 2] = images[i % len(images)][row:row + 2]
+        partial.append(img)
+    return {"covers": images, "partial": partial}
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not predicate():
+        time.sleep(0.001)
+
+def run(profile, images):
+    pack_s, encode_s = [], []
+    frames = []
+    for img in images:
+        start = time.perf_counter()
+        frames.append(profile.pixels(img))
+        pack_s.append(time.perf_counter() - start)
+
+    # encode cost on its own, without the transport around it
+    encoder = FrameEncoder(profile)
+    for frame in frames:
+        start = time.perf_counter()
+        encoder.encode(frame)
+        encode_s.append(time.perf_counter() - start)
+
+    receiver = FrameReceiver(profile)
+    matrix = MatrixTransport(receiver.host, receiver.port, encoder=FrameEncoder(profile))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, frame in enumerate(frames):
+            if i == len(frames) // 2:
+                # simulated link drop, the next frame has to be sent whole
+                matrix._disconnect()
+                receiver._decoder.reset()
+            matrix.send(frame)
+            wait_for(lambda: len(receiver.frames) > i)
+        stats = matrix.stats()
+        matrix.close()
+    receiver.close()
+
+    expected = [np.frombuffer(f, dtype=profile.word_dtype).reshape(profile.height, profile.width) for f in frames]
+    ok = len(receiver.frames) == len(frames) and all(np.array_equal(a, b) for a, b in zip(receiver.frames, expected))
+    return {
+        "frames": len(frames),
+        "bytes_per_frame": stats["bytes_sent"] / max(1, stats["frames_sent"]),
+        "raw_bytes": profile.frame_size,
+        "pack_us": statistics.median(pack_s) * 1e6,
+        "encode_us": statistics.median(encode_s) * 1e6,
+        "roundtrip_ok": ok and not receiver.errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", action="append", choices=sorted(PROFILES), help="default: all")
+    parser.add_argument("--covers", type=int, default=12)
+    args = parser.parse_args()
+
+    covers = [make_cover(600, seed=i) for i in range(args.covers)]
+    print(f"{'profile':<16}{'sequence':<10}{'bytes/frame':>12}{'vs 565 raw':>11}{'pack us':>9}{'encode us':>10}  roundtrip")
+    for name in args.profile or PROFILES:
+        profile = PROFILES[name]
+        baseline = profile.width * profile.height * 2
+        for seq, images in sequences(profile, covers).items():
+            r = run(profile, images)
+            print(f"{name:<16}{seq:<10}{r['bytes_per_frame']:12.0f}{r['bytes_per_frame'] / baseline:10.0%}"
+                  f"{r['pack_us']:9.1f}{r['encode_us']:10.1f}  {'ok' if r['roundtrip_ok'] else 'MISMATCH'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""
+Replay benchmark for the whole PICT -> render -> matrix -> lights path.
+
+    python -m benchmarks.replayBench [--scenario NAME ...] [--compare-prerender] [--clear-delay SECONDS]
+                                     [--capture FILE] [--json OUT]
+
+Each scenario runs shairport-metadata.py in-process against local stand-ins:
+a FIFO in place of /tmp/shairport-sync-metadata, a TCP sink in place of
+matrix.lan:9090, an HTTP endpoint that answers artwork resets after
+--clear-delay seconds in place of matrix.lan/reset and benchmarks.fakeBroker
+in place of Zigbee2MQTT. Items are
+written to the FIFO on a schedule, and timestamps taken at the FIFO, the
+render stage, the sink and the broker give per-stage latencies:
+
+    dispatch   PICT written to the pipe -> render started
+    render     render_artwork duration
+    matrix     render finished -> frame received by the sink
+    lights     render finished -> light color published to the broker
+    e2e        PICT written to the pipe -> frame received by the sink
+    ready      pbeg written to the pipe -> frame received by the sink
+    reset      pend/pfls written to the pipe -> next track's frame received
+    held       next track's cover rendered and playing -> its frame received,
+               how long a frame waits behind the reset before it
+
+Scenarios: steady (normal playback), skips (rapid track skips, only the last
+cover has to arrive), large-png (multi-megabyte PNG artwork) and
+session-starts (each track starts a new session after a pend, with playback
+beginning a while after the PICT), flushes (a pfls right before every next
+track) and track-ends (a pend, then the next track after the reset grace
+period so the slow reset actually runs), broker-late (the MQTT broker only
+takes connections BROKER_LATE seconds in, after the start-up connect gave up)
+and broker-absent (nothing listens on the MQTT port, with pends so the reset
+runs too). --compare-prerender runs every scenario
+with and without speculative pre-rendering and reports the ready -> matrix
+time saved. --capture replays a recorded metadata capture instead and
+reports throughput only.
+
+Exits non-zero if the last cover isn't what the display shows at the end,
+also after a reset that landed late, if a frame after a reset is held
+longer than MAX_HELD_MS, or if with a late or absent broker an item waits
+for it: the light snapshot on pbeg must not hold up the reader, so dispatch
+and ready stay under MAX_STALL_MS. A late broker has to get the last color.
+"""
+import argparse
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.capture import encode_item, make_cover, track_items, load_capture
+from benchmarks.fakeBroker import FakeBroker
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shairport-metadata.py")
+
+SCENARIOS = {
+    # tracks, cover size, format, seconds between tracks
+    # [, seconds between PICT and pbeg, reset item after every track, seconds between it and the next track]
+    "steady": dict(tracks=10, size=600, fmt="JPEG", gap=0.3),
+    "skips": dict(tracks=20, size=600, fmt="JPEG", gap=0.015),
+    "large-png": dict(tracks=5, size=2400, fmt="PNG", gap=0.8),
+    "session-starts": dict(tracks=6, size=1600, fmt="PNG", gap=0.3, ready_delay=0.3, reset="pend"),
+    "flushes": dict(tracks=10, size=600, fmt="JPEG", gap=0.3, reset="pfls"),
+    "track-ends": dict(tracks=4, size=600, fmt="JPEG", gap=1.5, reset="pend", reset_gap=0.7),
+    "broker-late": dict(tracks=10, size=600, fmt="JPEG", gap=0.5, broker="late"),
+    "broker-absent": dict(tracks=4, size=600, fmt="JPEG", gap=1.5, reset="pend", reset_gap=0.7, broker="absent"),
+}
+PICT_CODE = b"<code>50494354</code>"
+PBEG_CODE = b"<code>70626567</code>"
+# a frame after a reset goes out once rendered and playing, it never waits for the reset post
+MAX_HELD_MS = 250
+# seconds until the broker-late broker takes connections, longer than ControlLights' connect timeout
+BROKER_LATE = 7.0
+# nothing on the reader waits for MQTT, a missing broker only delays the lights
+MAX_STALL_MS = 250
+
+def load_main(prerender=True):
+    """Fresh copy of shairport-metadata.py so module state doesn't leak between scenarios"""
+    spec = importlib.util.spec_from_file_location("shairport_metadata", MAIN_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.DEBUG = False
+    module.PRERENDER = prerender
+    return module
+
+class FrameSink:
+    """Stand-in for the matrix: splits the stream into frames and timestamps them"""
+    def __init__(self, frame_size=2048):
+        self.frame_size = frame_size
+        self.frames = []     # (monotonic time, frame bytes)
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.host, self.port = self._server.getsockname()[:2]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        buf = bytearray()
+        with conn:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                buf += data
+                while len(buf) >= self.frame_size:
+                    self.frames.append((time.monotonic(), bytes(buf[:self.frame_size])))
+                    del buf[:self.frame_size]
+
+    def close(self):
+        self._server.close()
+
+class ResetEndpoint:
+    """Stand-in for the matrix's /reset, a slow one answers after delay seconds"""
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self.requests = []   # monotonic time each reset arrived
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                endpoint.requests.append(time.monotonic())
+                time.sleep(endpoint.delay)
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/reset"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+def point_resets_at(main, url):
+    """Make setup() give every display this reset url"""
+    original_setup = main.setup
+
+    def setup(args):
+        original_setup(args)
+        for zone in main.zones:
+            for target in zone.matrix.targets:
+                target.transport.reset_url = url
+    main.setup = setup
+
+def shutdown(main):
+    """Stop the script's workers and MQTT session before the stand-ins go away"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        for zone in main.zones:
+            zone.close()
+        main.render_pool.close()
+
+def percentiles(values):
+    if not values:
+        return {"n": 0, "p50_ms": None, "p99_ms": None}
+    values = sorted(values)
+    return {
+        "n": len(values),
+        "p50_ms": statistics.median(values),
+        "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))],
+    }
+
+def run_scenario(name, tracks, size, fmt, gap, ready_delay=0.0, reset=None, reset_gap=0.0, broker="up",
+                 prerender=True, clear_delay=1.0, settle=1.5):
+    covers = [make_cover(size, fmt, seed=i) for i in range(tracks)]
+    hashes = [hashlib.md5(c).hexdigest() for c in covers]
+
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        main = load_main(prerender)
+        # expected frame/color per cover, also warms the image modules
+        expected = [main.render_artwork(c) for c in covers]
+    frame_to_track = {frame: i for i, (frame, _) in enumerate(expected)}
+    color_to_track = {}
+    for i, (_, rgb) in enumerate(expected):
+        color_to_track.setdefault(tuple(rgb), i)
+
+    render_start, render_end = {}, {}
+    original_render = main.render_artwork
+
+    def timed_render(data, profile=None):
+        i = hashes.index(hashlib.md5(data).hexdigest())
+        render_start[i] = time.monotonic()
+        try:
+            return original_render(data, profile)
+        finally:
+            render_end[i] = time.monotonic()
+    main.render_artwork = timed_render
+
+    sink = FrameSink()
+    resets = ResetEndpoint(clear_delay)
+    point_resets_at(main, resets.url)
+    pict_time, ready_time, reset_time = {}, {}, {}
+    mqtt = FakeBroker()
+    comes_up = threading.Timer(BROKER_LATE, mqtt.start)
+    if broker == "up":
+        mqtt.start()
+    elif broker == "late":
+        comes_up.start()
+    else:
+        # the port refuses connections from here on
+        mqtt.stop()
+    with contextlib.ExitStack() as stack, tempfile.TemporaryDirectory() as tmp:
+        stack.callback(mqtt.stop)
+        stack.callback(comes_up.cancel)
+        fifo = os.path.join(tmp, "shairport-sync-metadata")
+        os.mkfifo(fifo)
+        argv = ["--pipe", fifo, "--matrix-host", sink.host, "--matrix-port", str(sink.port),
+                "--mqtt-host", mqtt.host, "--mqtt-port", str(mqtt.port)]
+
+        def run_main():
+            with quiet:
+                main.main(argv)
+        reader = threading.Thread(target=run_main, daemon=True)
+        reader.start()
+
+        start = time.monotonic()
+        written = 0
+        with open(fifo, "wb", buffering=0) as pipe:
+            for i, cover in enumerate(covers):
+                for item in track_items(f"{name} {i}", cover):
+                    if PICT_CODE in item[:80]:
+                        pict_time[i] = time.monotonic()
+                    elif PBEG_CODE in item[:80]:
+                        time.sleep(ready_delay)
+                        ready_time[i] = time.monotonic()
+                    pipe.write(item)
+                    written += len(item)
+                time.sleep(gap)
+                if reset and i + 1 < tracks:
+                    reset_time[i + 1] = time.monotonic()
+                    pipe.write(encode_item("ssnc", reset))
+                    time.sleep(reset_gap)
+            time.sleep(settle)
+            elapsed = time.monotonic() - start
+            pipe.write(encode_item("ssnc", "pend"))
+            # the reader reopens a pipe whose writer closed it, without the FIFO it stops instead
+            os.unlink(fifo)
+        reader.join(timeout=10)
+        shutdown(main)
+    sink.close()
+    resets.close()
+
+    # first arrival of each track's frame and light color
+    frame_time, light_time = {}, {}
+    for t, frame in sink.frames:
+        i = frame_to_track.get(frame)
+        if i is not None:
+            frame_time.setdefault(i, t)
+    for t, topic, payload in mqtt.published:
+        if not topic.endswith("/set"):
+            continue
+        color = json.loads(payload).get("color", {})
+        i = color_to_track.get((color.get("r"), color.get("g"), color.get("b")))
+        if i is not None and i in render_end and t >= render_end[i]:
+            light_time.setdefault(i, t)
+
+    def ms(a, b):
+        return [(b[i] - a[i]) * 1000 for i in a if i in b]
+
+    last = tracks - 1
+    # when each track after a reset could have gone out, and whether the last cover stayed up after every reset
+    # that reached the matrix, a reset landing late has to be followed by the cover again
+    could_send = {i: max(render_end[i], ready_time[i]) for i in reset_time if i in render_end and i in ready_time}
+    landed = [t + clear_delay for t in resets.requests]
+    last_shown = [t for t, frame in sink.frames if frame == expected[last][0]]
+    return {
+        "scenario": name if prerender else f"{name} (no prerender)",
+        "prerender": prerender,
+        "broker": broker,
+        "tracks": tracks,
+        "delivered": len(frame_time),
+        "last_delivered": last in frame_time,
+        "pipe_mb_per_s": written / 1e6 / elapsed,
+        "tracks_per_s": len(frame_time) / elapsed,
+        "dispatch": percentiles(ms(pict_time, render_start)),
+        "render": percentiles(ms(render_start, render_end)),
+        "matrix": percentiles(ms(render_end, frame_time)),
+        "lights": percentiles(ms(render_end, light_time)),
+        "e2e": percentiles(ms(pict_time, frame_time)),
+        "ready": percentiles(ms(ready_time, frame_time)),
+        "reset": percentiles(ms(reset_time, frame_time)),
+        "held": percentiles(ms(could_send, frame_time)),
+        "reset_posts": len(resets.requests),
+        "stream_reset": main.zones[0].resets.stats(),
+        "last_e2e_ms": (frame_time[last] - pict_time[last]) * 1000 if last in frame_time else None,
+        "last_shown": bool(last_shown) and all(last_shown[-1] > t for t in landed),
+        "last_lit": last in light_time,
+    }
+
+def run_capture(path):
+    """Replay a recorded capture as fast as the reader takes it"""
+    capture = load_capture(path)
+    sink = FrameSink()
+    with contextlib.redirect_stdout(io.StringIO()):
+        main = load_main()
+    with FakeBroker() as broker, tempfile.TemporaryDirectory() as tmp:
+        fifo = os.path.join(tmp, "shairport-sync-metadata")
+        os.mkfifo(fifo)
+        argv = ["--pipe", fifo, "--matrix-host", sink.host, "--matrix-port", str(sink.port),
+                "--mqtt-host", broker.host, "--mqtt-port", str(broker.port)]
+
+        def run_main():
+            with contextlib.redirect_stdout(io.StringIO()):
+                main.main(argv)
+        reader = threading.Thread(target=run_main, daemon=True)
+        reader.start()
+        start = time.monotonic()
+        with open(fifo, "wb") as pipe:
+            pipe.write(capture)
+            os.unlink(fifo)
+        reader.join(timeout=60)
+        elapsed = time.monotonic() - start
+        shutdown(main)
+    sink.close()
+    return {
+        "scenario": os.path.basename(path),
+        "pipe_mb_per_s": len(capture) / 1e6 / elapsed,
+        "frames": len(sink.frames),
+        "pipeline": main.zones[0].pipeline.stats(),
+    }
+
+def print_result(r):
+    print(f"\n== {r['scenario']} ==")
+    if "tracks" not in r:
+        print(f"  pipe {r['pipe_mb_per_s']:.1f} MB/s, {r['frames']} frames, pipeline {r['pipeline']}")
+        return
+    print(f"  {r['delivered']}/{r['tracks']} covers on the matrix, last cover delivered: {r['last_delivered']}")
+    print(f"  throughput: {r['tracks_per_s']:.1f} covers/s, pipe {r['pipe_mb_per_s']:.2f} MB/s")
+    for stage in ("dispatch", "render", "matrix", "lights", "e2e", "ready", "reset", "held"):
+        p = r[stage]
+        if p["n"]:
+            print(f"  {stage:>9}: p50 {p['p50_ms']:8.1f} ms  p99 {p['p99_ms']:8.1f} ms  (n={p['n']})")
+    if r["last_e2e_ms"] is not None:
+        print(f"  last cover PICT -> matrix: {r['last_e2e_ms']:.1f} ms")
+    if r["reset"]["n"]:
+        s = r["stream_reset"]
+        print(f"  resets: {s['scheduled']} scheduled, {s['cancelled']} cancelled by playback, "
+              f"{s['completed']} run, {r['reset_posts']} reset posts reached the matrix")
+
+def problems(r):
+    """What a scenario got wrong, empty if it passed"""
+    found = []
+    if not r["last_shown"]:
+        found.append("the display doesn't end on the last cover")
+    if r["held"]["n"] and r["held"]["p99_ms"] > MAX_HELD_MS:
+        found.append(f"a frame after a reset was held {r['held']['p99_ms']:.0f} ms, more than {MAX_HELD_MS} ms")
+    if r["broker"] != "up":
+        for stage in ("dispatch", "ready"):
+            if r[stage]["n"] and r[stage]["p99_ms"] > MAX_STALL_MS:
+                found.append(f"{stage} p99 {r[stage]['p99_ms']:.0f} ms with the broker {r['broker']}, "
+                             f"more than {MAX_STALL_MS} ms")
+    if r["broker"] == "late" and not r["last_lit"]:
+        found.append("the last color never reached the broker once it was up")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="default: all")
+    parser.add_argument("--compare-prerender", action="store_true",
+                        help="also run every scenario without speculative pre-rendering")
+    parser.add_argument("--clear-delay", type=float, default=1.0,
+                        help="seconds the stand-in /reset endpoint takes to answer")
+    parser.add_argument("--capture", help="replay a recorded metadata capture instead")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if args.capture:
+        results = [run_capture(args.capture)]
+    else:
+        results = []
+        for name in args.scenario or SCENARIOS:
+            results.append(run_scenario(name, **SCENARIOS[name], clear_delay=args.clear_delay))
+            if args.compare_prerender:
+                results.append(run_scenario(name, **SCENARIOS[name], clear_delay=args.clear_delay, prerender=False))
+    for r in results:
+        print_result(r)
+    if args.compare_prerender:
+        print("\nready -> matrix p50 with / without prerender:")
+        for on, off in zip(results[::2], results[1::2]):
+            if on["ready"]["n"] and off["ready"]["n"]:
+                saved = off["ready"]["p50_ms"] - on["ready"]["p50_ms"]
+                print(f"  {on['scenario']:>15}: {on['ready']['p50_ms']:7.1f} / {off['ready']['p50_ms']:7.1f} ms, saved {saved:.1f} ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = [(r["scenario"], p) for r in results if "tracks" in r for p in problems(r)]
+    for scenario, problem in failed:
+        print(f"FAIL {scenario}: {problem}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Cover transitions: blend cost and paced streaming to the matrix.
+
+    python -m benchmarks.transitionBench [--fps N] [--seconds S] [--slow-rate BYTES_PER_SECOND] [--repeat N]
+
+Blend: time per intermediate frame of a crossfade for every output profile,
+built on the packed pixel words by utils.transitions against unpacking to
+8-bit RGB, blending in floating point and packing again.
+
+Streaming: a MatrixTransport with a transition sends two covers to a local
+receiver that decodes the frames like the display would and timestamps
+them. Runs crossfade and wipe on a fast link, then a crossfade of the
+128x32 profile over a link throttled to --slow-rate bytes per second, where
+frames that can't make their slot have to be dropped. Reports frames
+received, achieved fps, jitter (standard deviation of the frame intervals),
+dropped frames and how long the new cover took to be fully shown.
+"""
+import argparse
+import socket
+import statistics
+import threading
+import time
+import numpy as np
+from utils.matrixTransport import MatrixTransport
+from utils.outputProfiles import PROFILES, FrameDecoder, FrameEncoder, get_profile, words_to_rgb
+from utils.transitions import CROSSFADE, WIPE, Transition
+
+class Receiver:
+    """Stand-in display: decodes frames for a profile, optionally reading at a limited byte rate"""
+    def __init__(self, profile, rate=None):
+        self.profile = profile
+        self.rate = rate
+        self.frames = []     # (monotonic time, pixel words)
+        self._server = socket.create_server(("127.0.0.1", 0))
+        if rate:
+            # keep the kernel from soaking up what the throttled reader hasn't taken yet
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.host, self.port = self._server.getsockname()[:2]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        decoder = FrameDecoder(self.profile)
+        with conn:
+            while True:
+                data = conn.recv(1024 if self.rate else 65536)
+                if not data:
+                    return
+                for words in decoder.feed(data):
+                    self.frames.append((time.monotonic(), words.tobytes()))
+                if self.rate:
+                    time.sleep(len(data) / self.rate)
+
+    def close(self):
+        self._server.close()
+
+def cover(profile, seed):
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 256, size=(profile.height, profile.width, 3), dtype=np.uint8)
+    return profile.pixels(img)
+
+def rgb_crossfade(profile, old, new, weight):
+    """The straightforward way: unpack both frames to 8-bit RGB, blend in float, pack again"""
+    a = words_to_rgb(np.frombuffer(old, dtype=profile.word_dtype), profile.pixel_format).astype(np.float32)
+    b = words_to_rgb(np.frombuffer(new, dtype=profile.word_dtype), profile.pixel_format).astype(np.float32)
+    mixed = np.rint(a + (b - a) * weight).astype(np.uint8)
+    return profile.pixels(mixed.reshape(profile.height, profile.width, 3))
+
+def blend_bench(steps, repeat):
+    print(f"crossfade, {steps} steps, µs per intermediate frame:")
+    print(f"{'profile':>16}{'packed':>10}{'via RGB':>10}")
+    transition = Transition(CROSSFADE, steps, 1)
+    for name, profile in PROFILES.items():
+        old, new = cover(profile, 1), cover(profile, 2)
+        best_packed = best_rgb = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            sequence = transition.sequence(old, new, profile)
+            for i in range(1, steps):
+                sequence.frame(i)
+            best_packed = min(best_packed, time.perf_counter() - start)
+            start = time.perf_counter()
+            for i in range(1, steps):
+                rgb_crossfade(profile, old, new, i / steps)
+            best_rgb = min(best_rgb, time.perf_counter() - start)
+        print(f"{name:>16}{best_packed / (steps - 1) * 1e6:>10.1f}{best_rgb / (steps - 1) * 1e6:>10.1f}")
+
+def stream_bench(label, profile, kind, seconds, fps, rate=None):
+    receiver = Receiver(profile, rate)
+    transport = MatrixTransport(receiver.host, receiver.port, encoder=FrameEncoder(profile), name=label,
+                                transition=Transition(kind, seconds, fps))
+    old, new = cover(profile, 1), cover(profile, 2)
+    transport.send(old)
+    deadline = time.monotonic() + 5
+    while not receiver.frames and time.monotonic() < deadline:
+        time.sleep(0.01)
+    received = len(receiver.frames)
+    sent_at = time.monotonic()
+    transport.send(new)
+    while time.monotonic() < deadline + seconds:
+        if receiver.frames and receiver.frames[-1][1] == new:
+            break
+        time.sleep(0.005)
+    stats = transport.stats()
+    transport.close()
+    receiver.close()
+
+    times = [t for t, _ in receiver.frames[received:]]
+    intervals = np.diff(times)
+    shown = (times[-1] - sent_at) * 1000 if times and receiver.frames[-1][1] == new else None
+    achieved = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 else 0
+    jitter = statistics.pstdev(intervals) * 1000 if len(intervals) > 1 else 0
+    link = f"{rate / 1000:.0f} KB/s" if rate else "fast"
+    print(f"{label:>22}{link:>10}{len(times):>8}{achieved:>8.1f}{jitter:>10.2f}"
+          f"{stats['transition_frames_dropped']:>9}{shown if shown is not None else float('nan'):>10.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--seconds", type=float, default=0.5)
+    parser.add_argument("--slow-rate", type=int, default=64000, help="bytes per second of the throttled link")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    blend_bench(max(2, round(args.seconds * args.fps)), args.repeat)
+
+    print(f"\n{args.seconds:.2f} s transitions at {args.fps:.0f} fps "
+          f"({max(1, round(args.seconds * args.fps))} frames, the new cover included):")
+    print(f"{'transition':>22}{'link':>10}{'frames':>8}{'fps':>8}{'jitter ms':>10}{'dropped':>9}{'shown ms':>10}")
+    stream_bench("matrix32 crossfade", get_profile("matrix32"), CROSSFADE, args.seconds, args.fps)
+    stream_bench("matrix32 wipe", get_profile("matrix32"), WIPE, args.seconds, args.fps)
+    stream_bench("matrix64 crossfade", get_profile("matrix64"), CROSSFADE, args.seconds, args.fps)
+    stream_bench("chain128x32 crossfade", get_profile("chain128x32"), CROSSFADE, args.seconds, args.fps,
+                 rate=args.slow_rate)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Several AirPlay zones served by one shairport-metadata.py process.
+
+    python -m benchmarks.zonesBench [--zones N] [--tracks N] [--gap SECONDS]
+
+Writes a zones config with N zones, each with its own FIFO, a FrameSink as
+its display and its own light group on benchmarks.fakeBroker, and plays
+different covers into all pipes at once from separate writer threads.
+Halfway through, each writer closes its pipe and opens it again, the way
+shairport-sync does when it restarts. Checks that every zone's display and
+lights only ever got that zone's covers and that the covers written after
+the restart still arrive, and reports per-zone PICT -> matrix latency, how many renders the
+shared render worker did and the process's peak RSS next to the peak RSS
+of one single-zone process doing the same imports and a render, which is
+what every extra process per zone would cost.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.capture import encode_item, make_cover, track_items
+from benchmarks.fakeBroker import FakeBroker
+from benchmarks.replayBench import MAIN_SCRIPT, PICT_CODE, FrameSink, load_main, shutdown
+
+LIGHT_GROUPS = [["playbar1", "playbar2"], ["Desk"], ["bedLeft", "bedRight"], ["hallway"]]
+
+# a single-zone process: the imports plus one render, peak RSS in KB
+SINGLE_PROCESS = f"""
+import importlib.util, resource, sys
+sys.path.insert(0, {os.path.dirname(MAIN_SCRIPT)!r})
+spec = importlib.util.spec_from_file_location("shairport_metadata", {MAIN_SCRIPT!r})
+main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(main)
+from benchmarks.capture import make_cover
+main.render_artwork(make_cover(600))
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def single_process_rss_kb():
+    out = subprocess.run([sys.executable, "-c", SINGLE_PROCESS], capture_output=True, text=True,
+                         cwd=os.path.dirname(MAIN_SCRIPT), check=True).stdout
+    return int(out.strip().splitlines()[-1])
+
+def write_zone(fifo, name, covers, gap, pict_time):
+    half = len(covers) // 2
+    # a shairport-sync restart halfway: the pipe is closed and opened again
+    for start, end in ((0, half), (half, len(covers))):
+        with open(fifo, "wb", buffering=0) as pipe:
+            for i in range(start, end):
+                for item in track_items(f"{name} {i}", covers[i]):
+                    if PICT_CODE in item[:80]:
+                        pict_time[i] = time.monotonic()
+                    pipe.write(item)
+                time.sleep(gap)
+            if end < len(covers):
+                continue
+            pipe.write(encode_item("ssnc", "pend"))
+            time.sleep(1.0)
+            # the reader reopens a pipe whose writer closed it, without the FIFO it drops the pipe
+            os.unlink(fifo)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zones", type=int, default=3, choices=range(1, len(LIGHT_GROUPS) + 1))
+    parser.add_argument("--tracks", type=int, default=8)
+    parser.add_argument("--gap", type=float, default=0.3, help="seconds between tracks in each zone")
+    args = parser.parse_args()
+
+    names = [f"zone{z}" for z in range(args.zones)]
+    covers = {name: [make_cover(600, seed=z * 100 + i) for i in range(args.tracks)] for z, name in enumerate(names)}
+    sinks = {name: FrameSink() for name in names}
+    renders = []
+    pict_time = {name: {} for name in names}
+
+    with FakeBroker() as broker, tempfile.TemporaryDirectory() as tmp:
+        config = []
+        for name, lights in zip(names, LIGHT_GROUPS):
+            fifo = os.path.join(tmp, name)
+            os.mkfifo(fifo)
+            config.append({"name": name, "pipe": fifo, "displays": [f"{name}=127.0.0.1:{sinks[name].port}"],
+                           "lights": lights})
+        zones_file = os.path.join(tmp, "zones.json")
+        with open(zones_file, "w") as f:
+            json.dump(config, f)
+
+        quiet = contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            main = load_main()
+            # expected frame and color per cover, also warms the image modules
+            expected = {name: [main.render_artwork(c) for c in covers[name]] for name in names}
+        original_render = main.render_artwork
+
+        def counted_render(data, profile=None):
+            renders.append(threading.current_thread().name)
+            return original_render(data, profile)
+        main.render_artwork = counted_render
+
+        argv = ["--zones", zones_file, "--mqtt-host", broker.host, "--mqtt-port", str(broker.port)]
+
+        def run_main():
+            with quiet:
+                main.main(argv)
+        reader = threading.Thread(target=run_main, daemon=True)
+        reader.start()
+        writers = [threading.Thread(target=write_zone, args=(entry["pipe"], entry["name"], covers[entry["name"]],
+                                                             args.gap, pict_time[entry["name"]]))
+                   for entry in config]
+        for w in writers:
+            w.start()
+        for w in writers:
+            w.join()
+        reader.join(timeout=10)
+        shutdown(main)
+    for sink in sinks.values():
+        sink.close()
+
+    leaks, lost = 0, []
+    print(f"{'zone':<8}{'frames':>7}{'own':>5}{'p50 ms':>9}{'max ms':>9}  lights")
+    for name, lights in zip(names, LIGHT_GROUPS):
+        own = {frame: i for i, (frame, _) in enumerate(expected[name])}
+        others = {frame for other in names if other != name for frame, _ in expected[other]}
+        first = {}
+        for t, frame in sinks[name].frames:
+            if frame in own:
+                first.setdefault(own[frame], t)
+            elif frame in others:
+                leaks += 1
+        if len(covers[name]) - 1 not in first:
+            lost.append(name)
+        latencies = [(first[i] - pict_time[name][i]) * 1000 for i in first if i in pict_time[name]]
+        # colors published to this zone's bulbs vs every other zone's covers
+        own_colors = {tuple(rgb) for _, rgb in expected[name]}
+        topics = {f"zigbee2mqtt/{light}/set" for light in lights}
+        light_sets = [json.loads(p).get("color") for _, topic, p in broker.published if topic in topics]
+        colors = [(c["r"], c["g"], c["b"]) for c in light_sets if c and "r" in c]
+        foreign = [c for c in colors if c not in own_colors]
+        leaks += len(foreign)
+        p50 = f"{statistics.median(latencies):9.1f}" if latencies else f"{'-':>9}"
+        worst = f"{max(latencies):9.1f}" if latencies else f"{'-':>9}"
+        print(f"{name:<8}{len(sinks[name].frames):>7}{len(first):>5}{p50}{worst}  {len(colors)} colors on "
+              f"{', '.join(lights)}, {len(foreign)} from other zones")
+
+    workers = sorted(set(renders))
+    print(f"\n{len(renders)} renders for {args.zones * args.tracks} covers on {len(workers)} shared worker(s): {workers}")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    single = single_process_rss_kb()
+    print(f"peak RSS: {rss / 1024:.0f} MB for {args.zones} zones in this process "
+          f"(includes the benchmark's own stand-ins), one single-zone process {single / 1024:.0f} MB, "
+          f"{args.zones} of them {args.zones * single / 1024:.0f} MB")
+    if lost:
+        print(f"no artwork after the pipe was reopened in: {', '.join(lost)}")
+    if leaks:
+        print(f"{leaks} frames or light colors ended up in the wrong zone")
+    if lost or leaks:
+        sys.exit(1)
+    print("every zone only got its own artwork and colors, also after its pipe was reopened")
+
+if __name__ == "__main__":
+    main()
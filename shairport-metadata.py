@@ -1,93 +1,181 @@
-import re, sys, requests, base64, json, cv2, os, socket, hashlib
-from utils.imageProcessor import ImageProcessor
+import sys, time
+STARTUP_T0 = time.perf_counter()
+from utils.startupProfile import StartupProfile
+# installed before the other imports so their cost shows up in the report
+startup = StartupProfile("--startup-profile" in sys.argv, STARTUP_T0).install()
+
+import argparse, functools, json, os, re, hashlib, threading
 from utils.controlLights import ControlLights
-import numpy as np
+from utils.lightScheduler import LightScheduler, TokenBucket
+from utils.lightBackends import LightGroup
+from utils.renderCache import RenderCache
+from utils.metadataParser import read_pipes
+from utils.artworkStream import Artwork, stream_artwork
+from utils.pipeline import ArtworkPipeline, RenderPool
+from utils.metrics import metrics
+from utils.outputProfiles import PROFILES, DEFAULT_PROFILE, get_profile
+from utils.displayTargets import DisplayGroup, DisplayTarget, parse_target
+from utils.streamReset import StreamReset
+from utils.transitions import CUT, TRANSITIONS, Transition
+from utils.zones import Zone, load_zones, parse_zones
+# numpy, PIL and the image processing modules are imported lazily by render_artwork,
+# requests by the Pironman 5 backend and the matrix reset when they are used
 
 SSNC_PIPE_PATH="/tmp/shairport-sync-metadata"
+MATRIX_HOST="matrix.lan"
+MATRIX_PORT=9090
 DEBUG = True
 LAST_SENT=""
+# one of utils.ditherEngine.DITHER_MODES: floyd-steinberg, bayer4, bayer8, none
+DITHER_MODE = "floyd-steinberg"
+# LED gamma applied after saturation/brightness/contrast, 1.0 leaves the colors as they were
+LED_GAMMA = 1.0
+# ImageProcessor.enhance_image steps applied before dithering
+ENHANCE = {"increaseSaturation": True, "reduceBrightness": True, "increaseContrast": True}
+# bump when render_artwork's output changes for the same settings, so cached frames from before aren't served
+RENDER_VERSION = 3
+# resolution, pixel format and compression of the frames, see utils.outputProfiles.PROFILES
+OUTPUT_PROFILE = DEFAULT_PROFILE
+# "crossfade" or "wipe" from one cover to the next and into a clear, streamed at MATRIX_FPS for
+# MATRIX_TRANSITION_SECONDS; None cuts straight to the new frame
+MATRIX_TRANSITION = None
+MATRIX_TRANSITION_SECONDS = 0.5
+MATRIX_FPS = 30
+# several matrix displays as "[NAME=]HOST[:PORT][/PROFILE]", e.g. "kitchen=matrix-kitchen.lan/matrix64";
+# when empty the artwork goes to MATRIX_HOST:MATRIX_PORT only
+DISPLAYS = []
+# rendered frames + light colors keyed by artwork md5 and the render settings, set RENDER_CACHE_DIR
+# (--render-cache-dir) to persist across restarts and to use what warm-cache.py rendered ahead of time;
+# the directory is trimmed to RENDER_CACHE_DISK_MAX_BYTES, least recently used first
+RENDER_CACHE_MAX_BYTES = 1024 * 1024
+RENDER_CACHE_DIR = None
+RENDER_CACHE_DISK_MAX_BYTES = 64 * 1024 * 1024
+# debug: also write each artwork to <album>.jpg/.png in the working directory
+WRITE_ARTWORK = False
+# warn when a PICT takes longer than this to reach the matrix
+LATENCY_BUDGET_MS = 500
+# start rendering artwork as soon as it arrives, before playback is ready
+PRERENDER = True
+# decode artwork into one buffer and its md5 as it comes off the pipe instead of buffering the base64 first
+STREAM_ARTWORK = True
+# artwork bigger than this is dropped as it arrives and treated like a PICT without an image
+MAX_ARTWORK_BYTES = 16 * 1024 * 1024
+# light commands per second, per bulb and across the whole Zigbee mesh
+LIGHT_DEVICE_RATE = 2.0
+LIGHT_MESH_RATE = 10.0
+# seconds bulbs take to fade to a new color (zigbee2mqtt "transition"), None sends plain commands
+LIGHT_TRANSITION = None
+# also color the Pironman 5 case LEDs through its dashboard API, e.g. "http://pi5.lan:34001/api/v1.0/"
+PIRONMAN_URL = None
+PIRONMAN_TIMEOUT = 2.0
+# pend/pfls cleanup waits this long for playback to resume before touching lights and display,
+# and gives each cleanup step this long before moving on
+RESET_GRACE = 0.5
+RESET_STEP_TIMEOUT = 3.0
+# several AirPlay zones served by this one process, each with its own pipe, displays and light group, e.g.
+# [{"name": "kitchen", "pipe": "/tmp/shairport-kitchen", "displays": ["matrix-kitchen.lan/matrix64"], "lights": ["Desk"]}]
+# when empty there is a single zone made from --pipe, --display/--matrix-host and the default light topics
+ZONES = []
+# render threads shared by all zones
+RENDER_WORKERS = 1
+
+# --- zones and the render workers they share, created by setup() ---
+zones = []
+render_pool = None
 
-# --- lights controller  ---
-lights = ControlLights(rgb=(0, 0, 0))
-_have_snapshot = False
+render_cache = RenderCache(max_bytes=RENDER_CACHE_MAX_BYTES, cache_dir=RENDER_CACHE_DIR,
+                           max_disk_bytes=RENDER_CACHE_DISK_MAX_BYTES)
 
-# regex to capture shairport-metadata output
-REGEX_LINE_ITEM = r"<item><type>(([A-Fa-f0-9]{2}){4})</type><code>(([A-Fa-f0-9]{2}){4})</code><length>(\d*)</length>"
 def debug(s):
     if DEBUG:
         print(s)
      
-def save_and_send_image(name):
-    print(f"processing and sending image: {name}")
-    HOST="matrix.lan"
-    PORT=9090
-    color = None
-    ip = ImageProcessor(name)
+def preload_render_modules():
+    """Import the heavy image modules ahead of the first PICT without holding up the pipe"""
+    import numpy
+    from utils import imageProcessor
+    startup.mark("render modules loaded")
+
+def render_artwork(data, profile=None):
+    """Process raw artwork bytes into frame bytes for the output profile and pick the light color"""
+    from utils.imageProcessor import ImageProcessor
+    profile = profile or get_profile(OUTPUT_PROFILE)
+
+    ip = ImageProcessor(imgData=data, width=profile.width, height=profile.height)
     primaryColor = ip.dominant_color()
 
-    np_img = ip.enhance_image()
-
-    # casting numpy array before shifting to prevent overflow errors
-    r = np_img[:, :, 0].astype(np.uint16) & 0xF8
-    g = np_img[:, :, 1].astype(np.uint16) & 0xFC
-    b = np_img[:, :, 2].astype(np.uint16) >> 3
-    rgb565 = (r << 8) | (g << 3) | b
-
-    # Flatten to byte array: high byte first, low byte second
-    # img_rgb565 = bytearray()
-    # for val in rgb565.flatten():
-    #     img_rgb565.append((val >> 8) & 0xFF)  # high byte
-    #     img_rgb565.append(val & 0xFF)         # low byte
-
-    rgb565_be = rgb565.astype('>H') # >H means big-endian uint16
-
-    # get binary bytes
-    img_rgb565 = rgb565_be.flatten().tobytes()
-
-    debug(f"Image size: {len(img_rgb565)} bytes")
-
-    # send image over socket connection
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST,PORT))
-        s.sendall(img_rgb565)
-
-    # set lights for the track artwork color
-    lights.rgb = tuple(int(x) for x in primaryColor)
-    lights.enable_rgb = True
-    lights.publish_commands()
-
-def clear_matrix_artwork():
-    try:
-        debug("Clearing artwork...")
-        res = requests.post("http://matrix.lan/reset")
-        debug(res.status_code)
-        debug(res.text)
-    except requests.exceptions.ConnectionError as e:
-        print(f"there was an error sending reset command to matrix: {e}")
+    np_img = ip.enhance_image(**ENHANCE, ditherMode=DITHER_MODE, colorDepthBits=profile.depth_bits, gamma=LED_GAMMA)
+
+    with metrics.timer("pack"):
+        frame = profile.pixels(np_img)
+    return frame, tuple(int(x) for x in primaryColor)
+
+def render_fingerprint():
+    """Short hash of every setting besides the profile that changes what render_artwork makes"""
+    settings = {"version": RENDER_VERSION, "dither": DITHER_MODE, "gamma": LED_GAMMA, "enhance": ENHANCE}
+    return hashlib.md5(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:8]
+
+def cache_key(img_hash, profile):
+    # a persistent cache must not serve frames rendered with other settings
+    return f"{img_hash}-{profile.name}-{render_fingerprint()}"
+
+def render_job(job, displays):
+    """
+    Render stage of the pipeline: one frame per output profile the zone's
+    displays use, from the cache or by processing the artwork, plus the light color
+    """
+    profiles = displays.profiles
+    frames, colors, missing = {}, {}, []
+    for profile in profiles:
+        cached = render_cache.get(cache_key(job["hash"], profile))
+        metrics.count("render_cache", result="hit" if cached else "miss")
+        if cached:
+            frames[profile.name], colors[profile.name] = cached
+        else:
+            missing.append(profile)
+    if not missing:
+        debug(f"render cache hit for {job['hash']}: {render_cache.stats()}")
+        return frames, colors[profiles[0].name]
+
+    name = job["name"]
+    if WRITE_ARTWORK:
+        delete_artwork()
+        print(f"📀 Writing image {name} to disk...")
+        with open(name, "wb") as f:
+            f.write(job["data"])
+
+    print(f"processing image: {name}")
+    for profile in missing:
+        with metrics.timer("render", profile=profile.name):
+            frame, primaryColor = render_artwork(job["data"], profile)
+        render_cache.put(cache_key(job["hash"], profile), frame, primaryColor)
+        frames[profile.name], colors[profile.name] = frame, primaryColor
+        debug(f"Image size ({profile.name}): {len(frame)} bytes")
+    # the first display's profile decides the light color
+    return frames, colors[profiles[0].name]
+
+def clear_matrix_artwork(zone):
+    debug(f"{zone_label(zone)}Clearing artwork...")
+    zone.matrix.clear()
+
+def restore_lights(zone):
+    # runs on the reset worker, have_snapshot is left to the reader
+    if not zone.pipeline.wait_lights_snapshot(RESET_STEP_TIMEOUT):
+        print(f"{zone_label(zone)}light snapshot still running, not restoring")
         return
-def start_item(line):
-    matches = re.findall(REGEX_LINE_ITEM, line)
-    typ = bytes.fromhex(matches[0][0]).decode('utf-8', errors='ignore')
-    code = bytes.fromhex(matches[0][2]).decode('utf-8', errors='ignore')
-    length = int(matches[0][4])
-    return (typ, code, length)
-def start_data(line):
-    try:
-        assert line == '<data encoding="base64">\n'
-    except AssertionError:
-        if line.startswith("<data"):
-            return 0
-        return -1
-    return 0
-
-def read_data(line, length):
-    b64size = 4*((length+2)//3);
-    try:
-        data = base64.b64decode(line[:b64size].encode())
-    except TypeError:
-        data = ""
-        pass
-    return data
+    print(f"{zone_label(zone)}↩️ Restoring light states...")
+    zone.lights.restore()
+
+def zone_label(zone):
+    """Log prefix, empty with a single zone so its output stays as it was"""
+    return f"[{zone.name}] " if len(zones) > 1 else ""
+
+def announce(zone, payload):
+    """Print a now-playing line for whatever reads our stdout, tagged with the zone when there are several"""
+    if len(zones) > 1:
+        payload = {"zone": zone.name, **payload}
+    print(json.dumps(payload))
+    sys.stdout.flush()
 
 def guessImageMime(magic):
 
@@ -102,114 +190,275 @@ def delete_artwork():
         if file.endswith(".jpg") or file.endswith(".png"):
             print(f"Deleting stale artwork {file}...")
             os.remove(file)
-if __name__ == "__main__":
-    if not os.path.exists(SSNC_PIPE_PATH):
-        raise FileNotFoundError(f"{SSNC_PIPE_PATH} does not exist")
+def first_frame_sent(job, latency_ms):
+    startup.mark(f"first frame on wire ({latency_ms:.0f} ms after its PICT)")
+    startup.report()
+    for zone in zones:
+        zone.pipeline.on_frame_sent = None
 
-    LAST_SENT = ""
-    track_state = {
+def new_track_state():
+    return {
         "album": None,
         "image_data": None,
         "image_extension": None,
         "image_hash": None,
+        "image_time": None,
         "ready": False,
         "sent": False
     }
 
-    with open(SSNC_PIPE_PATH, 'r') as pipe:
-        while True:
-            line = pipe.readline()
-            if not line:
-                break
-            if not line.startswith("<item>"):
-                continue
-
-            typ, code, length = start_item(line)
-            data = ""
-            if length > 0:
-                if start_data(pipe.readline()) == -1:
-                    continue
-                data = read_data(pipe.readline(), length)
-
-            # ========== METADATA ==========
-
-            if typ == "core" and code == "asal":
-                try:
-                    new_album = data.decode(errors="ignore")
-                    if new_album != track_state["album"]:
-                        track_state["album"] = new_album
-                        track_state["sent"] = False  # new album → allow resend
-                except:
-                    track_state["album"] = None
-
-            elif typ == "ssnc" and code == "PICT":
-                if len(data) == 0:
-                    print(json.dumps({"image": ""}))
-                    sys.stdout.flush()
-                    continue
-
-                mime = guessImageMime(data)
-                ext = {
-                    'image/jpeg': '.jpg',
-                    'image/png': '.png'
-                }.get(mime, '.jpg')
-                img_hash = hashlib.md5(data).hexdigest()
-
-                if img_hash != track_state.get("image_hash"):
-                    track_state["image_data"] = data
-                    track_state["image_extension"] = ext
-                    track_state["image_hash"] = img_hash
-                    track_state["sent"] = False  # image changed → resend
-                    print(json.dumps({"image": f"data:{mime}"}))
-                    sys.stdout.flush()
-
-            # ====== Playback started/resumed/progressed ======
-            elif typ == "ssnc" and code in ["pbeg", "prsm", "prgr"]:
-                track_state["ready"] = True
-                if not _have_snapshot:
-                    print("🎛️ Snapshotting light states...")
-                    lights.snapshot_states()   # grabs ON/OFF + brightness + color/ct per device
-                    _have_snapshot = True
-            # ====== Track ended/flushed/reset ======
-            elif typ == "ssnc" and code in ["pend", "pfls"]:
-
-                if _have_snapshot:
-                    print("↩️ Restoring light states...")
-                    lights.restore_states()
-                    _have_snapshot = False
-
-                print(f"🧼 Stream reset: {code}")
-                track_state = {
-                    "album": None,
-                    "image_data": None,
-                    "image_extension": None,
-                    "image_hash": None,
-                    "ready": False,
-                    "sent": False
-                }
-                clear_matrix_artwork()
-                delete_artwork()
-                print(json.dumps({}))
-                sys.stdout.flush()
-
-            # ========== Ready to Send Image? ==========
-
-            if (
-                track_state["ready"]
-                and not track_state["sent"]
-                and track_state["album"]
-                and track_state["image_data"]
-            ):
-                file_name = f"{track_state['album'].lower().replace(' ', '_')}{track_state['image_extension']}"
-                delete_artwork()
-                print(f"📀 Writing image {file_name} to disk...")
-                with open(file_name, "wb") as f:
-                    f.write(track_state["image_data"])
-                    f.flush()
-                os.sync()
-
-                print(f"📤 Sending {file_name}...")
-                save_and_send_image(file_name)
-
-                LAST_SENT = track_state["album"]
-                track_state["sent"] = True
\ No newline at end of file
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Send AirPlay artwork from shairport-sync to the matrix display")
+    parser.add_argument("--pipe", default=SSNC_PIPE_PATH, help="shairport-sync metadata pipe")
+    parser.add_argument("--zones", metavar="FILE",
+                        help="JSON list of zones, each with its own pipe, displays and lights (replaces --pipe)")
+    parser.add_argument("--matrix-host", default=MATRIX_HOST)
+    parser.add_argument("--matrix-port", type=int, default=MATRIX_PORT)
+    parser.add_argument("--profile", default=OUTPUT_PROFILE, choices=sorted(PROFILES),
+                        help="matrix resolution, pixel format and compression")
+    parser.add_argument("--display", action="append", metavar="[NAME=]HOST[:PORT][/PROFILE]",
+                        help="send artwork to this display, repeat for several (replaces --matrix-host)")
+    parser.add_argument("--transition", default=MATRIX_TRANSITION, choices=TRANSITIONS,
+                        help="how the matrix changes from one cover to the next")
+    parser.add_argument("--transition-seconds", type=float, default=MATRIX_TRANSITION_SECONDS)
+    parser.add_argument("--fps", type=float, default=MATRIX_FPS, help="frame rate transitions are streamed at")
+    parser.add_argument("--mqtt-host", help="MQTT broker, defaults to utils/credentials.py")
+    parser.add_argument("--mqtt-port", type=int, default=1883)
+    parser.add_argument("--mqtt-username", default="")
+    parser.add_argument("--mqtt-password", default="")
+    parser.add_argument("--max-artwork-bytes", type=int, default=MAX_ARTWORK_BYTES, metavar="BYTES",
+                        help="drop artwork bigger than this without decoding it")
+    parser.add_argument("--pironman", default=PIRONMAN_URL, metavar="URL",
+                        help="also send light colors to a Pironman 5 dashboard API")
+    parser.add_argument("--light-transition", type=float, default=LIGHT_TRANSITION, metavar="SECONDS",
+                        help="fade lights to each new color over this many seconds")
+    parser.add_argument("--render-cache-dir", default=RENDER_CACHE_DIR, metavar="DIR",
+                        help="keep rendered artwork in DIR across restarts, see warm-cache.py")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="print per-module import times and time to first frame")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve per-stage timings on http://127.0.0.1:PORT/metrics (Prometheus text)")
+    parser.add_argument("--metrics-log", metavar="FILE",
+                        help="append every stage timing to FILE as JSON lines")
+    return parser.parse_args(argv)
+
+def build_zone(name, pipe, specs, light_topics, pironman_url, args, mqttConfig, mesh):
+    """One zone's displays, light backends, pipeline and reset worker"""
+    zigbee = ControlLights(rgb=(0, 0, 0), mqttConfig=mqttConfig, topics=light_topics)
+    # skips colors the bulbs already show, merges rapid changes and paces what's left
+    zigbee.scheduler = LightScheduler(zigbee, zigbee.publish_all, device_rate=LIGHT_DEVICE_RATE, mesh=mesh,
+                                      transition=args.light_transition).start()
+    backends = [zigbee]
+    if pironman_url:
+        # pulls in requests, only when the case LEDs are in use
+        from utils.pironman5 import Pironman5
+        backends.append(Pironman5(url=pironman_url, timeout=PIRONMAN_TIMEOUT))
+    # every backend gets each color at the same time
+    lights = LightGroup(backends)
+    # one persistent connection per display, each reconnects in the background on its own
+    transition = None
+    if args.transition and args.transition != CUT:
+        transition = Transition(args.transition, args.transition_seconds, args.fps)
+    if specs:
+        targets = [parse_target(spec, OUTPUT_PROFILE, transition=transition) for spec in specs]
+    else:
+        targets = [DisplayTarget(args.matrix_host, args.matrix_host, args.matrix_port, OUTPUT_PROFILE,
+                                 transition=transition)]
+    matrix = DisplayGroup(targets)
+    # reader -> shared render workers -> display senders / lights worker, latest artwork wins
+    pipeline = ArtworkPipeline(functools.partial(render_job, displays=matrix), matrix, lights,
+                               latency_budget_ms=LATENCY_BUDGET_MS, renderer=render_pool)
+    # pend/pfls cleanup runs here so the reader can go straight on to the next track
+    resets = StreamReset(grace=RESET_GRACE, step_timeout=RESET_STEP_TIMEOUT)
+    return Zone(name, pipe, matrix, lights, pipeline, resets)
+
+def setup(args):
+    """Create the zones, their lights, displays and pipelines, and the shared render workers"""
+    global zones, render_pool, render_cache, OUTPUT_PROFILE
+    mqttConfig = None
+    if args.mqtt_host:
+        mqttConfig = {
+            "mqttUsername": args.mqtt_username,
+            "mqttPassword": args.mqtt_password,
+            "mqttURL": args.mqtt_host,
+            "mqttPort": args.mqtt_port,
+        }
+    OUTPUT_PROFILE = args.profile
+    if args.render_cache_dir != render_cache.cache_dir:
+        render_cache = RenderCache(max_bytes=RENDER_CACHE_MAX_BYTES, cache_dir=args.render_cache_dir,
+                                   max_disk_bytes=RENDER_CACHE_DISK_MAX_BYTES)
+    if args.zones:
+        config = load_zones(args.zones)
+    elif ZONES:
+        config = parse_zones(ZONES)
+    else:
+        config = [{"name": "default", "pipe": args.pipe, "displays": args.display or DISPLAYS, "lights": None,
+                   "pironman": args.pironman}]
+
+    render_pool = RenderPool(workers=RENDER_WORKERS)
+    # every zone's lights are on the same Zigbee mesh
+    mesh = TokenBucket(LIGHT_MESH_RATE, burst=LIGHT_MESH_RATE)
+    zones = [build_zone(z["name"], z["pipe"], z["displays"], z["lights"], z["pironman"], args, mqttConfig, mesh)
+             for z in config]
+    for zone in zones:
+        for target in zone.matrix.targets:
+            print(f"{zone_label(zone)}🖥️ Display {target.name}: {target.transport.host}:{target.transport.port} ({target.profile.name})")
+
+    # stage timings are off unless asked for, the timers are no-ops then
+    if args.metrics_port or args.metrics_log:
+        metrics.configure(jsonl_path=args.metrics_log, port=args.metrics_port)
+        metrics.register_gauges("render_cache", render_cache.stats)
+        metrics.register_gauges("render_pool", render_pool.stats)
+        for zone in zones:
+            # gauge names stay as they were with a single zone
+            prefix = "" if len(zones) == 1 else re.sub(r"\W", "_", zone.name) + "_"
+            for target in zone.matrix.targets:
+                metrics.register_gauges(prefix + "matrix_" + re.sub(r"\W", "_", target.name), target.transport.stats)
+            metrics.register_gauges(prefix + "light_group", zone.lights.stats)
+            for backend in zone.lights.backends:
+                metrics.register_gauges(prefix + backend.name, backend.stats)
+                if getattr(backend, "scheduler", None) is not None:
+                    metrics.register_gauges(prefix + "light_scheduler", backend.scheduler.stats)
+            metrics.register_gauges(prefix + "pipeline", zone.pipeline.stats)
+            metrics.register_gauges(prefix + "stream_reset", zone.resets.stats)
+        if args.metrics_port:
+            print(f"📈 Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+
+def handle_item(zone, typ, code, data):
+    """Apply one metadata item from a zone's pipe to that zone's track state"""
+    global LAST_SENT
+    track_state = zone.track_state
+    pipeline = zone.pipeline
+    new_image = False
+
+    # ========== METADATA ==========
+
+    if typ == "core" and code == "asal":
+        try:
+            new_album = data.decode(errors="ignore")
+            if new_album != track_state["album"]:
+                track_state["album"] = new_album
+                track_state["sent"] = False  # new album → allow resend
+        except:
+            track_state["album"] = None
+
+    elif typ == "ssnc" and code == "PICT":
+        if len(data) == 0:
+            announce(zone, {"image": ""})
+            return
+
+        startup.mark("first PICT")
+        if isinstance(data, Artwork):
+            # streamed: hashed and its header read while it came off the pipe
+            debug(f"{zone_label(zone)}artwork: {data}")
+            img_hash, mime, data = data.md5, data.mime or guessImageMime(data.data), data.data
+        else:
+            mime = guessImageMime(data)
+            img_hash = hashlib.md5(data).hexdigest()
+        ext = {
+            'image/jpeg': '.jpg',
+            'image/png': '.png'
+        }.get(mime, '.jpg')
+
+        if img_hash != track_state.get("image_hash"):
+            track_state["image_data"] = data
+            track_state["image_extension"] = ext
+            track_state["image_hash"] = img_hash
+            track_state["image_time"] = time.monotonic()
+            track_state["sent"] = False  # image changed → resend
+            new_image = True
+            announce(zone, {"image": f"data:{mime}"})
+
+    # ====== Playback started/resumed/progressed ======
+    elif typ == "ssnc" and code in ["pbeg", "prsm", "prgr"]:
+        track_state["ready"] = True
+        # playback is back before the cleanup ran, keep the lights and the artwork as they are
+        if zone.resets.cancel():
+            zone.matrix.cancel_clear()
+            zone.lights.cancel()
+            debug(f"{zone_label(zone)}Stream reset cancelled, playback resumed")
+        elif zone.reset_pending:
+            # the reset ran to the end and put the lights back, the next track snapshots them again
+            zone.have_snapshot = False
+        zone.reset_pending = False
+        if not zone.have_snapshot:
+            print(f"{zone_label(zone)}🎛️ Snapshotting light states...")
+            # grabs ON/OFF + brightness + color/ct per device on the lights worker, the broker
+            # may take seconds to answer and this thread reads every zone's pipe
+            zone.pipeline.snapshot_lights()
+            zone.have_snapshot = True
+    # ====== Track ended/flushed/reset ======
+    elif typ == "ssnc" and code in ["pend", "pfls"]:
+        print(f"{zone_label(zone)}🧼 Stream reset: {code}")
+        pipeline.cancel()
+        track_state = zone.track_state = new_track_state()
+        # lights, display and files are reset in the background, cancelled if playback resumes first
+        steps = []
+        if zone.have_snapshot:
+            steps.append(("restore_lights", functools.partial(restore_lights, zone)))
+        steps.append(("clear_matrix", functools.partial(clear_matrix_artwork, zone)))
+        if WRITE_ARTWORK:
+            steps.append(("delete_artwork", delete_artwork))
+        zone.resets.schedule(steps)
+        zone.reset_pending = True
+        announce(zone, {})
+
+    # ========== Ready to Send Image? ==========
+
+    if (
+        track_state["ready"]
+        and not track_state["sent"]
+        and track_state["album"]
+        and track_state["image_data"]
+    ):
+        file_name = f"{track_state['album'].lower().replace(' ', '_')}{track_state['image_extension']}"
+        print(f"{zone_label(zone)}📤 Sending {file_name}...")
+        pipeline.submit({
+            "hash": track_state["image_hash"],
+            "name": file_name,
+            "data": track_state["image_data"],
+            "created": track_state["image_time"],
+        })
+        debug(f"{zone_label(zone)}pipeline: {pipeline.stats()}")
+
+        LAST_SENT = track_state["album"]
+        track_state["sent"] = True
+
+    # not ready to show it yet, render it now so it can go out the moment playback starts
+    elif PRERENDER and new_image:
+        pipeline.prerender({
+            "hash": track_state["image_hash"],
+            "name": f"{track_state['image_hash']}{track_state['image_extension']}",
+            "data": track_state["image_data"],
+            "created": track_state["image_time"],
+        })
+
+def main(argv=None):
+    args = parse_args(argv)
+    startup.mark("imports done")
+
+    setup(args)
+    for zone in zones:
+        if not os.path.exists(zone.pipe):
+            raise FileNotFoundError(f"{zone.pipe} does not exist")
+    threading.Thread(target=preload_render_modules, name="preload", daemon=True).start()
+
+    # open the MQTT sessions up front so the light state mirrors are warm by the first pbeg
+    for zone in zones:
+        zone.lights.connect()
+    startup.mark("mqtt connected")
+    render_pool.start()
+    for zone in zones:
+        if args.startup_profile:
+            zone.pipeline.on_frame_sent = first_frame_sent
+        zone.pipeline.start()
+        zone.track_state = new_track_state()
+
+    # one reader for every zone's pipe, items go to the zone they came from
+    stream = stream_artwork if STREAM_ARTWORK else None
+    for zone, typ, code, data in read_pipes({zone: zone.pipe for zone in zones}, stream=stream,
+                                            max_payload=args.max_artwork_bytes):
+        handle_item(zone, typ, code, data)
+
+if __name__ == "__main__":
+    main()
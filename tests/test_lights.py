@@ -0,0 +1,60 @@
+"""ControlLights' state mirror and LightScheduler against benchmarks.fakeBroker"""
+import time
+import pytest
+from benchmarks.fakeBroker import FakeBroker
+from utils.controlLights import ControlLights
+from utils.lightScheduler import LightScheduler
+
+# slow enough that a command is still unreported when the next one goes out
+DEVICE_DELAY = 0.3
+RED, BLUE = (255, 0, 0), (0, 0, 255)
+
+@pytest.fixture
+def broker():
+    with FakeBroker(device_delay=DEVICE_DELAY) as broker:
+        yield broker
+
+@pytest.fixture
+def lights(broker):
+    config = {"mqttUsername": "test", "mqttPassword": "test", "mqttURL": broker.host, "mqttPort": broker.port}
+    lights = ControlLights(rgb=(0, 0, 0), mqttConfig=config)
+    lights.scheduler = LightScheduler(lights, lights.publish_all).start()
+    assert lights.connect(), "could not connect to broker stand-in"
+    yield lights
+    lights.close()
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+def color(state):
+    return (state or {}).get("color")
+
+def test_mirror_matches_after_red_blue_red(broker, lights):
+    lights.snapshot_states()
+    lights.set_color(RED)
+    assert wait_until(lambda: all(color(lights.curr_state.get(dev)) == {"r": 255, "g": 0, "b": 0}
+                                  for dev in lights.devices))
+    # blue and red again before the devices report blue
+    lights.set_color(BLUE)
+    time.sleep(0.02)
+    lights.set_color(RED)
+    time.sleep(DEVICE_DELAY + 1.5)
+    for dev in lights.devices:
+        assert color(broker.device_state.get(dev)) == {"r": 255, "g": 0, "b": 0}
+        assert lights.curr_state.get(dev) == broker.device_state.get(dev)
+
+def test_restore_after_track_stop_track_stop(broker, lights):
+    # the second snapshot comes while the first restore is still unreported
+    for rgb in (RED, BLUE):
+        lights.snapshot()
+        lights.set_color(rgb)
+        time.sleep(DEVICE_DELAY + 1.0)
+        lights.restore()
+        time.sleep(0.05)
+    time.sleep(DEVICE_DELAY + 2.5)
+    for dev in lights.devices:
+        assert str(broker.device_state.get(dev, {}).get("state")).upper() == "OFF"
+        assert lights.curr_state.get(dev) == broker.device_state.get(dev)
@@ -0,0 +1,40 @@
+"""utils.paletteExtractor against the cv2 + scikit-learn path it replaced, see benchmarks.paletteBench"""
+import contextlib
+import io
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("cv2")
+pytest.importorskip("sklearn")
+pytest.importorskip("threadpoolctl")
+
+from benchmarks.paletteBench import sklearn_palette, synthetic_corpus
+from utils.imageProcessor import ImageProcessor
+from utils.paletteExtractor import PALETTE_SIZE, area_upscale
+
+COVERS = list(synthetic_corpus())
+
+def load(img):
+    """A cover at 32x32, the way the main loop loads it"""
+    ip = ImageProcessor()
+    ip.img = img.resize((32, 32), Image.LANCZOS).convert("RGB")
+    ip.np_image = np.array(ip.img)
+    return ip
+
+@pytest.mark.parametrize("name, img", COVERS, ids=[name for name, _ in COVERS])
+def test_upscale_matches_cv2(name, img):
+    import cv2
+    np_img = load(img).np_image
+    expected = cv2.resize(np_img, (PALETTE_SIZE, PALETTE_SIZE), interpolation=cv2.INTER_AREA)
+    assert np.array_equal(area_upscale(np_img, PALETTE_SIZE, PALETTE_SIZE), expected)
+
+@pytest.mark.parametrize("name, img", COVERS, ids=[name for name, _ in COVERS])
+def test_palette_matches_sklearn(name, img):
+    ip = load(img)
+    with contextlib.redirect_stdout(io.StringIO()):
+        colors, counts = ip.palette()
+        old_colors, old_counts = sklearn_palette(ip.np_image)
+        assert ip.choose_light_color(colors) == ip.choose_light_color(old_colors)
+    assert np.array_equal(colors, old_colors)
+    assert np.array_equal(counts, old_counts)
@@ -0,0 +1,42 @@
+"""StreamReset: the pend/pfls cleanup waits out its grace period and a prsm inside it cancels it"""
+import threading
+import time
+from utils.streamReset import StreamReset
+
+GRACE = 0.3
+
+def steps(ran):
+    return [(name, lambda name=name: ran.append(name)) for name in ("restore_lights", "clear_matrix")]
+
+def test_prsm_within_grace_cancels_reset():
+    resets = StreamReset(grace=GRACE)
+    ran = []
+    resets.schedule(steps(ran))
+    time.sleep(GRACE / 3)
+    # what handle_item does when playback resumes
+    assert resets.cancel()
+    time.sleep(GRACE * 2)
+    resets.close()
+    assert ran == []
+    stats = resets.stats()
+    assert stats["cancelled"] == 1
+    assert stats["completed"] == 0
+    assert not stats["pending"]
+
+def test_reset_runs_after_grace():
+    resets = StreamReset(grace=GRACE)
+    done = threading.Event()
+    ran = []
+    resets.schedule(steps(ran) + [("done", done.set)])
+    start = time.monotonic()
+    assert done.wait(GRACE + 2)
+    assert time.monotonic() - start >= GRACE
+    assert ran == ["restore_lights", "clear_matrix"]
+    # the worker marks the reset done right after its last step
+    deadline = time.monotonic() + 1
+    while resets.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # nothing is left for a later prsm to cancel
+    assert not resets.cancel()
+    resets.close()
+    assert resets.stats()["completed"] == 1
@@ -0,0 +1,81 @@
+import hashlib
+import io
+
+# enough for the PNG header and a JPEG's markers up to its frame header in almost every cover
+HEADER_SNIFF_BYTES = 64 * 1024
+
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+
+class Artwork:
+    """
+    A PICT payload read through ArtworkStream: the raw image bytes, their md5
+    and the format and size PIL found in the header (None if it couldn't tell,
+    mime is None then too).
+    """
+    def __init__(self, data, md5, format=None, size=None):
+        self.data = data
+        self.md5 = md5
+        self.format = format
+        self.size = size
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"Artwork({self.md5}, {len(self.data)} bytes, {self.format}, {self.size})"
+
+    @property
+    def mime(self):
+        return MIME_TYPES.get(self.format)
+
+class ArtworkStream:
+    """
+    Collects a PICT payload as MetadataParser decodes it, chunk by chunk.
+
+    Every chunk goes into the md5 and one growing buffer, so the image bytes
+    are held once and the hash is ready when the last chunk arrives. The first
+    HEADER_SNIFF_BYTES also go to a PIL ImageFile.Parser to read the format
+    and size. It's dropped as soon as it knows them: for PNG and JPEG the
+    parser can't decode incrementally and would only keep a second copy.
+    """
+    def __init__(self):
+        # PIL stays out of startup, preload_render_modules has usually imported it by the first PICT
+        from PIL import ImageFile
+        self._buf = io.BytesIO()
+        self._md5 = hashlib.md5()
+        self._sniffer = ImageFile.Parser()
+        self.format = None
+        self.size = None
+
+    def _sniff(self, chunk):
+        room = HEADER_SNIFF_BYTES - self._buf.tell() + len(chunk)
+        try:
+            self._sniffer.feed(bytes(chunk[:room]))
+        except Exception:
+            # not an image PIL can open, or one it refuses
+            self._sniffer = None
+            return
+        image = self._sniffer.image
+        if image is not None:
+            self.format, self.size = image.format, image.size
+            self._sniffer = None
+        elif room <= len(chunk):
+            self._sniffer = None
+
+    def write(self, chunk):
+        self._buf.write(chunk)
+        self._md5.update(chunk)
+        if self._sniffer is not None:
+            self._sniff(chunk)
+
+    def close(self):
+        """The finished Artwork, getvalue() hands over the buffer without copying it"""
+        data = self._buf.getvalue()
+        self._buf = self._sniffer = None
+        return Artwork(data, self._md5.hexdigest(), self.format, self.size)
+
+def stream_artwork(typ, code, length):
+    """MetadataParser stream hook: PICT payloads go through an ArtworkStream, everything else is buffered"""
+    if typ == "ssnc" and code == "PICT" and length > 0:
+        return ArtworkStream()
+    return None
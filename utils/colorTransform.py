@@ -0,0 +1,97 @@
+import threading
+import numpy as np
+
+# ITU-R 601-2 luma in 16.16 fixed point, what PIL's convert("L") uses. The
+# sums stay below 2**24, so float32 holds them exactly and the dot product
+# can go through BLAS
+LUMA_WEIGHTS = np.array([19595, 38470, 7471], dtype=np.float32)
+
+def _luma(rgb):
+    """PIL's L channel of an RGB array holding whole numbers 0..255, as float32"""
+    luma = rgb @ LUMA_WEIGHTS
+    luma += 0x8000
+    luma *= 1 / 65536
+    return np.floor(luma, out=luma)
+
+class ColorTransform:
+    """
+    Saturation, brightness, contrast and LED gamma in one go, matching the
+    PIL ImageEnhance.Color -> Brightness -> Contrast chain.
+
+    Brightness, contrast and gamma only depend on a channel's own value, so
+    they are folded into one table per contrast mean: table[mean][value].
+    Saturation mixes the channels with the pixel's luma and is done as one
+    blend in float32 before the lookup. The tables are built once per
+    settings (see get_transform) and the work buffers are kept per thread
+    and shape, so apply() doesn't allocate after the first image.
+    """
+    def __init__(self, saturation=1.5, brightness=0.4, contrast=1.5, gamma=1.0):
+        self.saturation = float(saturation)
+        self.brightness = float(brightness)
+        self.contrast = float(contrast)
+        self.gamma = float(gamma)
+
+        values = np.arange(256, dtype=np.float32)
+        # PIL blends in float and truncates, blend(black, img, b) for brightness
+        self.brightness_table = np.clip(np.float32(self.brightness) * values, 0, 255).astype(np.uint8)
+        means = np.arange(256, dtype=np.float32)[:, None]
+        bright = self.brightness_table.astype(np.float32)[None, :]
+        contrasted = np.clip(means + np.float32(self.contrast) * (bright - means), 0, 255).astype(np.uint8)
+        if self.gamma != 1.0:
+            curve = np.round(255 * (values / 255) ** self.gamma).astype(np.uint8)
+            contrasted = curve[contrasted]
+        self.table = contrasted       # (contrast mean, value) -> output value
+        self._buffers = threading.local()
+
+    def _work(self, shape):
+        """float32 scratch, uint8 index and uint8 output arrays for this thread and shape"""
+        buffers = self._buffers.__dict__
+        if buffers.get("shape") != shape:
+            buffers["shape"] = shape
+            buffers["work"] = np.empty(shape, dtype=np.float32)
+            buffers["index"] = np.empty(shape, dtype=np.uint8)
+            buffers["out"] = np.empty(shape, dtype=np.uint8)
+        return buffers["work"], buffers["index"], buffers["out"]
+
+    def apply(self, img_np):
+        """
+        Transform an RGB uint8 array. Returns a buffer owned by this thread
+        that is overwritten by the next apply() of the same shape.
+        """
+        work, index, out = self._work(img_np.shape)
+        if self.saturation != 1.0:
+            # blend(gray, img, s) = luma + s * (value - luma)
+            work[...] = img_np
+            luma = _luma(work)
+            # one channel at a time, numpy broadcasts (h, w, 1) over (h, w, 3) slowly
+            channels = [work[..., c] for c in range(3)]
+            for channel in channels:
+                channel -= luma
+            work *= np.float32(self.saturation)
+            for channel in channels:
+                channel += luma
+            np.clip(work, 0, 255, out=work)
+            index[...] = work
+        else:
+            index[...] = img_np
+
+        mean = 0
+        if self.contrast != 1.0:
+            # PIL's Contrast blends towards the mean luma of the brightened image
+            np.take(self.brightness_table, index, out=out)
+            work[...] = out
+            mean = int(_luma(work).mean() + 0.5)
+        np.take(self.table[mean], index, out=out)
+        return out
+
+_transforms = {}
+_transforms_lock = threading.Lock()
+
+def get_transform(saturation=1.5, brightness=0.4, contrast=1.5, gamma=1.0):
+    """Shared ColorTransform for these settings, the tables are built on first use"""
+    key = (float(saturation), float(brightness), float(contrast), float(gamma))
+    with _transforms_lock:
+        transform = _transforms.get(key)
+        if transform is None:
+            transform = _transforms[key] = ColorTransform(*key)
+        return transform
@@ -3,37 +3,166 @@ import time
 import json
 import threading
 import paho.mqtt.client as mqtt
-import requests
-from . import credentials
+from .metrics import metrics
+from .lightBackends import LightBackend
+from .lightScheduler import payload_matches
+try:
+    from . import credentials
+except ImportError:
+    # credentials.py is kept out of the repo, pass mqttConfig explicitly without it
+    credentials = None
 
-class ControlLights:
-    def __init__(self, rgb):
+DEFAULT_TOPICS = [
+    "zigbee2mqtt/playbar1/set",
+    "zigbee2mqtt/playbar2/set",
+    "zigbee2mqtt/Desk/set",
+    "zigbee2mqtt/bedLeft/set",
+    "zigbee2mqtt/bedRight/set"
+]
+# seconds a restore may go unreported before snapshots trust the state mirror again
+RESTORE_CONFIRM_TIMEOUT = 10.0
+
+class ControlLights(LightBackend):
+    name = "lights"
+
+    def __init__(self, rgb, mqttConfig=None, connect_timeout=5.0, publish_timeout=2.0, topics=None):
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         self.rgb = rgb
         self.enable_rgb = False
         self.curr_state = {}   # device -> last known payload from zigbee2mqtt/<device>
         self._snapshots = {}   # device -> snapshot to restore later
+        self._restoring = {}   # device -> (snapshot, /set payload) restored but not reported back yet
+        self._restored_at = 0.0
+        self.connect_timeout = connect_timeout
+        self.publish_timeout = publish_timeout
+
+        if mqttConfig is None:
+            if credentials is None:
+                raise ValueError("utils/credentials.py not found and no mqttConfig given")
+            mqttConfig = {
+                "mqttUsername": credentials.coordinatorUsername,
+                "mqttPassword": credentials.coordinatorPassword,
+                "mqttURL": credentials.coordinatorURL,
+                "mqttPort": credentials.coordinatorPort,
+            }
+        self.mqttConfig = {"topics": list(DEFAULT_TOPICS), **mqttConfig}
+        if topics:
+            # a zone's own light group
+            self.mqttConfig["topics"] = list(topics)
+        self.devices = [self._device_name_from_topic(t) for t in self.mqttConfig["topics"]]
+
+        # persistent session state
+        self._state_cond = threading.Condition()
+        self._connected = threading.Event()
+        self._started = False
+        # optional LightScheduler, /set commands are queued through it when set
+        self.scheduler = None
+
+        # publish metrics
+        self.publishes = 0
+        self.publish_failures = 0
+        self.last_publish_latency = None
+        self.max_publish_latency = 0.0
+        self._total_publish_latency = 0.0
+
+    # ---------- persistent session ----------
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"MQTT connect failed: {reason_code}")
+            return
+        # (re)subscribe on every connect so the state mirror survives reconnects
+        client.subscribe([(f"zigbee2mqtt/{dev}", 0) for dev in self.devices])
+        self._connected.set()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self._connected.clear()
+        if reason_code.is_failure:
+            print(f"MQTT disconnected: {reason_code}, reconnecting...")
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            payload = json.loads(msg.payload.decode("utf-8"))
+        except Exception:
+            return
+        if not isinstance(payload, dict):
+            return
+        device = self._device_name_from_topic(msg.topic)
+        with self._state_cond:
+            # zigbee2mqtt may publish partial updates, merge into the mirror
+            self.curr_state[device] = {**self.curr_state.get(device, {}), **payload}
+            self._state_cond.notify_all()
+
+    def connect(self):
+        """Start the persistent MQTT session, returns True once connected"""
+        if not self._started:
+            self.client.username_pw_set(self.mqttConfig["mqttUsername"], self.mqttConfig["mqttPassword"])
+            self.client.on_connect = self._on_connect
+            self.client.on_disconnect = self._on_disconnect
+            self.client.on_message = self._on_message
+            self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+            self.client.connect_async(self.mqttConfig["mqttURL"], self.mqttConfig["mqttPort"], 60)
+            self.client.loop_start()
+            self._started = True
+        return self._connected.wait(self.connect_timeout)
 
-        self.mqttConfig = {
-            "mqttUsername": credentials.coordinatorUsername,
-            "mqttPassword": credentials.coordinatorPassword,
-            "mqttURL": credentials.coordinatorURL,
-            "mqttPort": credentials.coordinatorPort,
-            "topics": [
-                "zigbee2mqtt/playbar1/set",
-                "zigbee2mqtt/playbar2/set",
-                "zigbee2mqtt/Desk/set",
-                "zigbee2mqtt/bedLeft/set",
-                "zigbee2mqtt/bedRight/set"
-            ]
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.close()
+        if self._started:
+            self.client.disconnect()
+            self.client.loop_stop()
+            self._started = False
+            self._connected.clear()
+
+    def publish_all(self, messages):
+        """Publish (topic, payload) pairs now on the open session and wait for them to go out, True if all did"""
+        if not self.connect():
+            print("MQTT not connected, dropping publish")
+            self.publish_failures += len(messages)
+            return False
+        sent = []
+        for topic, payload in messages:
+            sent.append((time.monotonic(), self.client.publish(topic, json.dumps(payload))))
+        ok = True
+        for start, info in sent:
+            try:
+                info.wait_for_publish(self.publish_timeout)
+            except (ValueError, RuntimeError) as e:
+                print(f"MQTT publish failed: {e}")
+                self.publish_failures += 1
+                ok = False
+                continue
+            if not info.is_published():
+                self.publish_failures += 1
+                ok = False
+                continue
+            latency = time.monotonic() - start
+            metrics.observe("mqtt_publish", latency)
+            self.publishes += 1
+            self.last_publish_latency = latency
+            self.max_publish_latency = max(self.max_publish_latency, latency)
+            self._total_publish_latency += latency
+        return ok
+
+    def _dispatch(self, messages):
+        """Send /set commands through the scheduler if there is one, else publish them now"""
+        if self.scheduler is not None:
+            self.scheduler.submit_all(messages)
+            return True
+        return self.publish_all(messages)
+
+    def stats(self):
+        return {
+            "connected": self._connected.is_set(),
+            "publishes": self.publishes,
+            "publish_failures": self.publish_failures,
+            "last_publish_latency_ms": None if self.last_publish_latency is None else self.last_publish_latency * 1000,
+            "avg_publish_latency_ms": self._total_publish_latency / self.publishes * 1000 if self.publishes else None,
+            "max_publish_latency_ms": self.max_publish_latency * 1000,
+            "devices_mirrored": len(self.curr_state),
         }
 
     # ---------- helpers ----------
-    def _new_client(self):
-        c = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        c.username_pw_set(self.mqttConfig["mqttUsername"], self.mqttConfig["mqttPassword"])
-        c.connect(self.mqttConfig["mqttURL"], self.mqttConfig["mqttPort"], 60)
-        return c
 
     def _device_name_from_topic(self, topic: str) -> str:
         # "zigbee2mqtt/<name>/set"  -> <name>
@@ -44,59 +173,52 @@ class ControlLights:
     # ---------- state snapshot / restore ----------
     def snapshot_states(self, timeout_sec: float = 2.5):
         """
-        Ask each device for its current state and cache it in self._snapshots.
+        Copy the live state mirror into self._snapshots.
+        Only devices that haven't reported yet are asked for a fresh report,
+        so once the session is warm this doesn't wait at all.
+        A device whose last restore hasn't shown up in the mirror yet keeps
+        the snapshot it was restored to: the mirror may still show the
+        artwork color we set, and that must never become the user's state.
         """
-        # map: device -> event for response
-        pending = {}
-        responses_lock = threading.Lock()
+        devices = self.devices
+        self.connect()
 
-        def on_message(client, userdata, msg):
-            try:
-                payload = json.loads(msg.payload.decode("utf-8"))
-            except Exception:
-                return
-            device = self._device_name_from_topic(msg.topic)
-            # Persist last known state
-            with responses_lock:
-                self.curr_state[device] = payload
-                if device in pending:
-                    pending[device].set()
-
-        client = self._new_client()
-        client.on_message = on_message
-
-        # Subscribe to all device state topics (without /set)
-        devices = [self._device_name_from_topic(t.replace("/set", "")) for t in self.mqttConfig["topics"]]
-        for dev in devices:
-            client.subscribe(f"zigbee2mqtt/{dev}")
+        with self._state_cond:
+            missing = [dev for dev in devices if dev not in self.curr_state]
 
-        client.loop_start()
-
-        # Request a fresh report for state/brightness/color
-        # Zigbee2MQTT supports /get topic; sending keys with empty strings requests a report.
-        for dev in devices:
-            pending[dev] = threading.Event()
-            client.publish(f"zigbee2mqtt/{dev}/get", json.dumps({
+        if missing:
+            # Zigbee2MQTT supports /get topic; sending keys with empty strings requests a report.
+            self.publish_all([(f"zigbee2mqtt/{dev}/get", {
                 "state": "",
                 "brightness": "",
                 "color": "",
                 "color_temp": ""
-            }))
+            }) for dev in missing])
 
-        # Wait for responses up to timeout
-        deadline = time.time() + timeout_sec
-        for dev, ev in pending.items():
-            remaining = max(0, deadline - time.time())
-            ev.wait(remaining)
+            # Wait for responses up to timeout
+            deadline = time.monotonic() + timeout_sec
+            with self._state_cond:
+                self._state_cond.wait_for(
+                    lambda: all(dev in self.curr_state for dev in missing),
+                    max(0, deadline - time.monotonic())
+                )
 
-        client.loop_stop()
-        client.disconnect()
+        with self._state_cond:
+            current = {dev: dict(self.curr_state[dev]) for dev in devices if dev in self.curr_state}
+            restoring = self._restoring
+            if time.monotonic() - self._restored_at > RESTORE_CONFIRM_TIMEOUT:
+                restoring.clear()
+            for dev, (snap, sent) in list(restoring.items()):
+                if payload_matches(sent, current.get(dev)):
+                    del restoring[dev]
 
         # Build snapshots (only for those we actually got)
         snaps = {}
         for dev in devices:
-            if dev in self.curr_state:
-                p = self.curr_state[dev]
+            if dev in restoring:
+                snaps[dev] = restoring[dev][0]
+            elif dev in current:
+                p = current[dev]
                 snap = {
                     "state": p.get("state", "OFF"),
                 }
@@ -125,9 +247,7 @@ class ControlLights:
             print("No snapshots to restore.")
             return
 
-        client = self._new_client()
-        client.loop_start()
-        infos = []
+        messages, restoring = [], {}
         for set_topic in self.mqttConfig["topics"]:
             dev = self._device_name_from_topic(set_topic)
             payload = self._snapshots.get(dev)
@@ -135,7 +255,7 @@ class ControlLights:
                 continue
             # If device was OFF, only send OFF (don’t change brightness/color)
             if str(payload.get("state", "OFF")).upper() == "OFF":
-                infos.append(client.publish(set_topic, json.dumps({"state": "OFF"})))
+                messages.append((set_topic, {"state": "OFF"}))
             else:
                 # If it was ON, send state + brightness + either color or color_temp
                 to_send = {"state": "ON"}
@@ -145,32 +265,36 @@ class ControlLights:
                     to_send["color"] = payload["color"]
                 elif "color_temp" in payload:
                     to_send["color_temp"] = payload["color_temp"]
-                infos.append(client.publish(set_topic, json.dumps(to_send)))
+                messages.append((set_topic, to_send))
+            restoring[dev] = (payload, messages[-1][1])
+
+        with self._state_cond:
+            self._restoring = restoring
+            self._restored_at = time.monotonic()
+        self._dispatch(messages)
+
+    # ---------- LightBackend ----------
+    def set_color(self, rgb):
+        self.rgb = rgb
+        self.enable_rgb = True
+        return self.publish_commands()
+
+    def snapshot(self):
+        self.snapshot_states()
+
+    def restore(self):
+        self.restore_states()
 
-        for info in infos:
-            info.wait_for_publish()
-        client.loop_stop()
-        client.disconnect()
+    def cancel(self):
+        return self.scheduler.cancel() if self.scheduler is not None else 0
 
     def send_command(self, topic, payload):
-        client = self._new_client()
-        client.loop_start()
-        info = client.publish(topic, json.dumps(payload))
-        info.wait_for_publish()
-        time.sleep(0.2)
-        client.loop_stop()
-        client.disconnect()
+        return self._dispatch([(topic, payload)])
 
     def publish_commands(self):
         payload = self.format_rgb_phillips_hue(self.rgb)
         print(f"setting playbars to: {payload}")
-        client = self._new_client()
-        client.loop_start()
-        infos = [client.publish(t, json.dumps(payload)) for t in self.mqttConfig["topics"]]
-        for info in infos:
-            info.wait_for_publish()
-        client.loop_stop()
-        client.disconnect()
+        return self._dispatch([(t, payload) for t in self.mqttConfig["topics"]])
 
     def format_rgb_phillips_hue(self, rgb, brightness=255):
         try:
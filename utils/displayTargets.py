@@ -0,0 +1,90 @@
+import threading
+from .matrixTransport import MatrixTransport
+from .outputProfiles import DEFAULT_PROFILE, FrameEncoder, get_profile
+
+DEFAULT_PORT = 9090
+
+class DisplayTarget:
+    """One matrix display: where it is, which output profile it takes and its own sender"""
+    def __init__(self, name, host, port=DEFAULT_PORT, profile=DEFAULT_PROFILE, **transport_options):
+        self.name = name
+        self.profile = get_profile(profile)
+        self.transport = MatrixTransport(host, port, encoder=FrameEncoder(self.profile), name=name,
+                                         **transport_options)
+
+    def __repr__(self):
+        return f"DisplayTarget({self.name!r}, {self.transport.host}:{self.transport.port}, {self.profile.name})"
+
+def parse_target(spec, default_profile=DEFAULT_PROFILE, **transport_options):
+    """
+    Build a target from "[NAME=]HOST[:PORT][/PROFILE]", e.g.
+    "kitchen=matrix-kitchen.lan:9090/matrix64". NAME defaults to HOST.
+    transport_options go to its MatrixTransport.
+    """
+    name, _, rest = spec.rpartition("=")
+    rest, _, profile = rest.partition("/")
+    host, _, port = rest.partition(":")
+    if not host:
+        raise ValueError(f"display target without a host: {spec!r}")
+    return DisplayTarget(name or host, host, int(port) if port else DEFAULT_PORT, profile or default_profile,
+                         **transport_options)
+
+class DisplayGroup:
+    """
+    Fans frames out to several displays.
+
+    Every target has its own MatrixTransport, so a slow or offline panel only
+    holds up its own queue. send() takes a dict of frames keyed by profile
+    name, rendered once per profile and shared by the targets using it.
+    """
+    def __init__(self, targets):
+        if not targets:
+            raise ValueError("DisplayGroup needs at least one target")
+        names = [t.name for t in targets]
+        if len(set(names)) != len(names):
+            raise ValueError(f"display target names must be unique: {names}")
+        self.targets = list(targets)
+
+    @property
+    def profiles(self):
+        """Distinct output profiles in target order, each needs one render"""
+        seen = {}
+        for target in self.targets:
+            seen.setdefault(target.profile.name, target.profile)
+        return list(seen.values())
+
+    def send(self, frames, on_sent=None):
+        """
+        Queue frames on every target. on_sent is called once, with the time
+        the first target got its frame on the wire.
+        """
+        if on_sent is not None:
+            lock = threading.Lock()
+            fired = []
+
+            def first_sent(sent_at):
+                with lock:
+                    if fired:
+                        return
+                    fired.append(sent_at)
+                on_sent(sent_at)
+        else:
+            first_sent = None
+        for target in self.targets:
+            target.transport.send(frames[target.profile.name], on_sent=first_sent)
+
+    def clear(self):
+        """Queue an artwork reset on every display, each runs on its own sender"""
+        for target in self.targets:
+            target.transport.clear()
+
+    def cancel_clear(self):
+        """Call off resets on every display, see MatrixTransport.cancel_clear, True if there were any"""
+        return any([target.transport.cancel_clear() for target in self.targets])
+
+    def close(self):
+        for target in self.targets:
+            target.transport.close()
+
+    def stats(self):
+        return {target.name: target.transport.stats() for target in self.targets}
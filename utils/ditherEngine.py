@@ -0,0 +1,119 @@
+from array import array
+import numpy as np
+
+# dither modes accepted by ImageProcessor.enhance_image
+FLOYD_STEINBERG = "floyd-steinberg"
+BAYER4 = "bayer4"
+BAYER8 = "bayer8"
+NONE = "none"
+
+_BAYER2 = np.array([[0, 2],
+                    [3, 1]])
+
+def _bayer_matrix(n):
+    """Build an n x n Bayer threshold matrix (n must be a power of 2)"""
+    m = _BAYER2
+    while m.shape[0] < n:
+        m = np.block([[4 * m,     4 * m + 2],
+                      [4 * m + 3, 4 * m + 1]])
+    return m
+
+# normalised thresholds in the range (-0.5, 0.5), built once at import
+_BAYER_THRESHOLDS = {
+    BAYER4: ((_bayer_matrix(4) + 0.5) / 16 - 0.5).astype(np.float32),
+    BAYER8: ((_bayer_matrix(8) + 0.5) / 64 - 0.5).astype(np.float32),
+}
+
+def _max_values(color_depth_bits):
+    """Highest level of each channel: one int, or float32 per channel for a tuple of depths such as (3, 3, 2)"""
+    if isinstance(color_depth_bits, int):
+        return 2**color_depth_bits - 1
+    return np.array([2**bits - 1 for bits in color_depth_bits], dtype=np.float32)
+
+def floyd_steinberg(img_np, color_depth_bits=5):
+    """
+    Floyd–Steinberg error diffusion to the given bit depth, one for every
+    channel or a tuple with one per channel.
+
+    Produces byte-identical output to the original per-pixel implementation:
+    the error carried along a row is applied pixel by pixel (it is inherently
+    sequential) using float32 storage, and the error pushed down to the next
+    row is applied to the whole row at once in the same order as before.
+    """
+    height, width, channels = img_np.shape
+    out = img_np.astype(np.float32)
+
+    if isinstance(color_depth_bits, int):
+        color_depth_bits = (color_depth_bits,) * channels
+    # level count and step of every value in a row, channels interleaved
+    max_vals = [2**bits - 1 for bits in color_depth_bits] * width
+    steps = [255 / max_val for max_val in max_vals]
+    row_len = width * channels
+
+    # array('f') rounds every store to float32, matching the numpy buffer
+    row = array('f', bytes(row_len * 4))
+    f32 = array('f', [0.0])
+    err = [0.0] * row_len
+    new = [0.0] * row_len
+
+    for y in range(height):
+        row[:] = array('f', out[y].tobytes())
+        for i in range(row_len):
+            old = row[i]
+            # quantize in float32 exactly like val * max_val / 255 on a np.float32
+            f32[0] = old * max_vals[i]
+            f32[0] = f32[0] / 255
+            new_val = round(f32[0]) * steps[i]
+            new[i] = new_val
+            e = old - new_val
+            err[i] = e
+            if i + channels < row_len:
+                row[i + channels] = row[i + channels] + e * 7 / 16
+
+        out[y] = np.array(new, dtype=np.float64).reshape(width, channels)
+        if y + 1 < height:
+            e = np.array(err, dtype=np.float64).reshape(width, channels)
+            below = out[y + 1].astype(np.float64)
+            # same order as the per-pixel loop: x-1 (1/16), x (5/16), x+1 (3/16)
+            below[1:] = (below[1:] + e[:-1] * 1 / 16).astype(np.float32)
+            below = (below + e * 5 / 16).astype(np.float32).astype(np.float64)
+            below[:-1] = (below[:-1] + e[1:] * 3 / 16).astype(np.float32)
+            out[y + 1] = below
+
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+def ordered(img_np, color_depth_bits=5, size=8):
+    """Ordered (Bayer) dithering using a size x size threshold matrix, size 4 or 8"""
+    if size not in (4, 8):
+        raise ValueError(f"Unsupported Bayer matrix size: {size}")
+    mode = BAYER4 if size == 4 else BAYER8
+    thresholds = _BAYER_THRESHOLDS[mode]
+    height, width, _ = img_np.shape
+
+    max_val = _max_values(color_depth_bits)
+    reps = (-(-height // size), -(-width // size))
+    t = np.tile(thresholds, reps)[:height, :width, None]
+
+    levels = np.floor(img_np.astype(np.float32) * max_val / 255 + 0.5 + t)
+    levels = np.clip(levels, 0, max_val)
+    return (levels * (255 / max_val)).astype(np.uint8)
+
+def quantize(img_np, color_depth_bits=5):
+    """Plain per-channel quantization to the given bit depth without dithering"""
+    max_val = _max_values(color_depth_bits)
+    levels = np.rint(img_np.astype(np.float32) * max_val / 255)
+    return (levels * (255 / max_val)).astype(np.uint8)
+
+def dither(img_np, mode=FLOYD_STEINBERG, color_depth_bits=5):
+    """Dispatch to the dither implementation for the given mode"""
+    if mode == FLOYD_STEINBERG:
+        return floyd_steinberg(img_np, color_depth_bits)
+    if mode == BAYER4:
+        return ordered(img_np, color_depth_bits, size=4)
+    if mode == BAYER8:
+        return ordered(img_np, color_depth_bits, size=8)
+    if mode == NONE or mode is None:
+        return quantize(img_np, color_depth_bits)
+    raise ValueError(f"Unknown dither mode: {mode}")
+
+DITHER_MODES = (FLOYD_STEINBERG, BAYER4, BAYER8, NONE)
@@ -1,93 +1,83 @@
-import cv2
-from sklearn.cluster import KMeans
+import io
 import numpy as np
-from PIL import Image, ImageEnhance
+from PIL import Image
+from . import ditherEngine
+from .colorTransform import get_transform
+from .paletteExtractor import PALETTE_SIZE, area_upscale, extract_palette
+from .metrics import metrics
 
 class ImageProcessor:
-    def __init__(self, imgPath=None):
+    def __init__(self, imgPath=None, imgData=None, width=32, height=32):
+        """imgPath is a file path or file object, imgData raw image bytes or any buffer"""
         self.imgPath = imgPath
+        self.imgData = imgData
         self.img = None
         self.np_image = None
-        if imgPath:
-            self.load_image()
-    def load_image(self, width=32, height=32):
-        self.img = Image.open(self.imgPath).resize((width, height), Image.LANCZOS).convert('RGB')
-        self.np_image = np.array(self.img)
+        if imgPath or imgData is not None:
+            self.load_image(width, height)
+
+    def _open(self):
+        if self.imgData is not None:
+            return Image.open(io.BytesIO(self.imgData))
+        return Image.open(self.imgPath)
 
-    def enhance_image(self, increaseSaturation=True, reduceBrightness=True,increaseContrast=True):
+    def load_image(self, width=32, height=32):
+        with metrics.timer("decode_resize"):
+            img = self._open()
+            # JPEGs can decode straight at 1/2, 1/4 or 1/8 scale, still at least width x height
+            img.draft('RGB', (width, height))
+            self.img = img.resize((width, height), Image.LANCZOS).convert('RGB')
+            self.np_image = np.array(self.img)
+
+    def enhance_image(self, increaseSaturation=True, reduceBrightness=True,increaseContrast=True, ditherMode=ditherEngine.FLOYD_STEINBERG, colorDepthBits=5, gamma=1.0):
         if self.img is None:
             raise ValueError("Image not loaded. Call load_image() first.")
-        img = self.img
-        if increaseSaturation:
-            img = ImageEnhance.Color(img).enhance(1.5)
-        if reduceBrightness:
-            img = ImageEnhance.Brightness(img).enhance(0.4)
-        if increaseContrast:
-            img = ImageEnhance.Contrast(img).enhance(1.5)
-        
-        # dont need to update the image array since this is only to display the image on matrix.
-        # other calculations should be perofrmed from original image
-        img = np.array(img)
-        return self.floyd_steinberg_dither(img)
+        # same result as PIL's ImageEnhance Color(1.5) -> Brightness(0.4) -> Contrast(1.5), in one table lookup
+        transform = get_transform(saturation=1.5 if increaseSaturation else 1.0,
+                                  brightness=0.4 if reduceBrightness else 1.0,
+                                  contrast=1.5 if increaseContrast else 1.0,
+                                  gamma=gamma)
+        with metrics.timer("enhance"):
+            # dont need to update the image array since this is only to display the image on matrix.
+            # other calculations should be perofrmed from original image
+            img = transform.apply(np.asarray(self.img))
+        with metrics.timer("dither"):
+            return ditherEngine.dither(img, ditherMode, colorDepthBits)
 
     def floyd_steinberg_dither(self, img_np, color_depth_bits=5):
         """Apply Floyd–Steinberg dithering to RGB image with specified per-channel bit depth"""
-        height, width, _ = img_np.shape
-        out = img_np.astype(np.float32)
+        return ditherEngine.floyd_steinberg(img_np, color_depth_bits)
+    def palette(self, k=4):
+        """Returns the top k colors of the loaded image and their pixel counts, most frequent first"""
+        np_img = self.np_image.astype(np.uint8)
+        # the same 50x50 upscale the cv2 version clustered, its blended edge pixels change the clusters
+        resized = area_upscale(np_img, PALETTE_SIZE, PALETTE_SIZE)
 
-        max_val = 2**color_depth_bits - 1
-
-        def quantize(val):
-            return round(val * max_val / 255) * (255 / max_val)
-
-        for y in range(height):
-            for x in range(width):
-                old_pixel = out[y, x].copy()
-                new_pixel = np.array([quantize(c) for c in old_pixel])
-                out[y, x] = new_pixel
-                quant_error = old_pixel - new_pixel
-
-                if x + 1 < width:
-                    out[y, x + 1] += quant_error * 7 / 16
-                if y + 1 < height:
-                    if x > 0:
-                        out[y + 1, x - 1] += quant_error * 3 / 16
-                    out[y + 1, x] += quant_error * 5 / 16
-                    if x + 1 < width:
-                        out[y + 1, x + 1] += quant_error * 1 / 16
+        # Reshape to a list of pixels
+        pixel_data = resized.reshape((-1, 3))
+        return extract_palette(pixel_data, k=k)
 
-        return np.clip(out, 0, 255).astype(np.uint8)
     def dominant_color(self, k=4):
         """
         Receives a NumPy image array (RGB format) and k (number of colors to find).
-        Returns the most dominant RGB color using KMeans clustering.
+        Returns the most dominant RGB color using k-means clustering.
 
         """
-        np_img = self.np_image.astype(np.uint8) 
-        # Optional: resize inside here if you want to ensure consistent performance
-        resized = cv2.resize(np_img, (50, 50), interpolation=cv2.INTER_AREA)
-
-        # Reshape to a list of pixels
-        pixel_data = resized.reshape((-1, 3))
-
-        # Apply KMeans clustering
-        kmeans = KMeans(n_clusters=k, random_state=0).fit(pixel_data)
-
-        # Get the colors (cluster centers) and their counts
-        colors = kmeans.cluster_centers_.astype(int)
-        labels = kmeans.labels_
-        counts = np.bincount(labels)
-
-        # Sort by frequency
-        sorted_idx = np.argsort(counts)[::-1]
-        dominant = colors[sorted_idx[0]]
+        with metrics.timer("dominant_color"):
+            colors, counts = self.palette(k)
+            return self.choose_light_color(colors)
+
+    def choose_light_color(self, colors):
+        """Pick the light color from a palette sorted by frequency"""
+        k = len(colors)
+        dominant = colors[0]
         r,g,b = dominant
         valid_colors = {}
         
         
         print(f"Dominant color (RGB): ({r}, {g}, {b})")
-        print(f"Top {k} colors: {colors[sorted_idx]}")
-        for colors in colors[sorted_idx]:
+        print(f"Top {k} colors: {colors}")
+        for colors in colors:
             r,g,b=colors
             variance=self.color_variance((r, g, b))
             
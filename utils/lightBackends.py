@@ -0,0 +1,125 @@
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
+from .metrics import metrics
+
+class LightBackend(ABC):
+    """
+    Something that can show the artwork color: Zigbee lights through
+    ControlLights, the Pironman5 case LEDs, ... The pipeline only calls
+    set_color(); stream start/reset call snapshot(), restore() and cancel().
+    """
+    name = "lights"
+
+    def connect(self):
+        """Open whatever session the backend needs, returns True once it's usable"""
+        return True
+
+    @abstractmethod
+    def set_color(self, rgb):
+        """Show rgb, an (r, g, b) tuple"""
+
+    def snapshot(self):
+        """Remember the current state so restore() can put it back"""
+
+    def restore(self):
+        """Put back what snapshot() saw"""
+
+    def cancel(self):
+        """Drop commands that haven't gone out yet, returns how many"""
+        return 0
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {}
+
+class LightGroup(LightBackend):
+    """
+    Fans light updates out to several backends at once, so an update takes as
+    long as the slowest backend instead of the sum of them. Each backend keeps
+    its own timeouts; the group stops waiting after timeout seconds and
+    leaves a stuck backend to finish on its own.
+    """
+    name = "light_group"
+
+    def __init__(self, backends, timeout=5.0):
+        if not backends:
+            raise ValueError("LightGroup needs at least one backend")
+        self.backends = list(backends)
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=len(self.backends), thread_name_prefix="lights")
+        self.updates = 0
+        self.backend_errors = 0
+        self.timeouts = 0
+        self.last_latency = None
+
+    def _timed(self, backend, fn, *args):
+        start = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            metrics.observe("light_backend", time.monotonic() - start, backend=backend.name)
+
+    def _all(self, what, *args):
+        """Call what on every backend in parallel and wait for them, returns the results by backend name"""
+        if len(self.backends) == 1:
+            # nothing to wait for in parallel, but a failing backend is reported the same way
+            backend = self.backends[0]
+            try:
+                return {backend.name: self._timed(backend, getattr(backend, what), *args)}
+            except Exception as e:
+                print(f"light backend {backend.name} {what} failed: {e}")
+                self.backend_errors += 1
+                return {}
+        futures = {self._pool.submit(self._timed, b, getattr(b, what), *args): b for b in self.backends}
+        done, not_done = wait(futures, timeout=self.timeout)
+        results = {}
+        for future in done:
+            backend = futures[future]
+            try:
+                results[backend.name] = future.result()
+            except Exception as e:
+                print(f"light backend {backend.name} {what} failed: {e}")
+                self.backend_errors += 1
+        for future in not_done:
+            print(f"light backend {futures[future].name} {what} still running after {self.timeout:.1f}s")
+            self.timeouts += 1
+        return results
+
+    # ---------- LightBackend ----------
+    def connect(self):
+        # a backend that failed or timed out has no result
+        results = self._all("connect")
+        return len(results) == len(self.backends) and all(results.values())
+
+    def set_color(self, rgb):
+        start = time.monotonic()
+        self._all("set_color", rgb)
+        self.last_latency = time.monotonic() - start
+        self.updates += 1
+        metrics.observe("light_update", self.last_latency)
+
+    def snapshot(self):
+        self._all("snapshot")
+
+    def restore(self):
+        self._all("restore")
+
+    def cancel(self):
+        return sum(backend.cancel() for backend in self.backends)
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+        self._pool.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            "backends": len(self.backends),
+            "updates": self.updates,
+            "backend_errors": self.backend_errors,
+            "timeouts": self.timeouts,
+            "last_latency_ms": None if self.last_latency is None else self.last_latency * 1000,
+        }
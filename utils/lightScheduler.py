@@ -0,0 +1,236 @@
+import threading
+import time
+from collections import OrderedDict
+from .metrics import metrics
+
+# how far a reported CIE xy color may be from ours and still count as the same color
+XY_TOLERANCE = 0.02
+# seconds a sent command may go without the device reporting it before the mirror is trusted again
+CONFIRM_TIMEOUT = 5.0
+
+def rgb_to_xy(r, g, b):
+    """CIE xy for an sRGB color, the conversion Zigbee2MQTT applies to {"r", "g", "b"}"""
+    def linear(c):
+        c = c / 255
+        return ((c + 0.055) / 1.055) ** 2.4 if c > 0.04045 else c / 12.92
+    r, g, b = linear(r), linear(g), linear(b)
+    x = r * 0.664511 + g * 0.154324 + b * 0.162028
+    y = r * 0.283881 + g * 0.668433 + b * 0.047685
+    z = r * 0.000088 + g * 0.072310 + b * 0.986039
+    total = x + y + z
+    return (x / total, y / total) if total else (0.0, 0.0)
+
+def same_color(wanted, have):
+    """True if a reported color dict is the color we sent"""
+    if all(k in have for k in wanted):
+        return all(have[k] == v for k, v in wanted.items())
+    # zigbee2mqtt usually reports colors as xy, compare there
+    if {"r", "g", "b"} <= wanted.keys() and {"x", "y"} <= have.keys():
+        x, y = rgb_to_xy(wanted["r"], wanted["g"], wanted["b"])
+        return abs(x - have["x"]) <= XY_TOLERANCE and abs(y - have["y"]) <= XY_TOLERANCE
+    return False
+
+def payload_matches(payload, current):
+    """True if a device whose reported state is current has every value in the /set payload"""
+    if not current:
+        return False
+    if "state" in payload and str(current.get("state", "")).upper() != str(payload["state"]).upper():
+        return False
+    # nothing else is visible on a light that is off and stays off
+    if str(payload.get("state", "")).upper() == "OFF":
+        return True
+    for key, value in payload.items():
+        if key in ("state", "transition"):
+            continue
+        have = current.get(key)
+        if key == "color" and isinstance(value, dict) and isinstance(have, dict):
+            if not same_color(value, have):
+                return False
+        elif have != value:
+            return False
+    return True
+
+class TokenBucket:
+    """rate tokens per second, holding at most burst; may be shared by several schedulers"""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # another scheduler may have got here with a later now
+        now = max(now, self.stamp)
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available, 0 if one is now"""
+        with self._lock:
+            self._refill(now)
+            return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        with self._lock:
+            self._refill(now)
+            self.tokens -= 1
+
+class LightScheduler:
+    """
+    Sits between ControlLights and the broker and keeps /set commands from
+    flooding the Zigbee mesh.
+
+    Commands are queued per topic, so a newer command for a device replaces
+    one still waiting (merged). Before sending, a command is checked against
+    the device's curr_state mirror and dropped if the device already has
+    those values (skipped). Until the device reports the last command sent
+    to it, the mirror still shows what it had before, so the command is
+    checked against that last command instead. Sending is paced by a token
+    bucket per device and one for the whole mesh. With transition set,
+    commands carry Zigbee2MQTT's "transition" field so color changes fade.
+    Batches go out through publish, e.g. ControlLights.publish_all, which
+    returns True once every command in the batch was sent; a command only
+    counts as sent-but-unreported when it was.
+    Schedulers for lights on the same mesh (one per zone) should share one
+    mesh bucket.
+    """
+    def __init__(self, lights, publish, device_rate=2.0, device_burst=2, mesh_rate=10.0, mesh_burst=10,
+                 transition=None, mesh=None):
+        self.lights = lights
+        self.publish = publish          # [(topic, payload), ...] -> True if every command went out
+        self.device_rate = device_rate
+        self.device_burst = device_burst
+        self.transition = transition
+        self._mesh = mesh or TokenBucket(mesh_rate, mesh_burst)
+        self._devices = {}              # device -> TokenBucket
+        self._pending = OrderedDict()   # topic -> payload, oldest first
+        self._unconfirmed = {}          # device -> (payload, monotonic time) sent but not reported back yet
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+        self.submitted = 0
+        self.sent = 0
+        self.merged = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.failed = 0                 # commands whose publish failed
+        self.rate_limited = 0           # times the worker had to wait for a token
+
+    # ---------- helpers ----------
+    def _unchanged(self, device, payload, now):
+        """True if the device already has, or was last sent, every value in payload"""
+        lights = self.lights
+        with lights._state_cond:
+            current = dict(lights.curr_state.get(device) or {})
+        sent = self._unconfirmed.get(device)
+        if sent is not None:
+            last, sent_at = sent
+            if not payload_matches(last, current) and now - sent_at < CONFIRM_TIMEOUT:
+                # the mirror is behind, it may still show a value our last command replaced
+                return payload_matches(payload, last)
+            del self._unconfirmed[device]
+        return payload_matches(payload, current)
+
+    def _next_batch(self, now):
+        """Pop every command that may go out now, returns (batch, seconds until the next one could)"""
+        batch, wait = [], None
+        for topic, payload in list(self._pending.items()):
+            device = self.lights._device_name_from_topic(topic)
+            if self._unchanged(device, payload, now):
+                del self._pending[topic]
+                self.skipped += 1
+                metrics.count("light_commands", result="skipped")
+                continue
+            bucket = self._devices.get(device)
+            if bucket is None:
+                bucket = self._devices[device] = TokenBucket(self.device_rate, self.device_burst)
+            delay = max(bucket.wait_time(now), self._mesh.wait_time(now))
+            if delay:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            bucket.take(now)
+            self._mesh.take(now)
+            del self._pending[topic]
+            batch.append((topic, payload))
+        return batch, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if self._closed:
+                    return
+                now = time.monotonic()
+                batch, wait = self._next_batch(now)
+                if not batch:
+                    if wait is not None:
+                        self.rate_limited += 1
+                        self._cond.wait(wait)
+                    continue
+            ok = self.publish(batch)
+            with self._cond:
+                if ok:
+                    # only this worker pops and sends, so nothing was checked against these devices meanwhile
+                    for topic, payload in batch:
+                        self._unconfirmed[self.lights._device_name_from_topic(topic)] = (payload, now)
+                    self.sent += len(batch)
+                else:
+                    self.failed += len(batch)
+            metrics.count("light_commands", len(batch), result="sent" if ok else "failed")
+
+    # ---------- public api ----------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="light-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, topic, payload, transition=None):
+        """Queue a command, replacing any command for the same topic that hasn't gone out"""
+        transition = self.transition if transition is None else transition
+        if transition and topic.endswith("/set"):
+            payload = {**payload, "transition": transition}
+        with self._cond:
+            self.submitted += 1
+            if topic in self._pending:
+                self.merged += 1
+                metrics.count("light_commands", result="merged")
+                del self._pending[topic]
+            self._pending[topic] = payload
+            self._cond.notify()
+
+    def submit_all(self, messages, transition=None):
+        for topic, payload in messages:
+            self.submit(topic, payload, transition)
+
+    def cancel(self):
+        """Drop every command that hasn't gone out"""
+        with self._cond:
+            n = len(self._pending)
+            self.dropped += n
+            self._pending.clear()
+        if n:
+            metrics.count("light_commands", n, result="dropped")
+        return n
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=self.lights.publish_timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._pending),
+                "submitted": self.submitted,
+                "sent": self.sent,
+                "merged": self.merged,
+                "skipped_unchanged": self.skipped,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "rate_limited": self.rate_limited,
+            }
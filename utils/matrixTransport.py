@@ -0,0 +1,423 @@
+import select
+import socket
+import statistics
+import threading
+import time
+from collections import deque
+from .metrics import metrics
+from .outputProfiles import DEFAULT_PROFILE, get_profile
+
+class MatrixTransport:
+    """
+    Persistent TCP connection to the matrix display.
+
+    Frames handed to send() are written by a background thread over a single
+    long-lived socket. While the link is down the thread reconnects with
+    exponential backoff and only the newest frame is kept; older ones are
+    counted as dropped.
+
+    clear() is queued in the same single slot: a frame sent afterwards
+    replaces a clear that hasn't run yet. Once the sender takes a clear out
+    of the slot the reset is posted from a second thread, so the next frame
+    never waits behind a slow reset. A reset that lands after newer frames
+    were written, or after cancel_clear(), would blank artwork that should
+    stay up, so the sender writes the newest frame again in full once it
+    has landed.
+
+    An optional encoder (outputProfiles.FrameEncoder) turns each frame into
+    wire bytes right before it is written and is reset on every disconnect,
+    so delta frames always follow the frame the display last received.
+
+    With a transition (transitions.Transition) the sender streams a crossfade
+    or wipe from the frame on the display to each new one, paced on the
+    monotonic clock at the transition's fps. Frames whose time has passed
+    when the link is slow are skipped, and a newer frame or clear takes over
+    from whatever the display shows at that moment. Clears fade to black
+    before the reset is posted.
+    """
+    def __init__(self, host="matrix.lan", port=9090, reset_url=None,
+                 connect_timeout=2.0, send_timeout=2.0, http_timeout=2.0,
+                 backoff_initial=0.5, backoff_max=30.0, encoder=None, name=None, transition=None):
+        self.host = host
+        self.port = port
+        self.name = name or host   # target label in metrics and log lines
+        self.reset_url = reset_url or f"http://{host}/reset"
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        self.http_timeout = http_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.encoder = encoder
+        self.transition = transition
+        # the pixel layout transitions blend in, bare transports send the original 32x32 rgb565 frames
+        self.profile = encoder.profile if encoder is not None else get_profile(DEFAULT_PROFILE)
+
+        self._session = None      # requests.Session, created on first clear()
+        self._sock = None
+        self._shown = None        # last frame written, what the display shows as far as we know
+        self._pending = None      # (frame, queued_at, on_sent) waiting to be written, frame None for a clear
+        self._current = None      # newest frame taken out of the slot, None once a reset blanked the display
+        self._writes = 0          # frames written so far, tells whether any went out while a reset was posted
+        self._clearing = None     # clear being faded out, {"cancelled": bool, "writes": int or None}
+        self._clears = deque()    # faded out clears waiting for or in their reset post, oldest first
+        self._blanked = False     # a reset landed, the display no longer has the encoder's reference frame
+        self._resend = False      # a reset landed over artwork that should stay up, write _current again
+        self._cond = threading.Condition()
+        self._thread = None
+        self._clear_thread = None
+        self._closed = False
+
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.send_failures = 0
+        self.reconnects = 0
+        self.bytes_sent = 0
+        self.clears = 0
+        self.clear_failures = 0
+        self.clears_cancelled = 0   # replaced by a newer frame or cancel_clear() before they ran
+        self.resends = 0            # frames written again after a reset landed over them
+        self.last_latency = None   # seconds from send() to the frame being on the wire
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+        self.transitions = 0
+        self.transitions_interrupted = 0
+        self.transition_frames = 0
+        self.transition_frames_dropped = 0   # skipped because their time had passed
+        self.last_transition_fps = None
+        self._frame_intervals = deque(maxlen=256)   # seconds between transition frames
+
+    @property
+    def session(self):
+        # requests is only needed for resets, import it on first use
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    # ---------- connection ----------
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.transition is not None:
+            # a couple of frames in flight at most, so sendall blocks and transition frames get dropped
+            # when the link falls behind instead of piling up in the kernel
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2 * self.profile.frame_size)
+        sock.settimeout(self.send_timeout)
+        if self.frames_sent or self.send_failures:
+            self.reconnects += 1
+        self._sock = sock
+
+    def _peer_closed(self):
+        """True if the display closed its end, so a write would be silently lost"""
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            if not readable:
+                return False
+            return self._sock.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def _disconnect(self):
+        if self.encoder is not None:
+            self.encoder.reset()
+        # the display may have restarted, the next frame is a cut
+        self._shown = None
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    # ---------- sender thread ----------
+    def _run(self):
+        backoff = self.backoff_initial
+        while True:
+            with self._cond:
+                while self._pending is None and not self._resend and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                if self._pending is None:
+                    # a reset landed over artwork that should stay up, put it back
+                    self._resend = False
+                    self._pending = (self._current, time.monotonic(), None)
+                    self.resends += 1
+                request = self._pending
+                frame, queued_at, on_sent = request
+                if frame is None:
+                    # taken out of the slot, a frame queued from now on goes out after it
+                    self._pending = None
+                    clearing = self._clearing = {"cancelled": False, "writes": None}
+                else:
+                    self._current = frame
+
+            if frame is None:
+                faded = self._fade_out(clearing)
+                with self._cond:
+                    self._clearing = None
+                    if faded and not clearing["cancelled"]:
+                        self._clears.append(clearing)
+                        self._ensure_clear_thread()
+                        self._cond.notify_all()
+                continue
+
+            try:
+                sequence = self._sequence_to(frame)
+                if sequence is None:
+                    self._write(frame)
+                    sent_at = time.monotonic()
+                else:
+                    sent_at = self._play(sequence, request)
+                    if sent_at is None:
+                        continue
+            except OSError as e:
+                print(f"matrix send to {self.name} ({self.host}:{self.port}) failed: {e}, retrying in {backoff:.1f}s")
+                self.send_failures += 1
+                self._disconnect()
+                with self._cond:
+                    # a newer frame or close() wakes us up early
+                    self._cond.wait(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+                continue
+
+            backoff = self.backoff_initial
+            latency = sent_at - queued_at
+            metrics.observe("matrix_delivery", latency, target=self.name)
+            with self._cond:
+                if self._pending is request:
+                    self._pending = None
+                self.frames_sent += 1
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+                self._total_latency += latency
+            if on_sent is not None:
+                on_sent(sent_at)
+
+    def _write(self, frame):
+        """Encode and write one frame, connecting first if needed. Raises OSError"""
+        if self._sock is not None and self._peer_closed():
+            self._disconnect()
+        if self._sock is None:
+            self._connect()
+        with self._cond:
+            blanked, self._blanked = self._blanked, False
+            if blanked:
+                # this write shows the display what it should, no need to put the last frame back
+                self._resend = False
+        if self.encoder is None:
+            payload = frame
+        else:
+            if blanked:
+                # the reset wiped the frame a delta would build on
+                self.encoder.reset()
+            with metrics.timer("frame_encode", target=self.name):
+                payload = self.encoder.encode(frame)
+        with metrics.timer("matrix_send", target=self.name):
+            self._sock.sendall(payload)
+        self._shown = frame
+        with self._cond:
+            self.bytes_sent += len(payload)
+            self._writes += 1
+
+    def _sequence_to(self, frame):
+        if self.transition is None:
+            return None
+        return self.transition.sequence(self._shown, frame, self.profile)
+
+    def _play(self, sequence, request):
+        """
+        Stream a transition, frame i due i - 1 frame periods after the first.
+        Returns when the first frame went out, or None if a newer request
+        (anything but request in the slot) or close() cut it short.
+        """
+        period = 1 / self.transition.fps
+        start = time.monotonic()
+        first_sent = last_sent = None
+        sent = 0
+        i = 1
+        while i <= len(sequence):
+            with self._cond:
+                interrupted = self._cond.wait_for(lambda: self._closed or self._pending is not request,
+                                                  start + (i - 1) * period - time.monotonic())
+            if interrupted:
+                with self._cond:
+                    self.transitions_interrupted += 1
+                return None
+            # behind schedule: skip to the newest frame that is due, the last one always goes out
+            due = min(int((time.monotonic() - start) / period) + 1, len(sequence))
+            if due > i:
+                with self._cond:
+                    self.transition_frames_dropped += due - i
+                i = due
+            self._write(sequence.frame(i))
+            now = time.monotonic()
+            if last_sent is None:
+                first_sent = now
+            else:
+                self._frame_intervals.append(now - last_sent)
+            last_sent = now
+            sent += 1
+            i += 1
+        metrics.observe("matrix_transition", last_sent - start, target=self.name)
+        with self._cond:
+            self.transitions += 1
+            self.transition_frames += sent
+            if last_sent > first_sent:
+                self.last_transition_fps = (sent - 1) / (last_sent - first_sent)
+        return first_sent
+
+    def _fade_out(self, clearing):
+        """Fade the display to black ahead of a clear, False if a new frame or cancel_clear() came first"""
+        sequence = self._sequence_to(bytes(self.profile.frame_size))
+        if sequence is None:
+            return True
+        try:
+            if self._play(sequence, None) is None:
+                with self._cond:
+                    # cancel_clear() counted it already
+                    self.clears_cancelled += not clearing["cancelled"]
+                return False
+        except OSError as e:
+            print(f"matrix fade out on {self.name} failed: {e}")
+            self._disconnect()
+        return True
+
+    def _post_clear(self):
+        import requests
+        start = time.monotonic()
+        try:
+            self.session.post(self.reset_url, timeout=self.http_timeout).raise_for_status()
+            ok = True
+        except requests.exceptions.RequestException as e:
+            print(f"there was an error sending reset command to matrix {self.name}: {e}")
+            ok = False
+        metrics.observe("matrix_clear", time.monotonic() - start, target=self.name)
+        with self._cond:
+            self.clears += 1
+            self.clear_failures += not ok
+
+    def _run_clears(self):
+        """Post the resets of faded out clears one at a time, off the sender thread"""
+        while True:
+            with self._cond:
+                while not self._clears and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                clearing = self._clears[0]
+                if clearing["cancelled"]:
+                    self._clears.popleft()
+                    continue
+                clearing["writes"] = self._writes
+            self._post_clear()
+            with self._cond:
+                self._clears.popleft()
+                self._blanked = True
+                if clearing["cancelled"] or self._writes != clearing["writes"]:
+                    # the reset may have landed after newer artwork, the sender writes it again
+                    self._resend = self._current is not None
+                else:
+                    self._current = None
+                    self._resend = False
+                self._cond.notify_all()
+
+    def _ensure_clear_thread(self):
+        if self._clear_thread is None or not self._clear_thread.is_alive():
+            self._clear_thread = threading.Thread(target=self._run_clears, name=f"matrix-{self.name}-reset",
+                                                  daemon=True)
+            self._clear_thread.start()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f"matrix-{self.name}", daemon=True)
+            self._thread.start()
+
+    # ---------- public api ----------
+    def send(self, frame, on_sent=None):
+        """
+        Queue a frame for the display, replacing any frame not yet written.
+        on_sent is called with the monotonic time the frame went out on the wire.
+        """
+        self._replace_pending((bytes(frame), time.monotonic(), on_sent))
+
+    def clear(self):
+        """Queue an artwork reset for the display, dropping any frame not yet written"""
+        self._replace_pending((None, time.monotonic(), None))
+
+    def cancel_clear(self):
+        """
+        Call off a reset, returns True if there was one. A queued reset is
+        dropped, a fade to black stops and goes back to the artwork, and
+        the artwork is written again after a reset that is already posted.
+        """
+        with self._cond:
+            cancelled = False
+            if self._pending is not None and self._pending[0] is None:
+                self._pending = None
+                cancelled = True
+            if self._clearing is not None and not self._clearing["cancelled"]:
+                self._clearing["cancelled"] = True
+                cancelled = True
+                if self._pending is None and self._current is not None:
+                    # interrupts the fade and plays back to the artwork
+                    self._pending = (self._current, time.monotonic(), None)
+            for clearing in self._clears:
+                if not clearing["cancelled"]:
+                    clearing["cancelled"] = True
+                    cancelled = True
+                    # the display was faded out already
+                    self._resend = self._current is not None
+            if cancelled:
+                self.clears_cancelled += 1
+                self._cond.notify_all()
+            return cancelled
+
+    def _replace_pending(self, request):
+        with self._cond:
+            if self._pending is not None:
+                if self._pending[0] is None:
+                    self.clears_cancelled += 1
+                else:
+                    self.frames_dropped += 1
+            self._pending = request
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=self.send_timeout)
+        if self._clear_thread is not None:
+            self._clear_thread.join(timeout=self.http_timeout)
+        self._disconnect()
+        if self._session is not None:
+            self._session.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "frames_sent": self.frames_sent,
+                "frames_dropped": self.frames_dropped,
+                "send_failures": self.send_failures,
+                "reconnects": self.reconnects,
+                "bytes_sent": self.bytes_sent,
+                "clears": self.clears,
+                "clear_failures": self.clear_failures,
+                "clears_cancelled": self.clears_cancelled,
+                "clears_in_flight": len(self._clears),
+                "resends": self.resends,
+                "last_latency_ms": None if self.last_latency is None else self.last_latency * 1000,
+                "avg_latency_ms": self._total_latency / self.frames_sent * 1000 if self.frames_sent else None,
+                "max_latency_ms": self.max_latency * 1000,
+                "pending": self._pending is not None,
+                "transitions": self.transitions,
+                "transitions_interrupted": self.transitions_interrupted,
+                "transition_frames": self.transition_frames,
+                "transition_frames_dropped": self.transition_frames_dropped,
+                "transition_fps": self.last_transition_fps,
+                "transition_jitter_ms": (statistics.pstdev(self._frame_intervals) * 1000
+                                         if len(self._frame_intervals) > 1 else None),
+            }
@@ -0,0 +1,317 @@
+import os
+import re
+import time
+import binascii
+import selectors
+from .metrics import metrics
+
+# <item><type>73736e63</type><code>50494354</code><length>1234</length>
+REGEX_ITEM_HEADER = re.compile(
+    rb"<item><type>([A-Fa-f0-9]{8})</type><code>([A-Fa-f0-9]{8})</code><length>(\d+)</length>"
+)
+ITEM_START = b"<item>"
+ITEM_END = b"</item>"
+DATA_START = b"<data"
+DATA_END = b"</data>"
+
+# headers are short, anything longer than this without a match is garbage
+MAX_HEADER_LEN = 128
+# base64 payloads may be wrapped
+BASE64_WHITESPACE = b" \t\r\n"
+
+class MetadataParser:
+    """
+    Incremental parser for the shairport-sync metadata pipe.
+
+    Bytes are pushed in with feed() in chunks of any size and complete items
+    come out as (type, code, payload) tuples, payload being the decoded bytes.
+    Base64 payloads may be split across any number of lines or reads.
+    Malformed items are skipped and counted in self.errors.
+
+    stream is an optional hook (type, code, length) -> sink. When it returns
+    a sink (write(chunk) and close() -> payload) the item's base64 is decoded
+    as it arrives and handed to the sink instead of being buffered, and the
+    item's payload is whatever close() returns. Items longer than
+    max_payload bytes are dropped as they arrive without being decoded and
+    come out with an empty payload, counted in self.oversize.
+    """
+    def __init__(self, stream=None, max_payload=None):
+        self.stream = stream
+        self.max_payload = max_payload
+        self._buf = bytearray()
+        self._item = None        # (typ, code, length) of the item being read
+        self._data_start = -1    # offset of the base64 text in self._buf
+        self._scan = 0           # where to resume searching for the closing tag
+        self._sink = None        # stream sink of the item being read
+        self._discard = False    # the item being read is over max_payload
+        self._carry = b""        # base64 left over from the last read, less than 4 characters
+        self._streamed = 0       # bytes decoded into the sink so far
+        self._decode_time = 0.0
+        self.items = 0
+        self.errors = 0
+        self.oversize = 0
+        self.bytes_read = 0
+
+    # ---------- helpers ----------
+    def _skip(self, pos):
+        """Drop everything before pos and reset the in-progress item"""
+        del self._buf[:pos]
+        self._item = None
+        self._data_start = -1
+        self._scan = 0
+        self._sink = None
+        self._discard = False
+        self._carry = b""
+        self._streamed = 0
+        self._decode_time = 0.0
+
+    def _drop_oversize(self, code):
+        self._sink = None
+        self._discard = True
+        self.oversize += 1
+        metrics.count("oversize_items", code=code)
+
+    def _next_header(self):
+        buf = self._buf
+        start = buf.find(ITEM_START)
+        if start == -1:
+            # keep a possible partial "<item" at the end of the buffer
+            self._skip(max(0, len(buf) - len(ITEM_START) + 1))
+            return False
+        if start:
+            self._skip(start)
+
+        m = REGEX_ITEM_HEADER.match(buf)
+        if m is None:
+            if buf.find(b"</length>", 0, MAX_HEADER_LEN) != -1 or len(buf) >= MAX_HEADER_LEN:
+                self.errors += 1
+                self._skip(len(ITEM_START))
+                return True
+            return False   # header incomplete, wait for more bytes
+
+        typ = bytes.fromhex(m.group(1).decode()).decode('utf-8', errors='ignore')
+        code = bytes.fromhex(m.group(2).decode()).decode('utf-8', errors='ignore')
+        length = int(m.group(3))
+        self._item = (typ, code, length)
+        self._scan = m.end()
+        if self.max_payload is not None and length > self.max_payload:
+            self._drop_oversize(code)
+        elif self.stream is not None:
+            self._sink = self.stream(typ, code, length)
+        return True
+
+    def _decode_into_sink(self, text):
+        """Decode the complete base64 quanta in text into the sink"""
+        start = time.perf_counter()
+        chunk = binascii.a2b_base64(text)
+        self._decode_time += time.perf_counter() - start
+        self._streamed += len(chunk)
+        if self.max_payload is not None and self._streamed > self.max_payload:
+            # the header undersold it
+            self._drop_oversize(self._item[1])
+            return
+        self._sink.write(chunk)
+
+    def _stream_item(self):
+        """_finish_item for streamed and oversize items, the base64 is consumed as it arrives"""
+        buf = self._buf
+        typ, code, _ = self._item
+        # base64 never contains "<", the first one is </data> or the start of something else
+        lt = buf.find(b"<", self._data_start)
+        stop = len(buf) if lt == -1 else lt
+        if stop > self._data_start:
+            consumed = stop
+            wrapped = self._carry or any(buf.find(c, self._data_start, stop) != -1 for c in BASE64_WHITESPACE)
+            try:
+                if self._discard:
+                    pass
+                elif not wrapped:
+                    # one unwrapped line: decode whole quanta in place, the rest waits in the buffer
+                    consumed = stop - (stop - self._data_start) % 4
+                    if consumed > self._data_start:
+                        with memoryview(buf) as view:
+                            self._decode_into_sink(view[self._data_start:consumed])
+                else:
+                    text = self._carry + buf[self._data_start:stop].translate(None, BASE64_WHITESPACE)
+                    whole = len(text) - len(text) % 4
+                    self._carry = text[whole:]
+                    if whole:
+                        self._decode_into_sink(text[:whole])
+            except binascii.Error:
+                self.errors += 1
+                self._skip(stop)
+                return False
+            del buf[:consumed]
+            self._data_start = self._scan = 0
+            lt = -1 if lt == -1 else lt - consumed
+        if lt == -1 or len(buf) - lt < len(DATA_END):
+            return None
+        if lt or not buf.startswith(DATA_END):
+            # cut short by a new item, or garbage
+            self.errors += 1
+            self._skip(0)
+            return False
+
+        payload = b""
+        if not self._discard:
+            if self._carry:
+                # padded base64 always comes in whole quanta
+                self.errors += 1
+                self._skip(len(DATA_END))
+                return False
+            payload = self._sink.close()
+            metrics.observe("base64_decode", self._decode_time)
+        self._skip(len(DATA_END))
+        return (typ, code, payload)
+
+    def _finish_item(self):
+        """Try to complete the current item, returns it or None if more bytes are needed"""
+        buf = self._buf
+        typ, code, length = self._item
+
+        if self._data_start == -1:
+            if length == 0:
+                end = buf.find(ITEM_END, self._scan)
+                if end == -1:
+                    self._scan = max(self._scan, len(buf) - len(ITEM_END) + 1)
+                    return None
+                self._skip(end + len(ITEM_END))
+                return (typ, code, b"")
+
+            data = buf.find(DATA_START, self._scan)
+            # only up to <data, past it lies the payload and this item's own </item>
+            item_end = buf.find(ITEM_END, self._scan, len(buf) if data == -1 else data)
+            if item_end != -1 and (data == -1 or item_end < data):
+                # length given but no payload, treat as empty
+                self._skip(item_end + len(ITEM_END))
+                return (typ, code, b"")
+            if data == -1:
+                return None
+            tag_end = buf.find(b">", data)
+            if tag_end == -1:
+                return None
+            self._data_start = self._scan = tag_end + 1
+
+        if self._sink is not None or self._discard:
+            return self._stream_item()
+
+        # base64 never contains "<", so the first one is normally </data>: a single byte search
+        # runs at memchr speed where a search for the whole tag crawls through the payload
+        lt = buf.find(b"<", self._scan)
+        if lt == -1:
+            self._scan = len(buf)
+            return None
+        if buf.startswith(DATA_END, lt):
+            end, nxt = lt, -1
+        else:
+            end = buf.find(DATA_END, lt)
+            # a new item here means this one was cut short
+            nxt = buf.find(ITEM_START, lt, len(buf) if end == -1 else end)
+        if nxt != -1:
+            self.errors += 1
+            self._skip(nxt)
+            return False
+        if end == -1:
+            # resume from here next time instead of rescanning the whole payload
+            self._scan = max(self._data_start, len(buf) - len(DATA_END) + 1)
+            return None
+
+        try:
+            # a2b_base64 skips the newlines between wrapped lines
+            with memoryview(buf) as view, metrics.timer("base64_decode"):
+                payload = binascii.a2b_base64(view[self._data_start:end])
+        except binascii.Error:
+            self.errors += 1
+            payload = None
+
+        # the trailing </item> is skipped by the search for the next <item>
+        self._skip(end + len(DATA_END))
+        if payload is None:
+            return False
+        return (typ, code, payload)
+
+    def _next_item(self):
+        """Next complete item in the buffer, or None if more bytes are needed"""
+        while True:
+            if self._item is None and not self._next_header():
+                return None
+            if self._item is None:
+                continue
+            item = self._finish_item()
+            if item is not False:
+                return item
+
+    # ---------- public api ----------
+    def feed(self, chunk):
+        """Push bytes into the parser and yield every item completed by them"""
+        self._buf += chunk
+        self.bytes_read += len(chunk)
+        metrics.count("pipe_bytes", len(chunk))
+        while True:
+            with metrics.timer("parse"):
+                item = self._next_item()
+            if item is None:
+                return
+            self.items += 1
+            metrics.count("items", type=item[0], code=item[1])
+            yield item
+
+    def read_items(self, fd, chunk_size=65536):
+        """Generator over (type, code, payload) items read from fd until EOF"""
+        while True:
+            chunk = os.read(fd, chunk_size)
+            if not chunk:
+                return
+            yield from self.feed(chunk)
+
+def read_pipe(path, chunk_size=65536, **parser_args):
+    """Open the metadata pipe and yield its items until the writer closes it"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        yield from MetadataParser(**parser_args).read_items(fd, chunk_size)
+    finally:
+        os.close(fd)
+
+def read_pipes(pipes, chunk_size=65536, **parser_args):
+    """
+    Watch several metadata pipes from one thread, {key: path} -> (key, type, code, payload).
+    Each pipe has its own parser, made with parser_args. shairport-sync closes
+    its pipe when it restarts and opens it again, so when a writer closes a
+    pipe it's reopened with a new parser (a half-read item is dropped); a pipe
+    is only dropped if it can't be reopened, and the generator ends when all
+    of them are.
+    """
+    sel = selectors.DefaultSelector()
+
+    def open_pipe(key, path):
+        # non-blocking so opening one FIFO doesn't wait for its writer while the others have data
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        sel.register(fd, selectors.EVENT_READ, (key, path, MetadataParser(**parser_args)))
+
+    try:
+        for key, path in pipes.items():
+            open_pipe(key, path)
+        while sel.get_map():
+            for sk, _ in sel.select():
+                key, path, parser = sk.data
+                try:
+                    chunk = os.read(sk.fd, chunk_size)
+                except BlockingIOError:
+                    continue
+                if not chunk:
+                    # the writer went away; a fresh fd waits for the next one instead of reading EOF forever
+                    sel.unregister(sk.fd)
+                    os.close(sk.fd)
+                    try:
+                        open_pipe(key, path)
+                    except OSError:
+                        metrics.count("pipe_reopens", result="failed")
+                    else:
+                        metrics.count("pipe_reopens", result="ok")
+                    continue
+                for item in parser.feed(chunk):
+                    yield (key, *item)
+    finally:
+        for sk in list(sel.get_map().values()):
+            os.close(sk.fd)
+        sel.close()
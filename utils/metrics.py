@@ -0,0 +1,230 @@
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds in seconds for the Prometheus histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PREFIX = "shairport"
+
+class _NullTimer:
+    """Shared no-op context manager handed out while metrics are disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ("_metrics", "_stage", "_labels", "_start")
+
+    def __init__(self, metrics, stage, labels):
+        self._metrics = metrics
+        self._stage = stage
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(self._stage, time.monotonic() - self._start, **self._labels)
+        return False
+
+class Histogram:
+    """Cumulative Prometheus buckets plus a rolling window for percentiles"""
+    def __init__(self, window=512):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, p):
+        values = sorted(self.recent)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+class Metrics:
+    """
+    Hot-path stage timers, item counters and component gauges.
+
+    Disabled by default: timer() then returns a shared no-op context manager
+    and observe()/count() return straight away. configure() turns collection
+    on and optionally starts the JSON-lines log and the HTTP endpoint
+    (/metrics in Prometheus text format, /metrics.json for the rolling view).
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms = {}   # (stage, labels) -> Histogram
+        self._counters = {}     # (name, labels) -> int
+        self._gauges = {}       # component -> callable returning a dict
+        self._log = None
+        self._server = None
+
+    # ---------- setup ----------
+    def configure(self, enabled=True, jsonl_path=None, port=None, host="127.0.0.1"):
+        self.enabled = enabled
+        if not enabled:
+            return self
+        if jsonl_path:
+            self._log = open(jsonl_path, "a", buffering=1)
+        if port:
+            self.serve(port, host)
+        return self
+
+    def register_gauges(self, component, fn):
+        """fn() returns a dict of numbers exported as <component>_<key> gauges"""
+        self._gauges[component] = fn
+
+    # ---------- hot path ----------
+    def timer(self, stage, **labels):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage, labels)
+
+    def observe(self, stage, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (stage, tuple(sorted(labels.items())))
+        line = None
+        if self._log is not None:
+            line = json.dumps({"ts": time.time(), "stage": stage, **labels, "ms": round(seconds * 1000, 3)}) + "\n"
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(seconds)
+            # one writer at a time, so lines from different threads don't interleave
+            if line is not None and self._log is not None:
+                self._log.write(line)
+
+    def count(self, name, n=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    # ---------- export ----------
+    def _gauge_values(self):
+        out = {}
+        for component, fn in list(self._gauges.items()):
+            try:
+                values = fn()
+            except Exception:
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    out[f"{component}_{key}"] = value
+        return out
+
+    def snapshot(self):
+        with self._lock:
+            stages = {
+                _key_text(stage, labels): {
+                    "count": h.count,
+                    "avg_ms": h.sum / h.count * 1000 if h.count else None,
+                    "p50_ms": _ms(h.percentile(0.5)),
+                    "p99_ms": _ms(h.percentile(0.99)),
+                }
+                for (stage, labels), h in self._histograms.items()
+            }
+            counters = {_key_text(name, labels): value for (name, labels), value in self._counters.items()}
+        return {"stages": stages, "counters": counters, "gauges": self._gauge_values()}
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            if self._histograms:
+                lines.append(f"# TYPE {PREFIX}_stage_seconds histogram")
+            for (stage, labels), h in sorted(self._histograms.items()):
+                label_text = _label_text((("stage", stage),) + labels)
+                cumulative = 0
+                for bound, n in zip(BUCKETS, h.buckets):
+                    cumulative += n
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{{label_text},le="+Inf"}} {h.count}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{{label_text}}} {h.sum}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{{label_text}}} {h.count}')
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+                for (n, labels), value in sorted(self._counters.items()):
+                    if n == name:
+                        label_text = _label_text(labels)
+                        lines.append(f"{PREFIX}_{name}_total{{{label_text}}} {value}" if labels else f"{PREFIX}_{name}_total {value}")
+        for key, value in sorted(self._gauge_values().items()):
+            lines.append(f"# TYPE {PREFIX}_{key} gauge")
+            lines.append(f"{PREFIX}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Start the local HTTP endpoint on a daemon thread"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, ctype = metrics.prometheus().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, ctype = json.dumps(metrics.snapshot()).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+def _label_value(value):
+    """Escape a label value for the exposition format: backslash, double quote and newline"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(labels):
+    return ",".join(f'{k}="{_label_value(v)}"' for k, v in labels)
+
+def _key_text(name, labels):
+    """stage{target=kitchen} style key for the JSON view"""
+    return f"{name}{{{','.join(f'{k}={v}' for k, v in labels)}}}" if labels else name
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+# process-wide registry, disabled until configure() is called
+metrics = Metrics()
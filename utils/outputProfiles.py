@@ -0,0 +1,285 @@
+import struct
+# numpy is imported where frames are packed, encoded or decoded, so the profile
+# tables can be read at startup without loading it
+
+# pixel formats
+RGB565 = "rgb565"
+RGB444 = "rgb444"
+RGB332 = "rgb332"     # 8-bit index into the fixed 3-3-2 palette
+
+# frame compressions
+RAW = "none"
+RLE = "rle"
+DELTA = "delta"
+
+FORMAT_IDS = {RGB565: 1, RGB444: 2, RGB332: 3}
+COMPRESSION_IDS = {RAW: 0, RLE: 1, DELTA: 2}
+
+# numpy dtype of a pixel word in the cached frame and in compressed payloads, and its size in bytes
+WORD_DTYPES = {RGB565: ">u2", RGB444: ">u2", RGB332: "u1"}
+WORD_SIZES = {RGB565: 2, RGB444: 2, RGB332: 1}
+# depth the image is dithered to before packing, per channel where they differ
+DEPTH_BITS = {RGB565: 5, RGB444: 4, RGB332: (3, 3, 2)}
+# (shift, mask) of the red, green and blue bits in a pixel word
+CHANNELS = {
+    RGB565: ((11, 0x1F), (5, 0x3F), (0, 0x1F)),
+    RGB444: ((8, 0xF), (4, 0xF), (0, 0xF)),
+    RGB332: ((5, 0x7), (2, 0x7), (0, 0x3)),
+}
+
+# "MX", format id, compression id, width, height, payload length
+HEADER = struct.Struct(">2sBBHHI")
+MAGIC = b"MX"
+
+# longest run a single RLE entry can hold
+MAX_RUN = 255
+# a delta span header costs 4 bytes, so gaps this small are cheaper to resend
+DELTA_SPAN = struct.Struct(">HH")
+
+class OutputProfile:
+    """
+    Resolution, pixel format and compression of the frames sent to a display.
+
+    pixels() turns a dithered RGB image into the cached frame: one big-endian
+    word per pixel (a byte for rgb332). FrameEncoder turns those frames into
+    what goes on the wire. Profiles with header=False send bare frames and
+    are only valid for raw rgb565, which is what the original firmware reads.
+    """
+    def __init__(self, name, width=32, height=32, pixel_format=RGB565, compression=RAW, header=True):
+        if pixel_format not in FORMAT_IDS:
+            raise ValueError(f"Unknown pixel format: {pixel_format}")
+        if compression not in COMPRESSION_IDS:
+            raise ValueError(f"Unknown compression: {compression}")
+        if not header and (pixel_format != RGB565 or compression != RAW):
+            raise ValueError("headerless frames must be raw rgb565")
+        self.name = name
+        self.width = width
+        self.height = height
+        self.pixel_format = pixel_format
+        self.compression = compression
+        self.header = header
+
+    @property
+    def depth_bits(self):
+        return DEPTH_BITS[self.pixel_format]
+
+    @property
+    def word_dtype(self):
+        import numpy as np
+        return np.dtype(WORD_DTYPES[self.pixel_format])
+
+    @property
+    def frame_size(self):
+        """Bytes in a cached frame"""
+        return self.width * self.height * WORD_SIZES[self.pixel_format]
+
+    def pixels(self, np_img):
+        """Pack an (height, width, 3) uint8 image into frame bytes"""
+        import numpy as np
+        # casting numpy array before shifting to prevent overflow errors
+        r = np_img[:, :, 0].astype(np.uint16)
+        g = np_img[:, :, 1].astype(np.uint16)
+        b = np_img[:, :, 2].astype(np.uint16)
+        if self.pixel_format == RGB565:
+            words = ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+        elif self.pixel_format == RGB444:
+            words = ((r >> 4) << 8) | ((g >> 4) << 4) | (b >> 4)
+        else:
+            words = (r & 0xE0) | ((g >> 3) & 0x1C) | (b >> 6)
+        return words.astype(self.word_dtype).tobytes()
+
+    def __repr__(self):
+        return f"OutputProfile({self.name!r}, {self.width}x{self.height}, {self.pixel_format}, {self.compression})"
+
+PROFILES = {
+    # what the current Matrix Portal firmware expects: 2048 bare bytes per frame
+    "matrix32": OutputProfile("matrix32", 32, 32, RGB565, RAW, header=False),
+    "matrix32-rle": OutputProfile("matrix32-rle", 32, 32, RGB565, RLE),
+    "matrix32-delta": OutputProfile("matrix32-delta", 32, 32, RGB565, DELTA),
+    "matrix32-444": OutputProfile("matrix32-444", 32, 32, RGB444, RAW),
+    "matrix32-332": OutputProfile("matrix32-332", 32, 32, RGB332, RAW),
+    "matrix64": OutputProfile("matrix64", 64, 64, RGB565, DELTA),
+    "matrix64-444": OutputProfile("matrix64-444", 64, 64, RGB444, DELTA),
+    "chain128x32": OutputProfile("chain128x32", 128, 32, RGB565, DELTA),
+}
+DEFAULT_PROFILE = "matrix32"
+
+def get_profile(name):
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown output profile: {name}") from None
+
+# ---------- encoding ----------
+def pack_nibbles(words):
+    """Pack 12-bit rgb444 words two pixels to three bytes"""
+    import numpy as np
+    if len(words) % 2:
+        words = np.append(words, 0)
+    pairs = words.astype(np.uint32).reshape(-1, 2)
+    packed = (pairs[:, 0] << 12) | pairs[:, 1]
+    out = np.empty((len(packed), 3), dtype=np.uint8)
+    out[:, 0] = packed >> 16
+    out[:, 1] = packed >> 8
+    out[:, 2] = packed
+    return out.tobytes()
+
+def raw_size(pixel_format, count):
+    """Bytes of an uncompressed payload"""
+    if pixel_format == RGB444:
+        return (count + 1) // 2 * 3
+    return count * WORD_SIZES[pixel_format]
+
+def rle_encode(words):
+    """(count, word) pairs for every run of equal pixels, runs capped at MAX_RUN"""
+    import numpy as np
+    if len(words) == 0:
+        return b""
+    starts = np.flatnonzero(np.r_[True, words[1:] != words[:-1]])
+    lengths = np.diff(np.r_[starts, len(words)])
+    chunks = -(-lengths // MAX_RUN)
+    values = np.repeat(words[starts], chunks)
+    counts = np.full(len(values), MAX_RUN, dtype=np.uint8)
+    counts[np.cumsum(chunks) - 1] = lengths - (chunks - 1) * MAX_RUN
+    out = np.empty(len(values), dtype=[("n", "u1"), ("v", words.dtype)])
+    out["n"] = counts
+    out["v"] = values
+    return out.tobytes()
+
+def delta_spans(words, previous):
+    """(start, end) pixel ranges that differ from previous, merging gaps cheaper to resend"""
+    import numpy as np
+    changed = np.flatnonzero(words != previous)
+    if len(changed) == 0:
+        return []
+    max_gap = DELTA_SPAN.size // words.dtype.itemsize + 1
+    breaks = np.flatnonzero(np.diff(changed) > max_gap)
+    starts = changed[np.r_[0, breaks + 1]]
+    ends = changed[np.r_[breaks, len(changed) - 1]] + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def delta_encode(words, spans):
+    raw = words.tobytes()
+    size = words.dtype.itemsize
+    return b"".join(DELTA_SPAN.pack(start, end - start) + raw[start * size:end * size] for start, end in spans)
+
+class FrameEncoder:
+    """
+    Turns cached frames into wire bytes for one display.
+
+    Delta frames are relative to the last frame this encoder produced, so it
+    must sit where frames are actually written (MatrixTransport calls it from
+    its sender thread) and reset() must be called whenever the receiver may
+    have missed a frame; the next frame is then sent whole. Frames that would
+    not get smaller are sent raw, the header says which was used.
+    """
+    def __init__(self, profile):
+        self.profile = profile
+        self._previous = None
+
+    def reset(self):
+        self._previous = None
+
+    def encode(self, frame):
+        profile = self.profile
+        if not profile.header:
+            return frame
+        import numpy as np
+        words = np.frombuffer(frame, dtype=profile.word_dtype)
+        compression, payload = profile.compression, None
+        if compression == RLE:
+            payload = rle_encode(words)
+        elif compression == DELTA:
+            if self._previous is not None and len(self._previous) == len(words):
+                payload = delta_encode(words, delta_spans(words, self._previous))
+            self._previous = words
+        # dithered art often doesn't compress, never send more than the raw frame
+        if payload is None or len(payload) >= raw_size(profile.pixel_format, len(words)):
+            compression = RAW
+            payload = pack_nibbles(words) if profile.pixel_format == RGB444 else frame
+        header = HEADER.pack(MAGIC, FORMAT_IDS[profile.pixel_format], COMPRESSION_IDS[compression],
+                             profile.width, profile.height, len(payload))
+        return header + payload
+
+# ---------- reference decoder ----------
+def words_to_rgb(words, pixel_format):
+    """Expand pixel words back to 8-bit RGB the way the panel would show them"""
+    import numpy as np
+    words = words.astype(np.uint16)
+    channels = [np.rint(((words >> shift) & mask) * (255 / mask)).astype(np.uint8)
+                for shift, mask in CHANNELS[pixel_format]]
+    return np.stack(channels, axis=-1)
+
+class FrameDecoder:
+    """
+    Reference receiver: feed() the byte stream a display would get and it
+    yields the decoded frames as pixel-word arrays of shape (height, width).
+    Bare frames are split by the profile's frame size.
+    """
+    def __init__(self, profile):
+        self.profile = profile
+        self._buf = bytearray()
+        self._previous = None
+
+    def reset(self):
+        """Forget the reference frame, like a display that was power cycled"""
+        self._previous = None
+
+    def feed(self, data):
+        self._buf += data
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return
+            yield frame
+
+    def _next_frame(self):
+        import numpy as np
+        profile = self.profile
+        if not profile.header:
+            if len(self._buf) < profile.frame_size:
+                return None
+            frame = bytes(self._buf[:profile.frame_size])
+            del self._buf[:profile.frame_size]
+            return np.frombuffer(frame, dtype=profile.word_dtype).reshape(profile.height, profile.width)
+
+        if len(self._buf) < HEADER.size:
+            return None
+        magic, fmt, comp, width, height, length = HEADER.unpack_from(self._buf)
+        if magic != MAGIC:
+            raise ValueError("lost frame sync")
+        if len(self._buf) < HEADER.size + length:
+            return None
+        payload = bytes(self._buf[HEADER.size:HEADER.size + length])
+        del self._buf[:HEADER.size + length]
+
+        pixel_format = next(f for f, i in FORMAT_IDS.items() if i == fmt)
+        compression = next(c for c, i in COMPRESSION_IDS.items() if i == comp)
+        dtype = np.dtype(WORD_DTYPES[pixel_format])
+        count = width * height
+
+        if compression == RLE:
+            runs = np.frombuffer(payload, dtype=[("n", "u1"), ("v", dtype)])
+            words = np.repeat(runs["v"], runs["n"])
+        elif compression == DELTA:
+            if self._previous is None or len(self._previous) != count:
+                words = np.zeros(count, dtype=dtype)
+            else:
+                words = self._previous.copy()
+            pos = 0
+            while pos < len(payload):
+                start, n = DELTA_SPAN.unpack_from(payload, pos)
+                pos += DELTA_SPAN.size
+                words[start:start + n] = np.frombuffer(payload, dtype=dtype, count=n, offset=pos)
+                pos += n * dtype.itemsize
+        elif pixel_format == RGB444:
+            packed = np.frombuffer(payload, dtype=np.uint8).reshape(-1, 3).astype(np.uint32)
+            pairs = (packed[:, 0] << 16) | (packed[:, 1] << 8) | packed[:, 2]
+            words = np.stack([pairs >> 12, pairs & 0xFFF], axis=-1).reshape(-1)[:count].astype(dtype)
+        else:
+            words = np.frombuffer(payload, dtype=dtype)
+
+        if len(words) != count:
+            raise ValueError(f"frame decoded to {len(words)} pixels, expected {count}")
+        self._previous = words
+        return words.reshape(height, width)
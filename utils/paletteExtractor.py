@@ -0,0 +1,139 @@
+import numpy as np
+
+# what the original cv2.resize + KMeans(n_clusters=k, random_state=0) path ran with
+PALETTE_SIZE = 50
+MAX_ITER = 300
+TOL = 1e-4
+SEED = 0
+# cv2's fixed point resize coefficients, scaled by 2**11
+COEF_SCALE = 2048
+
+def _area_coefficients(src, dst):
+    """Source index and fixed point weights of each output column, as cv2 INTER_AREA computes them when enlarging"""
+    scale, inv_scale = src / dst, dst / src
+    index = np.empty(dst, dtype=np.int64)
+    fraction = np.empty(dst, dtype=np.float32)
+    for d in range(dst):
+        s = int(np.floor(d * scale))
+        f = np.float32((d + 1) - (s + 1) * inv_scale)
+        f = np.float32(0) if f <= 0 else f - np.floor(f)
+        if s >= src - 1:
+            s, f = src - 1, np.float32(0)
+        index[d], fraction[d] = s, f
+    w1 = np.rint(fraction * COEF_SCALE).astype(np.int64)
+    w0 = np.rint((np.float32(1) - fraction) * COEF_SCALE).astype(np.int64)
+    return index, np.minimum(index + 1, src - 1), w0, w1
+
+def area_upscale(img, width, height):
+    """
+    cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA) for an
+    (H, W, 3) uint8 image no larger than the output, bit for bit: a
+    horizontal pass in 11-bit fixed point, then the vectorised vertical
+    pass's rounding.
+    """
+    img = np.asarray(img, dtype=np.int64)
+    x0, x1, ax0, ax1 = _area_coefficients(img.shape[1], width)
+    y0, y1, ay0, ay1 = _area_coefficients(img.shape[0], height)
+    rows = img[:, x0] * ax0[None, :, None] + img[:, x1] * ax1[None, :, None]
+    out = ((rows[y0] >> 4) * ay0[:, None, None] >> 16) + ((rows[y1] >> 4) * ay1[:, None, None] >> 16)
+    return np.clip((out + 2) >> 2, 0, 255).astype(np.uint8)
+
+def _row_norms(a):
+    return np.einsum("ij,ij->i", a, a)
+
+def _sq_distances(a, b, b_norms):
+    # (len(a), len(b)) squared euclidean distances the way sklearn's init computes them
+    distances = -2 * a @ b.T
+    distances += _row_norms(a)[:, None]
+    distances += b_norms[None, :]
+    return np.maximum(distances, 0)
+
+def _init_centers(points, point_norms, k, rng):
+    """Greedy k-means++ seeding, sklearn's _kmeans_plusplus with unit weights"""
+    n = len(points)
+    n_trials = 2 + int(np.log(k))
+    weights = np.ones(n)
+    centers = np.empty((k, 3))
+    centers[0] = points[rng.choice(n, p=weights / weights.sum())]
+    closest = _sq_distances(centers[:1], points, point_norms)[0]
+    potential = closest @ weights
+
+    for c in range(1, k):
+        candidates = np.searchsorted(np.cumsum(weights * closest), rng.uniform(size=n_trials) * potential)
+        np.clip(candidates, None, n - 1, out=candidates)
+        cand_dist = _sq_distances(points[candidates], points, point_norms)
+        np.minimum(closest, cand_dist, out=cand_dist)
+        cand_potential = cand_dist @ weights
+        best = np.argmin(cand_potential)
+        potential = cand_potential[best]
+        closest = cand_dist[best]
+        centers[c] = points[candidates[best]]
+    return centers
+
+def _labels(points, centers):
+    # sklearn leaves ||x||² out, it doesn't change the nearest center
+    return np.argmin(_row_norms(centers)[None, :] - 2 * points @ centers.T, axis=1)
+
+def _lloyd_step(points, centers):
+    """One assignment + update step, returns (labels, new centers, squared center shift)"""
+    k = len(centers)
+    labels = _labels(points, centers)
+    # summed point by point in order, as sklearn's lloyd step does on one thread
+    sums = np.zeros((k, 3))
+    np.add.at(sums, labels, points)
+    totals = np.bincount(labels, minlength=k).astype(np.float64)
+
+    empty = np.flatnonzero(totals == 0)
+    if len(empty):
+        # an empty cluster takes over the points farthest from their centers
+        distances = ((points - centers[labels]) ** 2).sum(axis=1)
+        if distances.max() > 0:
+            far = np.argpartition(distances, -len(empty))[:-len(empty) - 1:-1]
+            for cluster, idx in zip(empty, far):
+                sums[labels[idx]] -= points[idx]
+                sums[cluster] = points[idx]
+                totals[labels[idx]] -= 1
+                totals[cluster] = 1
+
+    # in place and in order: an empty cluster copies the biggest one, averaged or not yet
+    biggest = np.argmax(totals)
+    for j in range(k):
+        if totals[j] > 0:
+            sums[j] *= 1.0 / totals[j]
+        else:
+            sums[j] = sums[biggest]
+    shift = np.sqrt(((sums - centers) ** 2).sum(axis=1))
+    return labels, sums, (shift ** 2).sum()
+
+def extract_palette(pixel_data, k=4, max_iter=MAX_ITER, tol=TOL, seed=SEED):
+    """
+    KMeans(n_clusters=k, random_state=seed).fit(pixel_data) redone in NumPy:
+    the same centering, k-means++ draws from RandomState(seed), Lloyd
+    iterations and stopping rule. Returns (colors, counts) sorted by count,
+    most frequent first, with colors truncated to int like
+    KMeans.cluster_centers_.astype(int).
+    """
+    points = np.asarray(pixel_data, dtype=np.uint8).reshape((-1, 3)).astype(np.float64)
+    mean = points.mean(axis=0)
+    points -= mean
+    tol = np.mean(np.var(points, axis=0)) * tol
+    point_norms = _row_norms(points)
+    centers = _init_centers(points, point_norms, k, np.random.RandomState(seed))
+
+    labels_old = None
+    strict = False
+    for _ in range(max_iter):
+        labels, centers, shift = _lloyd_step(points, centers)
+        if labels_old is not None and np.array_equal(labels, labels_old):
+            strict = True
+            break
+        if shift <= tol:
+            break
+        labels_old = labels
+    if not strict:
+        labels = _labels(points, centers)
+
+    colors = (centers + mean).astype(int)
+    counts = np.bincount(labels)
+    order = np.argsort(counts)[::-1]
+    return colors[order], counts[order]
@@ -0,0 +1,362 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from .metrics import metrics
+
+class CoalescingQueue:
+    """Bounded FIFO that drops its oldest item instead of blocking the producer"""
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._woken = False
+
+    def put(self, item):
+        with self._cond:
+            while len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Next item, or None once closed, after timeout or when woken by wake()"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self._closed or self._woken, timeout)
+            self._woken = False
+            return self._items.popleft() if self._items else None
+
+    def wake(self):
+        """Return a waiting get() without an item, so the consumer can check its other work"""
+        with self._cond:
+            self._woken = True
+            self._cond.notify()
+
+    def clear(self):
+        with self._cond:
+            n = len(self._items)
+            self.dropped += n
+            self._items.clear()
+            return n
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+class RenderPool:
+    """
+    Render workers shared by several pipelines, one per zone, so the image
+    modules and caches are loaded once however many zones there are.
+
+    Every pipeline has a single slot: its newest job replaces one still
+    waiting. Workers take the slots in the order they were filled and never
+    render two jobs of the same pipeline at once.
+    """
+    def __init__(self, workers=1):
+        self.workers = workers
+        self._slots = OrderedDict()   # pipeline -> job, oldest first
+        self._busy = set()            # pipelines with a job being rendered
+        self._cond = threading.Condition()
+        self._threads = []
+        self._closed = False
+        self.rendered = 0
+
+    def _take(self):
+        for pipeline in self._slots:
+            if pipeline not in self._busy:
+                self._busy.add(pipeline)
+                return pipeline, self._slots.pop(pipeline)
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or any(p not in self._busy for p in self._slots))
+                if self._closed:
+                    return
+                pipeline, job = self._take()
+            try:
+                pipeline._render(job)
+            finally:
+                with self._cond:
+                    self._busy.discard(pipeline)
+                    self.rendered += 1
+                    self._cond.notify_all()
+
+    def start(self):
+        if not self._threads:
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"render-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def put(self, pipeline, job):
+        """Queue a job for pipeline, returns True if it replaced one still waiting"""
+        with self._cond:
+            replaced = self._slots.pop(pipeline, None) is not None
+            self._slots[pipeline] = job
+            self._cond.notify()
+            return replaced
+
+    def discard(self, pipeline):
+        """Drop pipeline's waiting job, returns True if there was one"""
+        with self._cond:
+            return self._slots.pop(pipeline, None) is not None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=1)
+
+    def stats(self):
+        with self._cond:
+            return {"workers": self.workers, "queue_depth": len(self._slots), "busy": len(self._busy),
+                    "rendered": self.rendered}
+
+class ArtworkPipeline:
+    """
+    Staged artwork path: the metadata reader submits jobs, a render worker
+    turns them into (frame, rgb), the matrix transport (or a DisplayGroup,
+    with a dict of frames per profile) writes the frame and a lights worker
+    publishes the color.
+
+    Stages are linked by bounded latest-wins queues, so when tracks are
+    skipped quickly only the newest artwork is rendered and sent. Each job is
+    a dict with at least "hash" and "created" (monotonic time the PICT
+    arrived); end-to-end latency is measured from there to the frame being
+    written to the matrix socket.
+
+    snapshot_lights() hands the light snapshot to the lights worker, which
+    takes it before the next color, so a slow or missing broker holds up the
+    lights and not the caller.
+
+    prerender() starts rendering artwork before playback is ready. The result
+    is held back until submit() is called for the same hash and then sent
+    straight away, or dropped if another image arrives first.
+
+    With a renderer (RenderPool) the render stage runs on the pool's shared
+    workers instead of a thread of its own.
+    """
+    def __init__(self, render, matrix, lights=None, latency_budget_ms=500, queue_size=1, renderer=None):
+        self.render = render          # job -> (frame, rgb)
+        self.matrix = matrix          # MatrixTransport or DisplayGroup
+        self.lights = lights          # lightBackends.LightBackend, e.g. ControlLights or a LightGroup
+        self.latency_budget_ms = latency_budget_ms
+        self.renderer = renderer      # RenderPool shared with other pipelines, or None
+
+        self.render_queue = CoalescingQueue(queue_size)
+        self.lights_queue = CoalescingQueue(1)
+        self._current = None          # hash of the newest submitted job
+        self._speculating = None      # hash of the prerender job being rendered
+        self._prerendered = None      # (hash, frame, rgb) waiting for submit()
+        self._send_when_rendered = None   # job submitted while its prerender was still running
+        self._snapshot_due = False    # snapshot_lights() was called, the lights worker hasn't started it yet
+        self._snapshot_done = threading.Event()
+        self._snapshot_done.set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+        self.submitted = 0
+        self.rendered = 0
+        self.superseded = 0           # jobs dropped because a newer one arrived
+        self.render_errors = 0
+        self.over_budget = 0
+        self.prerendered = 0          # speculative renders finished
+        self.prerender_hits = 0       # submits served by a speculative render
+        self.latencies_ms = deque(maxlen=256)
+        self.ready_latencies_ms = deque(maxlen=256)   # submit() to frame on the wire
+        self.on_frame_sent = None     # optional callback(job, latency_ms)
+
+    # ---------- workers ----------
+    def _render_worker(self):
+        while True:
+            job = self.render_queue.get()
+            if job is None:
+                return
+            self._render(job)
+
+    def _render(self, job):
+        speculative = job.get("speculative", False)
+        with self._lock:
+            if job["hash"] != self._current:
+                self.superseded += 1
+                return
+            if speculative:
+                self._speculating = job["hash"]
+        try:
+            frame, rgb = self.render(job)
+        except Exception as e:
+            print(f"failed to render artwork {job['hash']}: {e}")
+            self.render_errors += 1
+            frame = None
+        with self._lock:
+            waiting = None
+            if speculative:
+                self._speculating = None
+                waiting, self._send_when_rendered = self._send_when_rendered, None
+            current = job["hash"] == self._current
+            if speculative and current and frame is not None and waiting is None:
+                self._prerendered = (job["hash"], frame, rgb)
+        if frame is None:
+            return
+        self.rendered += 1
+        # a newer track may have arrived while this one was rendering
+        if not current:
+            self.superseded += 1
+            return
+        if speculative:
+            if waiting is None:
+                self.prerendered += 1
+                return
+            self.prerender_hits += 1
+            job = waiting
+        self._deliver(job, frame, rgb)
+
+    def _queue(self, job):
+        if self.renderer is None:
+            self.render_queue.put(job)
+        elif self.renderer.put(self, job):
+            self.superseded += 1
+
+    def _lights_worker(self):
+        while True:
+            rgb = self.lights_queue.get()
+            with self._lock:
+                snapshot, self._snapshot_due = self._snapshot_due, False
+            if snapshot:
+                # the lights' own state goes first, before this track's color replaces it
+                try:
+                    self.lights.snapshot()
+                except Exception as e:
+                    print(f"failed to snapshot light states: {e}")
+                finally:
+                    self._snapshot_done.set()
+            if rgb is None:
+                if self.lights_queue.closed:
+                    return
+                continue
+            try:
+                self.lights.set_color(rgb)
+            except Exception as e:
+                print(f"failed to publish light color {rgb}: {e}")
+
+    def _deliver(self, job, frame, rgb):
+        self.matrix.send(frame, on_sent=lambda sent_at, job=job: self._frame_sent(job, sent_at))
+        if self.lights is not None:
+            self.lights_queue.put(rgb)
+
+    def _frame_sent(self, job, sent_at):
+        if "submitted_at" in job:
+            self.ready_latencies_ms.append((sent_at - job["submitted_at"]) * 1000)
+        latency_ms = (sent_at - job["created"]) * 1000
+        metrics.observe("pict_to_matrix", latency_ms / 1000)
+        self.latencies_ms.append(latency_ms)
+        if latency_ms > self.latency_budget_ms:
+            self.over_budget += 1
+            print(f"⚠️ artwork {job['hash']} took {latency_ms:.0f} ms from PICT to matrix (budget {self.latency_budget_ms} ms)")
+        if self.on_frame_sent is not None:
+            self.on_frame_sent(job, latency_ms)
+
+    # ---------- public api ----------
+    def start(self):
+        workers = [(self._lights_worker, "lights")]
+        if self.renderer is None:
+            workers.insert(0, (self._render_worker, "render"))
+        for target, name in workers:
+            t = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def submit(self, job):
+        """Queue artwork for rendering and sending, superseding anything still queued"""
+        job.setdefault("created", time.monotonic())
+        job["submitted_at"] = time.monotonic()
+        with self._lock:
+            self._current = job["hash"]
+            self.submitted += 1
+            ready = self._prerendered
+            self._prerendered = None
+            if ready is None or ready[0] != job["hash"]:
+                ready = None
+                if self._speculating == job["hash"]:
+                    # the render worker sends it as soon as the prerender finishes
+                    self._send_when_rendered = job
+                    return
+        if ready is not None:
+            self.prerender_hits += 1
+            self._deliver(job, ready[1], ready[2])
+            return
+        self._queue(job)
+
+    def prerender(self, job):
+        """Render artwork ahead of submit(), the result is kept until then and not sent"""
+        job = {**job, "speculative": True}
+        job.setdefault("created", time.monotonic())
+        with self._lock:
+            self._current = job["hash"]
+            if self._prerendered is not None and self._prerendered[0] != job["hash"]:
+                self._prerendered = None
+        self._queue(job)
+
+    def snapshot_lights(self):
+        """Snapshot the lights on the lights worker, ahead of any color published after this call"""
+        if self.lights is None:
+            return
+        with self._lock:
+            self._snapshot_due = True
+            self._snapshot_done.clear()
+        self.lights_queue.wake()
+
+    def wait_lights_snapshot(self, timeout=None):
+        """Block until the last snapshot_lights() has run, False on timeout"""
+        return self._snapshot_done.wait(timeout)
+
+    def cancel(self):
+        """Drop queued and in-flight work, e.g. on a stream reset"""
+        with self._lock:
+            self._current = None
+            self._prerendered = None
+            self._send_when_rendered = None
+        self.render_queue.clear()
+        if self.renderer is not None and self.renderer.discard(self):
+            self.superseded += 1
+        self.lights_queue.clear()
+
+    def close(self):
+        self.render_queue.close()
+        self.lights_queue.close()
+        for t in self._threads:
+            t.join(timeout=1)
+
+    def stats(self):
+        def pct(values, p):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(len(values) * p))] if values else None
+        return {
+            "submitted": self.submitted,
+            "rendered": self.rendered,
+            "superseded": self.superseded + self.render_queue.dropped,
+            "render_errors": self.render_errors,
+            "lights_coalesced": self.lights_queue.dropped,
+            "over_budget": self.over_budget,
+            "prerendered": self.prerendered,
+            "prerender_hits": self.prerender_hits,
+            "latency_p50_ms": pct(self.latencies_ms, 0.5),
+            "latency_p99_ms": pct(self.latencies_ms, 0.99),
+            "ready_latency_p50_ms": pct(self.ready_latencies_ms, 0.5),
+        }
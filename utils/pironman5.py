@@ -1,30 +1,118 @@
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from .lightBackends import LightBackend
+from .metrics import metrics
 
+DEFAULT_URL = "http://pi5.lan:34001/api/v1.0/"
 
-class Pironman5:
-    def __init__(self, rgb):
+class Pironman5(LightBackend):
+    """
+    The RGB LEDs of a Pironman 5 case, through its dashboard API.
+
+    Requests go over one pooled keep-alive session with a timeout. The LEDs
+    are only enabled when they aren't already, and a color the case already
+    shows isn't sent again.
+    """
+    name = "pironman"
+
+    def __init__(self, rgb=None, url=DEFAULT_URL, timeout=2.0):
         self.rgb=rgb
-        self.pironmanURL="http://pi5.lan:34001/api/v1.0/"
-    
+        self.pironmanURL=url.rstrip("/")
+        self.timeout = timeout
         self.headers={"Content-Type":"application/json"}
+        self._session = None
+        self._lock = threading.Lock()   # one request sequence at a time
+        self._enabled = None            # RGB enable state we last set, None if unknown
+        self._color = None              # hex color we last set
+
+        self.requests = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_latency = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+            self._session.headers.update(self.headers)
+        return self._session
+
     def rgb_to_hex(self, rgb):
         """Takes in a tuple of r, g,b and returns its hex value"""
         try:
             r,g,b=rgb
-            return f'#{r:02x}{g:02x}{b:02x}'
-        except TypeError:
+            return f'#{int(r):02x}{int(g):02x}{int(b):02x}'
+        except (TypeError, ValueError):
             print("invalid color or no color chosen, defaulting to red lights")
             r,g,b=(255,0,0)
             return f'#{r:02x}{g:02x}{b:02x}'
-            
-    def set_rgb_color(self): 
+
+    def _post(self, endpoint, payload):
+        start = time.monotonic()
+        try:
+            res = self.session.post(f"{self.pironmanURL}/{endpoint}", json=payload, timeout=self.timeout)
+            res.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            self.failures += 1
+            # state unknown after a failure, send everything again next time
+            self._enabled = self._color = None
+            print(f"Pironman5 {endpoint} failed: {e}")
+            return False
+        finally:
+            self.requests += 1
+            self.last_latency = time.monotonic() - start
+            metrics.observe("pironman_request", self.last_latency, endpoint=endpoint)
+        return True
+
+    def set_rgb_color(self):
         color = self.rgb_to_hex(self.rgb)
-        res = requests.post(f"{self.pironmanURL}/set-rgb-enable", json={"enable":True}, headers=self.headers)
-        response = requests.post(f"{self.pironmanURL}/set-rgb-color", json={"color":color}, headers=self.headers)
-        print(f"setting rgb color to: {color}")
-        print(f"Pironman5 color change status code: {response.status_code}")
-        print(f"Pironman5 enable rgb status code: {res.status_code}")
-        #print(response.text)
+        with self._lock:
+            if self._enabled and self._color == color:
+                self.skipped += 1
+                return True
+            if not self._enabled:
+                if not self._post("set-rgb-enable", {"enable": True}):
+                    return False
+                self._enabled = True
+            print(f"setting rgb color to: {color}")
+            if not self._post("set-rgb-color", {"color": color}):
+                return False
+            self._color = color
+            return True
+
     def disable_rgb(self):
-        url=f"{self.pironmanURL}/set-rgb-enable"
-        res = requests.post(url, json={"enable":False})
+        with self._lock:
+            if self._enabled is False:
+                return True
+            if not self._post("set-rgb-enable", {"enable": False}):
+                return False
+            self._enabled = False
+            return True
+
+    # ---------- LightBackend ----------
+    def set_color(self, rgb):
+        self.rgb = rgb
+        return self.set_rgb_color()
+
+    def restore(self):
+        # the dashboard has no way to read the state back, so only undo what we turned on
+        if self._enabled:
+            self.disable_rgb()
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "skipped_unchanged": self.skipped,
+            "last_latency_ms": None if self.last_latency is None else self.last_latency * 1000,
+        }
@@ -0,0 +1,171 @@
+import os
+import threading
+from collections import OrderedDict
+
+class RenderCache:
+    """
+    LRU cache of rendered artwork, keyed by the caller from the md5 of the raw
+    image bytes and whatever else changes the render.
+
+    Each entry holds the finished matrix frame bytes and the light RGB chosen
+    for it. The memory tier is bounded by max_bytes; when cache_dir is set,
+    entries are also written there so they survive restarts. With
+    max_disk_bytes the directory is bounded too: when the cache opens and
+    whenever it writes an entry, the least recently used files go first
+    (file mtimes carry the order across restarts).
+    """
+    FILE_SUFFIX = ".frame"
+
+    def __init__(self, max_bytes=1024 * 1024, cache_dir=None, max_disk_bytes=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()   # key -> (frame, rgb)
+        self._size = 0
+        self._disk = OrderedDict()      # key -> file size, least recently used first; only kept with max_disk_bytes
+        self._disk_size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            if max_disk_bytes is not None:
+                self._scan_disk()
+
+    # ---------- helpers ----------
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.FILE_SUFFIX}")
+
+    def _store(self, key, frame, rgb):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old[0])
+        self._entries[key] = (frame, rgb)
+        self._size += len(frame)
+        # evict least recently used, always keep the newest entry
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _scan_disk(self):
+        """Index the files already in cache_dir, oldest first, and trim them to max_disk_bytes"""
+        files = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(self.FILE_SUFFIX) and entry.is_file():
+                    st = entry.stat()
+                    files.append((st.st_mtime, entry.name[:-len(self.FILE_SUFFIX)], st.st_size))
+        for _, key, size in sorted(files):
+            self._disk[key] = size
+            self._disk_size += size
+        self._evict_disk()
+
+    def _track_disk(self, key, size=None):
+        """Mark key's file as just used, size is given when it was just written; caller holds the lock"""
+        if self.max_disk_bytes is None:
+            return
+        if size is None:
+            try:
+                # warm-cache.py or another process may have written it after the scan
+                os.utime(self._path(key))
+                size = self._disk.get(key) or os.path.getsize(self._path(key))
+            except OSError:
+                return
+        self._disk_size += size - self._disk.pop(key, 0)
+        self._disk[key] = size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        # always keep the newest entry
+        while self._disk_size > self.max_disk_bytes and len(self._disk) > 1:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self.disk_evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+        # first 3 bytes are the light color, the rest is the frame
+        if len(blob) < 3:
+            return None
+        return blob[3:], tuple(blob[:3])
+
+    def _write_disk(self, key, frame, rgb):
+        path = self._path(key)
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(bytes(int(c) & 0xFF for c in rgb))
+                f.write(frame)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"could not write render cache entry {key}: {e}")
+            return
+        with self._lock:
+            self._track_disk(key, 3 + len(frame))
+
+    # ---------- public api ----------
+    def __contains__(self, key):
+        if key is None:
+            return False
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self.cache_dir) and os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Returns (frame, rgb) for key or None, counting the hit or miss"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, *entry)
+            self._track_disk(key)
+        return entry
+
+    def put(self, key, frame, rgb):
+        if key is None:
+            return
+        frame = bytes(frame)
+        rgb = tuple(int(c) for c in rgb)
+        with self._lock:
+            self._store(key, frame, rgb)
+        if self.cache_dir:
+            self._write_disk(key, frame, rgb)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "disk_bytes": self._disk_size,
+                "disk_evictions": self.disk_evictions,
+            }
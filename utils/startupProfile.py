@@ -0,0 +1,72 @@
+import builtins
+import sys
+import threading
+import time
+
+class StartupProfile:
+    """
+    Records how long each module takes to import and when startup milestones
+    (pipe open, MQTT connected, first frame on the wire...) are reached.
+
+    install() wraps builtins.__import__, so it should run before the imports
+    it is meant to measure. Import times are inclusive of nested imports.
+    Disabled profiles do nothing.
+    """
+    def __init__(self, enabled=False, t0=None):
+        self.enabled = enabled
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.imports = []      # (module, seconds, thread name)
+        self.milestones = []   # (label, seconds since t0)
+        self._seen = set()
+        self._reported = False
+        self._original_import = None
+        self._lock = threading.Lock()
+
+    def install(self):
+        if not self.enabled or self._original_import is not None:
+            return self
+        original = self._original_import = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            start = time.perf_counter()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                with self._lock:
+                    self.imports.append((name, time.perf_counter() - start, threading.current_thread().name))
+
+        builtins.__import__ = timed_import
+        return self
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def mark(self, label):
+        """Record the first time a milestone is reached, later marks are ignored"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if label not in self._seen:
+                self._seen.add(label)
+                self.milestones.append((label, time.perf_counter() - self.t0))
+
+    def report(self, top=15, file=None):
+        """Print the slowest imports and the milestones, once"""
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        file = file or sys.stdout
+        with self._lock:
+            imports = sorted(self.imports, key=lambda i: i[1], reverse=True)[:top]
+            milestones = list(self.milestones)
+        print("⏱️ startup profile — slowest imports (inclusive):", file=file)
+        for name, secs, thread in imports:
+            print(f"  {secs * 1000:9.1f} ms  {name}  [{thread}]", file=file)
+        print("⏱️ startup milestones (since process start):", file=file)
+        for label, secs in milestones:
+            print(f"  {secs * 1000:9.1f} ms  {label}", file=file)
+        file.flush()
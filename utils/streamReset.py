@@ -0,0 +1,124 @@
+import threading
+import time
+from .metrics import metrics
+
+class StreamReset:
+    """
+    Runs the side effects of a stream reset (pend/pfls) off the metadata
+    reader: restoring the lights, clearing the matrix, cleaning up files.
+
+    schedule() hands over a list of (name, fn) steps, which start after a
+    short grace period so the common pfls -> prsm of a skip or seek never
+    touches the lights or the display. cancel() drops a reset whose steps
+    haven't all started, e.g. because playback resumed. Each step gets
+    step_timeout seconds; after that the worker stops waiting for it and
+    moves on. A newer schedule() replaces an older one still waiting.
+    """
+    def __init__(self, grace=0.5, step_timeout=3.0):
+        self.grace = grace
+        self.step_timeout = step_timeout
+        self._job = None          # (steps, due) of the reset waiting or running
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+        self.scheduled = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.step_timeouts = 0
+        self.step_errors = 0
+        self.last_duration = None
+
+    # ---------- worker ----------
+    def _run_step(self, name, fn):
+        def step():
+            try:
+                fn()
+            except Exception as e:
+                print(f"stream reset step {name} failed: {e}")
+                with self._cond:
+                    self.step_errors += 1
+
+        t = threading.Thread(target=step, name=f"reset-{name}", daemon=True)
+        t.start()
+        t.join(self.step_timeout)
+        if t.is_alive():
+            print(f"stream reset step {name} still running after {self.step_timeout:.1f}s, moving on")
+            with self._cond:
+                self.step_timeouts += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._job is not None or self._closed)
+                if self._closed:
+                    return
+                job = self._job
+                steps, due = job
+                # grace period, cancel() or a newer reset wakes us up
+                while not self._closed and self._job is job and time.monotonic() < due:
+                    self._cond.wait(due - time.monotonic())
+                if self._closed:
+                    return
+                if self._job is not job:
+                    continue
+
+            start = time.monotonic()
+            for name, fn in steps:
+                with self._cond:
+                    if self._job is not job:
+                        break
+                self._run_step(name, fn)
+            else:
+                with self._cond:
+                    if self._job is job:
+                        self._job = None
+                        self.completed += 1
+                        self.last_duration = time.monotonic() - start
+                metrics.observe("stream_reset", time.monotonic() - start)
+
+    # ---------- public api ----------
+    def schedule(self, steps):
+        with self._cond:
+            if self._job is not None:
+                self.cancelled += 1
+            self._job = (list(steps), time.monotonic() + self.grace)
+            self.scheduled += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stream-reset", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def cancel(self):
+        """Drop the pending reset, returns True if there was one"""
+        with self._cond:
+            if self._job is None:
+                return False
+            self._job = None
+            self.cancelled += 1
+            self._cond.notify_all()
+            return True
+
+    @property
+    def pending(self):
+        with self._cond:
+            return self._job is not None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=self.step_timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "scheduled": self.scheduled,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "step_timeouts": self.step_timeouts,
+                "step_errors": self.step_errors,
+                "pending": self._job is not None,
+                "last_duration_ms": None if self.last_duration is None else self.last_duration * 1000,
+            }
@@ -0,0 +1,94 @@
+from .outputProfiles import CHANNELS
+
+CUT = "cut"
+CROSSFADE = "crossfade"
+WIPE = "wipe"
+TRANSITIONS = (CUT, CROSSFADE, WIPE)
+
+class FrameSequence:
+    """
+    The frames of one transition between two cached frames of a profile.
+
+    frame(i) builds frame i of 1..len(self), the last one being the new frame
+    itself. Frames are built when they're asked for, so ones the sender skips
+    cost nothing. A crossfade blends the channels where they sit in the
+    packed pixel words, with integer weights out of 256; a wipe brings the
+    new frame in column by column from the left.
+    """
+    def __init__(self, kind, previous, frame, profile, steps):
+        # only loaded once a transition actually plays, not when the tables are read at startup
+        import numpy as np
+        self.kind = kind
+        self.target = bytes(frame)
+        self.steps = steps
+        self.profile = profile
+        dtype = profile.word_dtype
+        old = np.frombuffer(previous, dtype=dtype)
+        new = np.frombuffer(frame, dtype=dtype)
+        if kind == CROSSFADE:
+            old = old.astype(np.int32)
+            new = new.astype(np.int32)
+            # per channel: old value << 8 and the step towards the new one, blended as base + delta * weight
+            self._channels = []
+            for shift, mask in CHANNELS[profile.pixel_format]:
+                a = (old >> shift) & mask
+                self._channels.append((shift, a << 8, ((new >> shift) & mask) - a))
+            self._acc = np.empty(len(old), dtype=np.int32)
+            self._tmp = np.empty(len(old), dtype=np.int32)
+        else:
+            self._old = old.reshape(profile.height, profile.width)
+            self._new = new.reshape(profile.height, profile.width)
+
+    def __len__(self):
+        return self.steps
+
+    def frame(self, i):
+        if i >= self.steps:
+            return self.target
+        if self.kind == WIPE:
+            columns = self.profile.width * i // self.steps
+            out = self._old.copy()
+            out[:, :columns] = self._new[:, :columns]
+            return out.tobytes()
+
+        import numpy as np
+        weight = 256 * i // self.steps
+        acc, tmp = self._acc, self._tmp
+        acc.fill(0)
+        for shift, base, delta in self._channels:
+            np.multiply(delta, weight, out=tmp)
+            tmp += base
+            tmp >>= 8
+            tmp <<= shift
+            acc |= tmp
+        return acc.astype(self.profile.word_dtype).tobytes()
+
+class Transition:
+    """
+    How a display goes from one frame to the next: a cut, a crossfade or a
+    wipe lasting duration seconds, streamed at fps frames per second.
+    """
+    def __init__(self, kind=CROSSFADE, duration=0.5, fps=30):
+        if kind not in TRANSITIONS:
+            raise ValueError(f"Unknown transition: {kind}")
+        if fps <= 0 or duration < 0:
+            raise ValueError("transition fps must be positive and duration not negative")
+        self.kind = kind
+        self.duration = duration
+        self.fps = fps
+
+    def __repr__(self):
+        return f"Transition({self.kind!r}, {self.duration}s, {self.fps} fps)"
+
+    @property
+    def steps(self):
+        """Frames in a transition, the new frame included"""
+        return max(1, round(self.duration * self.fps))
+
+    def sequence(self, previous, frame, profile):
+        """FrameSequence from previous to frame, None when it's a plain cut"""
+        if self.kind == CUT or self.steps == 1 or previous is None:
+            return None
+        if len(previous) != len(frame) or previous == frame:
+            return None
+        return FrameSequence(self.kind, previous, frame, profile, self.steps)
@@ -0,0 +1,72 @@
+import json
+
+class Zone:
+    """
+    One AirPlay zone: a shairport-sync metadata pipe with its own displays,
+    light group, pipeline and reset worker, and the playback state that goes
+    with them. Render workers and the render cache are shared by all zones.
+    """
+    def __init__(self, name, pipe, matrix, lights, pipeline, resets):
+        self.name = name
+        self.pipe = pipe
+        self.matrix = matrix        # DisplayGroup
+        self.lights = lights        # LightGroup: ControlLights for this zone's topics, optionally a Pironman5
+        self.pipeline = pipeline    # ArtworkPipeline
+        self.resets = resets        # StreamReset
+        self.track_state = None
+        self.have_snapshot = False
+        self.reset_pending = False  # a reset was scheduled since playback last started, only the reader touches either
+
+    def __repr__(self):
+        return f"Zone({self.name!r}, {self.pipe!r})"
+
+    def close(self):
+        self.resets.close()
+        self.pipeline.close()
+        self.matrix.close()
+        self.lights.close()
+
+    def stats(self):
+        return {
+            "pipeline": self.pipeline.stats(),
+            "displays": self.matrix.stats(),
+            "lights": self.lights.stats(),
+            "stream_reset": self.resets.stats(),
+        }
+
+def light_topic(light):
+    """"Desk" -> "zigbee2mqtt/Desk/set", full topics are kept as they are"""
+    return light if "/" in light else f"zigbee2mqtt/{light}/set"
+
+def parse_zones(config):
+    """
+    Check a zones config, a list of
+    {"name": ..., "pipe": ..., "displays": ["[NAME=]HOST[:PORT][/PROFILE]", ...], "lights": ["Desk", ...],
+     "pironman": "http://pi5.lan:34001/api/v1.0/"}.
+    displays and lights are optional (the defaults are used), as is pironman.
+    Returns the entries with light names turned into /set topics.
+    """
+    if not isinstance(config, list) or not config:
+        raise ValueError("zones config must be a non-empty list")
+    zones, names, pipes = [], set(), set()
+    for entry in config:
+        if not isinstance(entry, dict) or not entry.get("name") or not entry.get("pipe"):
+            raise ValueError(f"zone needs a name and a pipe: {entry!r}")
+        if entry["name"] in names:
+            raise ValueError(f"zone names must be unique: {entry['name']!r}")
+        if entry["pipe"] in pipes:
+            raise ValueError(f"zones can't share a pipe: {entry['pipe']!r}")
+        names.add(entry["name"])
+        pipes.add(entry["pipe"])
+        zones.append({
+            "name": entry["name"],
+            "pipe": entry["pipe"],
+            "displays": list(entry.get("displays") or []),
+            "lights": [light_topic(light) for light in entry.get("lights") or []],
+            "pironman": entry.get("pironman"),
+        })
+    return zones
+
+def load_zones(path):
+    with open(path) as f:
+        return parse_zones(json.load(f))
@@ -0,0 +1,176 @@
+"""
+Render artwork ahead of time into the render cache, so albums don't play cold.
+
+    python warm-cache.py SOURCE [SOURCE ...] --cache-dir DIR [--profile NAME ...] [--workers N]
+
+SOURCE is a cover image or a directory, walked for .jpg/.jpeg/.png covers
+and, when mutagen is installed, art embedded in audio files. Each distinct
+artwork is rendered by shairport-metadata.py's own render_artwork in a pool
+of processes, one per core by default, and written to DIR under the key the
+main loop derives from the md5 of the PICT bytes and its render settings
+(dither mode, enhance steps, gamma), so entries made with other settings are
+never served. Artwork already in DIR is skipped, so running it again after
+adding albums only renders the new ones. Start the main script with
+--render-cache-dir DIR to use the entries. DIR is trimmed to the main
+script's RENDER_CACHE_DISK_MAX_BYTES afterwards, least recently used first.
+
+A cover only hits when AirPlay sends the very same bytes as the file, e.g. a
+library player sending the embedded art as it is.
+"""
+import argparse
+import hashlib
+import importlib.util
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from utils.outputProfiles import PROFILES, get_profile
+from utils.renderCache import RenderCache
+try:
+    import mutagen
+except ImportError:
+    # only needed for art embedded in audio files
+    mutagen = None
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shairport-metadata.py")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".m4b", ".mp4", ".aac", ".flac", ".ogg", ".opus")
+# ID3 picture type of the front cover
+FRONT_COVER = 3
+
+def load_main():
+    """shairport-metadata.py as a module, for its render settings and render_artwork"""
+    spec = importlib.util.spec_from_file_location("shairport_metadata", MAIN_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def find_sources(paths):
+    """Image and audio files under paths, in a stable order"""
+    extensions = IMAGE_EXTENSIONS + AUDIO_EXTENSIONS
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    yield os.path.join(root, name)
+
+def embedded_art(path):
+    """Raw bytes of the front cover (or first picture) embedded in an audio file, None if it has none"""
+    audio = mutagen.File(path)
+    if audio is None:
+        return None
+    pictures = list(getattr(audio, "pictures", None) or [])    # FLAC
+    tags = audio.tags
+    if tags is not None and hasattr(tags, "getall"):
+        pictures += tags.getall("APIC")                         # ID3
+    if pictures:
+        front = [p for p in pictures if getattr(p, "type", None) == FRONT_COVER]
+        return bytes((front or pictures)[0].data)
+    if tags is not None and "covr" in tags:                     # MP4
+        return bytes(tags["covr"][0])
+    return None
+
+def read_artwork(path):
+    if path.lower().endswith(IMAGE_EXTENSIONS):
+        with open(path, "rb") as f:
+            return f.read()
+    return embedded_art(path)
+
+# ---------- pool workers ----------
+_main = None
+
+def init_worker():
+    global _main
+    # render_artwork prints its palette choices, keep them out of the report
+    sys.stdout = open(os.devnull, "w")
+    _main = load_main()
+
+def hash_source(path):
+    """(path, md5 of its artwork or None, error or None)"""
+    try:
+        data = read_artwork(path)
+    except Exception as e:
+        return path, None, str(e)
+    return path, hashlib.md5(data).hexdigest() if data else None, None
+
+def render_source(path, md5, profile_names, cache_dir):
+    """Render one artwork for each profile into the disk cache, returns the seconds it took"""
+    start = time.perf_counter()
+    data = read_artwork(path)
+    cache = RenderCache(cache_dir=cache_dir)
+    for name in profile_names:
+        profile = get_profile(name)
+        frame, rgb = _main.render_artwork(data, profile)
+        cache.put(_main.cache_key(md5, profile), frame, rgb)
+    return time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", metavar="SOURCE", help="cover image, or directory of covers / music")
+    parser.add_argument("--cache-dir", required=True, help="render cache directory, the main script's RENDER_CACHE_DIR")
+    parser.add_argument("--profile", action="append", choices=sorted(PROFILES),
+                        help="output profile to render, repeat for several (default: the main script's)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    main_script = load_main()
+    profiles = [get_profile(name) for name in args.profile or [main_script.OUTPUT_PROFILE]]
+    cache = RenderCache(cache_dir=args.cache_dir)
+    paths = list(find_sources(args.sources))
+    if mutagen is None:
+        audio = [path for path in paths if path.lower().endswith(AUDIO_EXTENSIONS)]
+        if audio:
+            print(f"mutagen is not installed, skipping the art embedded in {len(audio)} audio files")
+            paths = [path for path in paths if not path.lower().endswith(AUDIO_EXTENSIONS)]
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+        # one render per distinct artwork, an album's tracks usually share theirs
+        todo, seen, no_art, failed, cached = {}, set(), 0, 0, 0
+        for path, md5, error in pool.map(hash_source, paths, chunksize=16):
+            if error:
+                print(f"could not read {path}: {error}")
+                failed += 1
+            elif md5 is None:
+                no_art += 1
+            elif md5 not in seen:
+                seen.add(md5)
+                missing = [p.name for p in profiles if main_script.cache_key(md5, p) not in cache]
+                if missing:
+                    todo[md5] = (path, missing)
+                else:
+                    cached += 1
+        print(f"{len(paths)} files: {len(seen)} distinct artworks, {cached} already cached, "
+              f"{no_art} without artwork")
+
+        start = time.perf_counter()
+        futures = {pool.submit(render_source, path, md5, missing, args.cache_dir): path
+                   for md5, (path, missing) in todo.items()}
+        rendered, busy = 0, 0.0
+        for future in as_completed(futures):
+            try:
+                busy += future.result()
+                rendered += 1
+            except Exception as e:
+                print(f"could not render {futures[future]}: {e}")
+                failed += 1
+        elapsed = time.perf_counter() - start
+
+    if rendered:
+        print(f"rendered {rendered} artworks for {', '.join(p.name for p in profiles)} in {elapsed:.1f}s "
+              f"with {args.workers} processes: {rendered / elapsed:.1f} images/s "
+              f"({busy / rendered * 1000:.0f} ms per image per process)")
+    # what the main script would do when it opens the cache
+    trimmed = RenderCache(cache_dir=args.cache_dir, max_disk_bytes=main_script.RENDER_CACHE_DISK_MAX_BYTES).stats()
+    if trimmed["disk_evictions"]:
+        print(f"{trimmed['disk_evictions']} entries evicted to stay under "
+              f"{main_script.RENDER_CACHE_DISK_MAX_BYTES / 2**20:.0f} MB, raise RENDER_CACHE_DISK_MAX_BYTES to keep them")
+    if failed:
+        print(f"{failed} files failed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()